@@ -0,0 +1,97 @@
+"""
+Benchmarks how long the main entry points of mig_meow take to import, and
+checks that none of them import the heavy dependencies only needed by the
+notebook widgets, SSH workers or MiG connections. Each import is timed in a
+fresh interpreter, taking the best of several runs. Exits with a non-zero
+status if a heavy dependency is imported, or if an optional time budget is
+exceeded, so that import time regressions can be caught.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_import_time.py [repeats] [budget_ms]
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+ENTRY_POINTS = [
+    'mig_meow',
+    'mig_meow.meow',
+    'mig_meow.localrunner',
+    'mig_meow.asyncrunner'
+]
+
+HEAVY_MODULES = [
+    'bqplot',
+    'ipywidgets',
+    'graphviz',
+    'IPython',
+    'paramiko',
+    'cryptography',
+    'pkg_resources',
+    'nbformat',
+    'requests'
+]
+
+IMPORT_SCRIPT = """
+import sys
+import time
+start = time.perf_counter()
+%s
+duration = time.perf_counter() - start
+heavy = [m for m in %r if m in sys.modules]
+print(duration)
+print(','.join(heavy))
+"""
+
+
+def time_import(statement):
+    result = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT % (statement, HEAVY_MODULES)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    duration, heavy = result.stdout.split('\n')[:2]
+    return float(duration), [module for module in heavy.split(',') if module]
+
+
+def main(repeats=5, budget_ms=0):
+    print('%-24s %12s  %s' % ('module', 'import (ms)', 'heavy dependencies'))
+    failed = False
+    for module_name in ENTRY_POINTS:
+        durations = []
+        heavy = []
+        for _ in range(repeats):
+            duration, heavy = time_import('import %s' % module_name)
+            durations.append(duration)
+        best = min(durations) * 1000
+        print('%-24s %12.1f  %s' % (
+            module_name,
+            best,
+            ', '.join(heavy) if heavy else '-'
+        ))
+        if heavy or (budget_ms and best > budget_ms):
+            failed = True
+
+    # Using a widget should still import what it needs
+    duration, heavy = \
+        time_import('import mig_meow\nmig_meow.WorkflowWidget')
+    print('%-24s %12.1f  %s' % (
+        'mig_meow.WorkflowWidget',
+        duration * 1000,
+        ', '.join(heavy)
+    ))
+
+    if failed:
+        print('Import time regression found. ')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    arguments = [int(arg) for arg in sys.argv[1:3]]
+    main(*arguments)
@@ -0,0 +1,88 @@
+"""
+Benchmarks the throughput of the channels used between runner processes,
+comparing multiprocessing Pipes against shared memory ring buffers for each
+of the message types most often sent between them. Messages are sent from a
+separate producer process, and the time until the consumer has received all
+of them is measured.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_ipc.py [message_count] [capacity]
+"""
+
+import os
+import sys
+import time
+
+from multiprocessing import Pipe, Process
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mig_meow.constants import JOB_TRANSITION, RUNNING, DONE
+from mig_meow.ringbuffer import RingPipe, wait, DEFAULT_RING_CAPACITY
+
+MESSAGES = {
+    'log record': (
+        'run_handler',
+        'Starting new job for 2jV7e8h53tw8Vz7, using rule 8kXdV4a9BqLc2wA'
+    ),
+    'transition': (JOB_TRANSITION, '2jV7e8h53tw8Vz7KcN2a', RUNNING),
+    'event': (
+        'modified',
+        'initial_data/subdirectory/data_0001.npy',
+        ['8kXdV4a9BqLc2wA', 'Qz3mP0sY7nR1tUe']
+    ),
+    'job id': '2jV7e8h53tw8Vz7KcN2a'
+}
+
+
+def produce(writer, message, message_count):
+    for _ in range(message_count):
+        writer.send(message)
+    writer.send(DONE)
+
+
+def time_channel(reader, writer, message, message_count):
+    producer = Process(target=produce, args=(writer, message, message_count))
+    start = time.perf_counter()
+    producer.start()
+    received = 0
+    while True:
+        wait([reader])
+        if reader.recv() == DONE:
+            break
+        received += 1
+    duration = time.perf_counter() - start
+    producer.join()
+    assert received == message_count
+    return duration
+
+
+def main(message_count=200000, capacity=DEFAULT_RING_CAPACITY):
+    print('Messages: %d, ring capacity: %d bytes'
+          % (message_count, capacity))
+    print('%-12s %16s %16s' % ('', 'pipe (msg/s)', 'ring (msg/s)'))
+    for name, message in MESSAGES.items():
+        reader, writer = Pipe(duplex=False)
+        pipe_duration = time_channel(reader, writer, message, message_count)
+        reader.close()
+        writer.close()
+
+        reader, writer = RingPipe(capacity)
+        try:
+            ring_duration = \
+                time_channel(reader, writer, message, message_count)
+        finally:
+            reader.ring.close()
+            reader.ring.unlink()
+
+        print('%-12s %16.0f %16.0f' % (
+            name,
+            message_count / pipe_duration,
+            message_count / ring_duration
+        ))
+
+
+if __name__ == '__main__':
+    arguments = [int(arg) for arg in sys.argv[1:3]]
+    main(*arguments)
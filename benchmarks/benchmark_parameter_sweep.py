@@ -0,0 +1,67 @@
+"""
+Benchmarks generating the values of a parameter sweep against the number of
+values in it, comparing the old accumulating loop against ParameterSweep
+with both of its backends. Also reports how many of the old loop's sweeps
+miss their stop value due to float error.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_parameter_sweep.py [max_points] [repeats]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mig_meow.meow import ParameterSweep, parameter_sweep_entry
+
+
+def accumulate(start, stop, increment):
+    # The previous implementation, kept here for comparison
+    values = []
+    value = start
+    while value <= stop:
+        values.append(value)
+        value += increment
+    return values
+
+
+def best_time(function, repeats):
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main(max_points=1000000, repeats=3):
+    print('%-10s %14s %14s %14s' % (
+        'points', 'loop (s)', 'python (s)', 'numpy (s)'))
+    points = 1000
+    while points <= max_points:
+        increment = 1.0 / points
+        sweep = ParameterSweep(
+            parameter_sweep_entry('sweep', 0.0, 1.0, increment))
+        print('%-10d %14.4f %14.4f %14.4f' % (
+            points,
+            best_time(lambda: accumulate(0.0, 1.0, increment), repeats),
+            best_time(lambda: sweep.values(), repeats),
+            best_time(lambda: sweep.values(backend='numpy'), repeats)
+        ))
+        points *= 10
+
+    missed = 0
+    for points in range(1, 1001):
+        stop = points / 10
+        values = accumulate(0.0, stop, 0.1)
+        if values[-1] != stop:
+            missed += 1
+    print('Loop missed the stop of %d of 1000 sweeps' % missed)
+
+
+if __name__ == '__main__':
+    arguments = [int(arg) for arg in sys.argv[1:3]]
+    main(*arguments)
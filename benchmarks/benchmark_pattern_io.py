@@ -0,0 +1,112 @@
+"""
+Micro-benchmarks pattern and recipe load/store throughput, along with the
+validation done on each. Each operation is repeated many times over the
+example patterns and recipes, and reported as operations per second.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_pattern_io.py [repeats]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mig_meow.constants import PATTERNS, RECIPES
+from mig_meow.fileio import read_dir, read_dir_pattern, read_dir_recipe, \
+    write_dir_pattern, write_dir_recipe, rmtree
+from mig_meow.meow import is_valid_pattern_object
+from mig_meow.validation import is_valid_recipe_dict, valid_pattern_name, \
+    valid_dir_path
+
+BENCHMARK_DIR = 'benchmark_pattern_io_directory'
+
+
+def throughput(operation, items, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for item in items:
+            operation(item)
+    return repeats * len(items) / (time.perf_counter() - start)
+
+
+def main(repeats=200):
+    data = read_dir(directory='examples/meow_directory')
+    patterns = list(data[PATTERNS].values())
+    recipes = list(data[RECIPES].values())
+
+    operations = [
+        (
+            'valid_pattern_name',
+            lambda pattern: valid_pattern_name(pattern.name),
+            patterns
+        ),
+        (
+            'valid_dir_path',
+            lambda pattern: valid_dir_path(
+                os.path.join(BENCHMARK_DIR, PATTERNS, pattern.name), 'path'),
+            patterns
+        ),
+        (
+            'pattern integrity',
+            lambda pattern: is_valid_pattern_object(pattern, integrity=True),
+            patterns
+        ),
+        (
+            'is_valid_recipe_dict',
+            is_valid_recipe_dict,
+            recipes
+        ),
+        (
+            'write_dir_pattern',
+            lambda pattern: write_dir_pattern(
+                pattern, directory=BENCHMARK_DIR),
+            patterns
+        ),
+        (
+            'write_dir_pattern trusted',
+            lambda pattern: write_dir_pattern(
+                pattern, directory=BENCHMARK_DIR, trusted=True),
+            patterns
+        ),
+        (
+            'read_dir_pattern',
+            lambda pattern: read_dir_pattern(
+                pattern.name, directory=BENCHMARK_DIR),
+            patterns
+        ),
+        (
+            'write_dir_recipe',
+            lambda recipe: write_dir_recipe(
+                recipe, directory=BENCHMARK_DIR),
+            recipes
+        ),
+        (
+            'write_dir_recipe trusted',
+            lambda recipe: write_dir_recipe(
+                recipe, directory=BENCHMARK_DIR, trusted=True),
+            recipes
+        ),
+        (
+            'read_dir_recipe',
+            lambda recipe: read_dir_recipe(
+                recipe['name'], directory=BENCHMARK_DIR),
+            recipes
+        )
+    ]
+
+    print('%-28s %14s' % ('operation', 'ops/s'))
+    try:
+        for name, operation, items in operations:
+            print('%-28s %14.0f' % (
+                name, throughput(operation, items, repeats)))
+    finally:
+        if os.path.exists(BENCHMARK_DIR):
+            rmtree(BENCHMARK_DIR)
+
+
+if __name__ == '__main__':
+    arguments = [int(arg) for arg in sys.argv[1:2]]
+    main(*arguments)
@@ -0,0 +1,73 @@
+"""
+Benchmarks reading a meow directory of many patterns and recipes, comparing
+a serial read, a parallel read and a re-read of the unchanged directory
+through a LoadCache. The directory is filled with copies of the example
+patterns and recipes.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_read_dir.py [copies] [workers]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mig_meow.constants import PATTERNS, RECIPES, NAME
+from mig_meow.fileio import read_dir, load_dir, write_dir_pattern, \
+    write_dir_recipe, rmtree, LoadCache, LOAD_WORKERS
+from mig_meow.meow import Pattern
+
+BENCHMARK_DIR = 'benchmark_read_dir_directory'
+
+
+def fill_directory(copies):
+    data = read_dir(directory='examples/meow_directory')
+    for index in range(copies):
+        for pattern in data[PATTERNS].values():
+            copied = Pattern(pattern.name)
+            copied.add_single_input(
+                pattern.trigger_file, pattern.trigger_paths[0])
+            for recipe in pattern.recipes:
+                copied.add_recipe(recipe)
+            copied.name = '%s_%d' % (pattern.name, index)
+            write_dir_pattern(copied, directory=BENCHMARK_DIR)
+        for recipe in data[RECIPES].values():
+            copied = dict(recipe)
+            copied[NAME] = '%s_%d' % (recipe[NAME], index)
+            write_dir_recipe(copied, directory=BENCHMARK_DIR)
+
+
+def time_load(**kwargs):
+    start = time.perf_counter()
+    result = load_dir(directory=BENCHMARK_DIR, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main(copies=500, workers=LOAD_WORKERS):
+    try:
+        fill_directory(copies)
+
+        serial, result = time_load(workers=1)
+        files = len(result[PATTERNS]) + len(result[RECIPES])
+        parallel, _ = time_load(workers=workers)
+        cache = LoadCache()
+        first, _ = time_load(workers=workers, cache=cache)
+        cached, _ = time_load(workers=workers, cache=cache)
+
+        print('%d files' % files)
+        print('%-24s %10s' % ('read', 'time (s)'))
+        print('%-24s %10.3f' % ('serial', serial))
+        print('%-24s %10.3f' % ('parallel (%d)' % workers, parallel))
+        print('%-24s %10.3f' % ('first cached read', first))
+        print('%-24s %10.3f' % ('unchanged re-read', cached))
+    finally:
+        if os.path.exists(BENCHMARK_DIR):
+            rmtree(BENCHMARK_DIR)
+
+
+if __name__ == '__main__':
+    arguments = [int(arg) for arg in sys.argv[1:3]]
+    main(*arguments)
@@ -0,0 +1,69 @@
+"""
+Benchmarks removing a directory tree shaped like a runner's job directory,
+comparing shutil.rmtree against fileio.rmtree, both serially and across a
+pool of threads, and against fileio.rmtree in the background. For the
+background case only the time until the function returns is measured.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_rmtree.py [job_count] [files_per_job]
+"""
+
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mig_meow.fileio import make_dir, rmtree, RMTREE_WORKERS
+
+BENCHMARK_DIR = 'benchmark_rmtree_directory'
+
+
+def make_tree(root, job_count, files_per_job):
+    make_dir(root)
+    for job_index in range(job_count):
+        job_dir = os.path.join(root, '%016d' % job_index)
+        os.mkdir(job_dir)
+        for file_index in range(files_per_job):
+            path = os.path.join(job_dir, 'file_%d.txt' % file_index)
+            with open(path, 'w') as job_file:
+                job_file.write('data')
+
+
+def time_removal(remove, job_count, files_per_job):
+    root = os.path.join(BENCHMARK_DIR, 'tree')
+    make_tree(root, job_count, files_per_job)
+    start = time.perf_counter()
+    result = remove(root)
+    duration = time.perf_counter() - start
+    # Background removal must finish before the next tree is built
+    if result is not None:
+        result.join()
+    return duration
+
+
+def main(job_count=5000, files_per_job=5):
+    make_dir(BENCHMARK_DIR)
+    cases = [
+        ('shutil.rmtree', shutil.rmtree),
+        ('fileio.rmtree, 1 worker', lambda path: rmtree(path, workers=1)),
+        ('fileio.rmtree, default (%d)' % RMTREE_WORKERS, rmtree),
+        ('fileio.rmtree, 8 workers', lambda path: rmtree(path, workers=8)),
+        ('fileio.rmtree, background',
+         lambda path: rmtree(path, background=True))
+    ]
+    try:
+        print('Jobs: %d, files per job: %d' % (job_count, files_per_job))
+        for name, remove in cases:
+            duration = time_removal(remove, job_count, files_per_job)
+            print('%-30s %.3f s' % (name, duration))
+    finally:
+        if os.path.exists(BENCHMARK_DIR):
+            shutil.rmtree(BENCHMARK_DIR)
+
+
+if __name__ == '__main__':
+    arguments = [int(arg) for arg in sys.argv[1:3]]
+    main(*arguments)
@@ -0,0 +1,92 @@
+"""
+Benchmarks how long a WorkflowRunner takes to start and stop against the
+number of workers it has, comparing the default start against a fast start.
+Startup is timed until all initial rules are available from the
+administrator, and shutdown until every runner process has stopped.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_runner_startup.py [max_workers] [repeats]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mig_meow.constants import PATTERNS, RECIPES, NAME
+from mig_meow.fileio import read_dir, rmtree
+from mig_meow.localrunner import WorkflowRunner, RUNNER_DATA, JOB_DIR, \
+    OUTPUT_DATA
+
+BENCHMARK_DIR = 'benchmark_startup_directory'
+
+
+def time_runner(workers, patterns, recipes, fast_start):
+    start = time.perf_counter()
+    runner = WorkflowRunner(
+        BENCHMARK_DIR,
+        workers,
+        patterns=patterns,
+        recipes=recipes,
+        daemon=True,
+        reuse_vgrid=True,
+        retro_active_jobs=False,
+        print_logging=False,
+        fast_start=fast_start
+    )
+    while len(runner.check_rules()) < len(patterns):
+        time.sleep(0.01)
+    startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    runner.stop_runner()
+    shutdown = time.perf_counter() - start
+    return startup, shutdown
+
+
+def main(max_workers=16, repeats=3):
+    data = read_dir(directory='examples/meow_directory')
+    patterns = {
+        name: data[PATTERNS][name]
+        for name in ['adder', 'first_mult', 'second_mult', 'third_choo']
+    }
+    recipes = {
+        data[RECIPES][name][NAME]: data[RECIPES][name]
+        for name in ['add', 'mult', 'choo']
+    }
+
+    print('%-8s %14s %14s %14s %14s' % (
+        'workers', 'start (s)', 'fast start (s)', 'stop (s)', 'fast stop (s)'
+    ))
+    try:
+        workers = 1
+        while workers <= max_workers:
+            results = {}
+            for fast_start in [False, True]:
+                timings = [
+                    time_runner(workers, patterns, recipes, fast_start)
+                    for _ in range(repeats)
+                ]
+                results[fast_start] = (
+                    min(timing[0] for timing in timings),
+                    min(timing[1] for timing in timings)
+                )
+            print('%-8d %14.3f %14.3f %14.3f %14.3f' % (
+                workers,
+                results[False][0],
+                results[True][0],
+                results[False][1],
+                results[True][1]
+            ))
+            workers *= 2
+    finally:
+        for directory in [BENCHMARK_DIR, RUNNER_DATA, JOB_DIR, OUTPUT_DATA]:
+            if os.path.exists(directory):
+                rmtree(directory)
+
+
+if __name__ == '__main__':
+    arguments = [int(arg) for arg in sys.argv[1:3]]
+    main(*arguments)
@@ -0,0 +1,142 @@
+"""
+Benchmarks the latency of WorkflowRunner status calls made to the
+administrator, comparing individual requests against a single batched
+request. The job queue is filled with a large number of jobs so that the cost
+of copying and sending results is visible.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_status_calls.py [job_count] [repeats]
+"""
+
+import os
+import sys
+import threading
+import time
+
+from multiprocessing import Process, Pipe
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mig_meow.localrunner import administrator, job_queue
+from mig_meow.fileio import make_dir, rmtree
+
+BENCHMARK_DIR = 'benchmark_status_directory'
+STATUS_OPERATIONS = [
+    'check_status',
+    'check_queue',
+    'check_patterns',
+    'check_rules',
+    'get_stats'
+]
+
+
+def drain(reader):
+    try:
+        while True:
+            reader.recv()
+    except (EOFError, OSError):
+        pass
+
+
+def time_individual(to_admin, from_admin, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for operation in STATUS_OPERATIONS:
+            to_admin.send((operation, None))
+            from_admin.recv()
+    return (time.perf_counter() - start) / repeats
+
+
+def time_batched(to_admin, from_admin, repeats):
+    requests = [(operation, None) for operation in STATUS_OPERATIONS]
+    start = time.perf_counter()
+    for _ in range(repeats):
+        to_admin.send(('batch', requests))
+        from_admin.recv()
+    return (time.perf_counter() - start) / repeats
+
+
+def main(job_count=100000, repeats=20):
+    make_dir(BENCHMARK_DIR)
+    job_data = os.path.join(BENCHMARK_DIR, 'jobs')
+    meow_data = os.path.join(BENCHMARK_DIR, 'meow')
+    make_dir(job_data)
+    make_dir(meow_data)
+
+    user_to_admin_reader, user_to_admin_writer = Pipe(duplex=False)
+    admin_to_user_reader, admin_to_user_writer = Pipe(duplex=False)
+    # Writers are kept so the administrator does not see closed pipes
+    state_to_admin_reader, state_to_admin_writer = Pipe(duplex=False)
+    file_to_admin_reader, file_to_admin_writer = Pipe(duplex=False)
+    admin_to_queue_reader, admin_to_queue_writer = Pipe(duplex=False)
+    queue_to_admin_reader, queue_to_admin_writer = Pipe(duplex=False)
+    logger_reader, logger_writer = Pipe(duplex=False)
+
+    admin = Process(
+        target=administrator,
+        args=(
+            user_to_admin_reader,
+            admin_to_user_writer,
+            state_to_admin_reader,
+            file_to_admin_reader,
+            admin_to_queue_writer,
+            queue_to_admin_reader,
+            [],
+            [],
+            logger_writer,
+            BENCHMARK_DIR,
+            job_data,
+            meow_data,
+            False,
+            False
+        )
+    )
+    queue = Process(
+        target=job_queue,
+        args=(
+            admin_to_queue_reader,
+            queue_to_admin_writer,
+            [],
+            [],
+            logger_writer,
+            job_data
+        )
+    )
+    threading.Thread(target=drain, args=(logger_reader,), daemon=True).start()
+
+    admin.start()
+    queue.start()
+
+    try:
+        # Jobs are given straight to the queue so that no job files need to
+        # be created.
+        for job_index in range(job_count):
+            admin_to_queue_writer.send('%016d' % job_index)
+
+        # Warm up, and ensure every job has reached the queue
+        user_to_admin_writer.send(('check_queue', None))
+        queued = len(admin_to_user_reader.recv())
+
+        individual = time_individual(
+            user_to_admin_writer, admin_to_user_reader, repeats)
+        batched = time_batched(
+            user_to_admin_writer, admin_to_user_reader, repeats)
+
+        print('Jobs in queue: %d' % queued)
+        print('Status calls per round: %d' % len(STATUS_OPERATIONS))
+        print('Individual requests: %.2f ms per round'
+              % (individual * 1000))
+        print('Batched request:     %.2f ms per round' % (batched * 1000))
+    finally:
+        user_to_admin_writer.send(('kill', None))
+        admin_to_user_reader.recv()
+        admin_to_queue_writer.send('kill')
+        admin.join()
+        queue.join()
+        rmtree(BENCHMARK_DIR)
+
+
+if __name__ == '__main__':
+    arguments = [int(arg) for arg in sys.argv[1:3]]
+    main(*arguments)
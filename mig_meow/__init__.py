@@ -1,9 +1,49 @@
+import importlib
+import pkgutil
+
 from .cwl import *
 from .info import *
 from .meow import *
 from .mig import *
-from .monitor_widget import *
 from .notebook import *
-from .workflow_widget import *
+from .notebook import _import_widget
 from .fileio import *
 from.version import __name__, __fullname__, __version__
+
+# The widget modules depend on ipywidgets, bqplot and graphviz, which take
+# far longer to import than the rest of the package, so their names are only
+# imported once first used.
+_LAZY_NAMES = {
+    'MonitorWidget': '.monitor_widget',
+    'update_monitor': '.monitor_widget',
+    'WorkflowWidget': '.workflow_widget',
+    'strip_dirs': '.workflow_widget',
+    'count_calls': '.workflow_widget',
+    'list_to_dict': '.workflow_widget',
+    'prepare_to_dump': '.workflow_widget',
+    'get_quoted_val': '.workflow_widget'
+}
+_SUBMODULES = {module.name for module in pkgutil.iter_modules(__path__)}
+
+__all__ = sorted(
+    [name for name in globals()
+     if not name.startswith('_') and name not in ('importlib', 'pkgutil')]
+    + list(_LAZY_NAMES)
+)
+
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        value = getattr(_import_widget(_LAZY_NAMES[name]), name)
+        globals()[name] = value
+        return value
+
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+
+    raise AttributeError(
+        "module '%s' has no attribute '%s'" % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
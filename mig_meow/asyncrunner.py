@@ -0,0 +1,556 @@
+import asyncio
+import copy
+import os
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from watchdog.observers import Observer
+
+from .constants import JOB_TRANSITION, JOB_REQUIREMENTS, RUNNING, DONE, \
+    FAILED, RULE_PATH
+from .environment import get_environment_fingerprint, RequirementMatcher
+from .events import InotifyObserver, EVENT_SOURCE_WATCHDOG, \
+    EVENT_SOURCE_INOTIFY
+from .fileio import read_yaml
+from .localrunner import WorkflowRunner, LocalWorkflowStateMonitor, \
+    LocalWorkflowFileMonitor, administrator_roles, setup_runner, \
+    write_initial_state, local_processing, ssh_processing, RUNNER_DATA, \
+    JOB_DIR, OUTPUT_DATA, META_FILE, TRIGGER_MODIFIED, DEFAULT_QUIET_PERIOD
+from .logging import create_localrunner_logfile, write_to_log
+from .notebooks import NotebookStore, NOTEBOOK_STORE_DIR
+from .ringbuffer import TRANSPORT_PIPE
+from .validation import is_valid_ssh_worker
+
+
+class LoopConnection:
+    """
+    Stands in for the sending end of a Connection between runner roles that
+    all share one event loop. Each message sent is passed to a handler
+    within the loop, in the order they were sent, regardless of which thread
+    sent them.
+    """
+    def __init__(self, loop, handler):
+        """
+        Constructor for a LoopConnection.
+
+        :param loop: (AbstractEventLoop) The loop to handle messages in.
+
+        :param handler: (function) Function taking a single message.
+        """
+        self.loop = loop
+        self.handler = handler
+
+    def send(self, message):
+        self.loop.call_soon_threadsafe(self.handler, message)
+
+
+class LoopRequests:
+    """
+    Stands in for the pair of Connections a WorkflowRunner uses to make
+    requests of its administrator. Requests are handled within the event
+    loop, and each reply is copied there so that later changes to the
+    administrator's state are not seen through it, as they would not be
+    once pickled through a Pipe.
+    """
+    def __init__(self, loop, handler):
+        """
+        Constructor for a LoopRequests.
+
+        :param loop: (AbstractEventLoop) The loop to handle requests in.
+
+        :param handler: (function) Function taking a request and returning
+        its reply.
+        """
+        self.loop = loop
+        self.handler = handler
+        self._replies = deque()
+
+    async def _handle(self, message):
+        return copy.deepcopy(self.handler(message))
+
+    def send(self, message):
+        self._replies.append(
+            asyncio.run_coroutine_threadsafe(self._handle(message), self.loop)
+        )
+
+    def recv(self):
+        return self._replies.popleft().result()
+
+
+class AsyncJobQueue:
+    """
+    Job queue role for an AsyncWorkflowRunner. Has the send, recv and poll
+    methods of the Connections the administrator would otherwise use to
+    reach the job queue process. Must only be used from within the event
+    loop.
+    """
+    def __init__(self, job_home, to_logger):
+        """
+        Constructor for an AsyncJobQueue.
+
+        :param job_home: (str) Directory jobs are created in.
+
+        :param to_logger: (LoopConnection) Connection to send log messages
+        to.
+        """
+        self.job_home = job_home
+        self.to_logger = to_logger
+        self.queue = []
+        # Requirements are read from each job's meta file only once
+        self.job_requirements = {}
+        # All workers share a process, so share the same environment
+        self.matcher = None
+        self.workers = []
+        self._replies = deque()
+
+    def send(self, message):
+        if message == 'get_queue':
+            self._replies.append(list(self.queue))
+            return
+        self.queue.append(message)
+        for worker in self.workers:
+            worker.wake()
+
+    def recv(self):
+        return self._replies.popleft()
+
+    def poll(self):
+        # Job transitions are passed straight to the administrator, so
+        # there is never anything waiting.
+        return False
+
+    def take_job(self, worker_id):
+        """
+        Removes the first job from the queue whose requirements are met.
+
+        :param worker_id: (int) The id of the worker requesting a job.
+
+        :return: (str) The id of the job, or None if no job can be run.
+        """
+        for job_id in self.queue:
+            if job_id not in self.job_requirements:
+                meta_path = os.path.join(self.job_home, job_id, META_FILE)
+                self.job_requirements[job_id] = \
+                    read_yaml(meta_path)[JOB_REQUIREMENTS]
+
+            requirements = self.job_requirements[job_id]
+            if 'dependencies' in requirements:
+                if self.matcher is None:
+                    self.matcher = \
+                        RequirementMatcher(get_environment_fingerprint())
+                if self.matcher.missing(requirements['dependencies']):
+                    self.to_logger.send(
+                        (
+                            'job_queue.queue request',
+                            "Could not assign job %s to worker %s as "
+                            "missing one or more requirement from %s."
+                            % (job_id, worker_id, requirements)
+                        )
+                    )
+                    continue
+
+            self.queue.remove(job_id)
+            self.job_requirements.pop(job_id, None)
+            self.to_logger.send(
+                (
+                    'job_queue.queue request',
+                    "Assigning job %s" % job_id
+                )
+            )
+            return job_id
+        return None
+
+
+class AsyncWorker:
+    """
+    Worker role for an AsyncWorkflowRunner, run as a task within the event
+    loop. Jobs are processed in an executor so as not to block the loop.
+    Has the send and recv methods of the Connections the administrator
+    would otherwise use to reach a worker process. Unlike a worker process,
+    this is woken as soon as a job is queued rather than polling for them.
+    """
+    def __init__(self, worker_id, processing_method, job_queue, to_admin,
+                 to_logger, executor, job_home, output_data,
+                 processing_method_args=None):
+        """
+        Constructor for an AsyncWorker.
+
+        :param worker_id: (int) The id of this worker.
+
+        :param processing_method: (function) Function to process a job,
+        such as local_processing.
+
+        :param job_queue: (AsyncJobQueue) The queue to take jobs from.
+
+        :param to_admin: (function) Function to pass job transitions to.
+
+        :param to_logger: (LoopConnection) Connection to send log messages
+        to.
+
+        :param executor: (Executor) The executor to process jobs in.
+
+        :param job_home: (str) Directory jobs are created in.
+
+        :param output_data: (str) Directory completed jobs are moved to.
+
+        :param processing_method_args: (dict)[optional] Arguments passed to
+        processing_method along with each job. These are kept between jobs,
+        so that a processing method may keep state such as a connection.
+        Default is None.
+        """
+        self.worker_id = worker_id
+        self.processing_method = processing_method
+        self.job_queue = job_queue
+        self.to_admin = to_admin
+        self.to_logger = to_logger
+        self.executor = executor
+        self.job_home = job_home
+        self.output_data = output_data
+        self.processing_method_args = processing_method_args or {}
+        self.state = 'stopped'
+        self._replies = deque()
+        self._woken = asyncio.Event()
+        self.task = None
+
+    def wake(self):
+        self._woken.set()
+
+    def send(self, message):
+        if message == 'start':
+            self.state = 'running'
+            self.wake()
+        elif message == 'stop':
+            self.state = 'stopped'
+        elif message == 'check':
+            self._replies.append(self.state)
+
+    def recv(self):
+        return self._replies.popleft()
+
+    def log(self, message):
+        self.to_logger.send(
+            ('job_processor.worker %s' % self.worker_id, message)
+        )
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._woken.wait()
+            self._woken.clear()
+
+            while self.state == 'running':
+                job_id = self.job_queue.take_job(self.worker_id)
+                if not job_id:
+                    break
+
+                self.log("Found job %s" % job_id)
+                processing_method_args = self.processing_method_args
+                processing_method_args["job_id"] = job_id
+                processing_method_args["job_home"] = self.job_home
+                processing_method_args["output_data"] = self.output_data
+
+                self.to_admin((JOB_TRANSITION, job_id, RUNNING))
+
+                status, msg = await loop.run_in_executor(
+                    self.executor,
+                    self.processing_method,
+                    processing_method_args
+                )
+
+                if status:
+                    self.to_admin((JOB_TRANSITION, job_id, DONE))
+                else:
+                    self.to_admin((JOB_TRANSITION, job_id, FAILED, msg))
+                    self.log("Job worker encountered an error. %s" % msg)
+
+                self.log("Completed job %s" % job_id)
+
+
+class AsyncWorkflowRunner(WorkflowRunner):
+    """
+    Workflow runner with the same public API as WorkflowRunner, but which
+    runs entirely within the current process. The administrator, job queue
+    and worker roles share a single asyncio event loop, run in a background
+    thread, with jobs processed in a pool of threads. This starts far faster
+    and uses far less memory than a WorkflowRunner, so is suited to small
+    deployments and testing.
+    """
+    def __init__(self, path, workers, patterns=None, recipes=None,
+                 meow_data=RUNNER_DATA, job_data=JOB_DIR,
+                 output_data=OUTPUT_DATA, daemon=False, reuse_vgrid=True,
+                 start_workers=True, retro_active_jobs=True,
+                 print_logging=True, file_logging=False, wait_time=10,
+                 retention=None, skip_unchanged_inputs=False,
+                 hash_inputs=False, event_source=EVENT_SOURCE_WATCHDOG,
+                 trigger_mode=TRIGGER_MODIFIED,
+                 quiet_period=DEFAULT_QUIET_PERIOD, transport=TRANSPORT_PIPE,
+                 fast_start=False):
+        """
+        Constructor for an AsyncWorkflowRunner. Takes the same arguments as
+        WorkflowRunner. wait_time and transport are checked but otherwise
+        unused, as workers are woken as soon as jobs are queued, and no
+        messages are passed between processes. If fast_start is set, the
+        administrator is given the initial patterns and recipes directly.
+        """
+        setup_runner(
+            path,
+            workers,
+            patterns,
+            recipes,
+            meow_data,
+            job_data,
+            output_data,
+            daemon,
+            reuse_vgrid,
+            start_workers,
+            retro_active_jobs,
+            print_logging,
+            file_logging,
+            wait_time,
+            retention,
+            skip_unchanged_inputs,
+            hash_inputs,
+            event_source,
+            trigger_mode,
+            quiet_period,
+            transport,
+            fast_start
+        )
+        self.print_logging = print_logging
+        self.runner_log_file = create_localrunner_logfile(
+            debug_mode=file_logging)
+        self.rings = []
+        self.roles = None
+        self.workers = []
+        self._retention_timer = None
+
+        if isinstance(workers, int):
+            workers = [{}] * workers
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(workers)))
+
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(
+            target=self.loop.run_forever,
+            daemon=True
+        )
+        self.loop_thread.start()
+
+        to_logger = LoopConnection(self.loop, self.log)
+
+        if event_source == EVENT_SOURCE_INOTIFY:
+            self.file_monitor_process = InotifyObserver()
+        else:
+            self.file_monitor_process = Observer()
+
+        # Roles are set up within the loop, as that is the only thread they
+        # may be used from.
+        asyncio.run_coroutine_threadsafe(
+            self._start_roles(
+                workers,
+                to_logger,
+                path,
+                job_data,
+                meow_data,
+                output_data,
+                retro_active_jobs,
+                start_workers,
+                retention,
+                skip_unchanged_inputs,
+                hash_inputs,
+                event_source,
+                patterns if fast_start else None,
+                recipes if fast_start else None
+            ),
+            self.loop
+        ).result()
+
+        self.user_to_admin = LoopRequests(
+            self.loop, self.roles.handle_user_message)
+        self.admin_to_user = self.user_to_admin
+
+        # Initial patterns and recipes are found by the state monitor as it
+        # is set up, without waiting on any file events, unless the
+        # administrator already has them.
+        write_initial_state(to_logger, patterns, recipes, meow_data)
+
+        state_monitor = LocalWorkflowStateMonitor(
+            LoopConnection(
+                self.loop,
+                partial(self.handle, 'handle_state_message')
+            ),
+            to_logger,
+            meow_data,
+            known_patterns=patterns if fast_start else None,
+            known_recipes=recipes if fast_start else None,
+            notebooks=NotebookStore(
+                os.path.join(job_data, NOTEBOOK_STORE_DIR))
+        )
+        self.state_monitor_process = Observer()
+        self.state_monitor_process.schedule(
+            state_monitor,
+            meow_data,
+            recursive=True
+        )
+
+        file_monitor = LocalWorkflowFileMonitor(
+            LoopConnection(self.loop, partial(self.handle, 'handle_event')),
+            to_logger,
+            trigger_mode=trigger_mode,
+            quiet_period=quiet_period
+        )
+        self.file_monitor_process.schedule(
+            file_monitor,
+            path,
+            recursive=True
+        )
+
+        self.state_monitor_process.start()
+        self.file_monitor_process.start()
+
+        to_logger.send(
+            (
+                'WorkflowRunner._init',
+                'Started AsyncWorkflowRunner. '
+            )
+        )
+
+        if not daemon:
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                self.stop_runner()
+
+    async def _start_roles(self, workers, to_logger, vgrid, job_data,
+                           meow_data, output_data, retro_active_jobs,
+                           start_workers, retention, skip_unchanged_inputs,
+                           hash_inputs, event_source, initial_patterns,
+                           initial_recipes):
+        job_queue = AsyncJobQueue(job_data, to_logger)
+        for worker_id, worker_type in enumerate(workers):
+            processing_method = local_processing
+            processing_method_args = {}
+            if is_valid_ssh_worker(worker_type)[0]:
+                processing_method = ssh_processing
+                processing_method_args = {
+                    'worker': worker_type
+                }
+            worker = AsyncWorker(
+                worker_id,
+                processing_method,
+                job_queue,
+                partial(self.handle, 'handle_queue_message'),
+                to_logger,
+                self.executor,
+                job_data,
+                output_data,
+                processing_method_args=processing_method_args
+            )
+            worker.task = asyncio.ensure_future(worker.run())
+            job_queue.workers.append(worker)
+        self.workers = job_queue.workers
+
+        # The file monitor matches no rules itself, so only an inotify
+        # observer needs to know what they are.
+        to_monitor = None
+        if event_source == EVENT_SOURCE_INOTIFY:
+            to_monitor = LoopConnection(self.loop, self.update_observer)
+
+        self.roles = administrator_roles(
+            job_queue,
+            job_queue,
+            self.workers,
+            self.workers,
+            to_logger,
+            LoopConnection(
+                self.loop,
+                partial(self.handle, 'handle_scan_message')
+            ),
+            vgrid,
+            job_data,
+            meow_data,
+            retro_active_jobs,
+            start_workers,
+            output_data=output_data,
+            retention=retention,
+            skip_unchanged_inputs=skip_unchanged_inputs,
+            hash_inputs=hash_inputs,
+            to_monitor=to_monitor,
+            initial_patterns=initial_patterns,
+            initial_recipes=initial_recipes
+        )
+        if self.roles.is_scan_pending():
+            self.loop.call_soon(self.start_pending_scan)
+        self.check_retention()
+
+    def handle(self, role, message):
+        """
+        Passes a message to one of the administrator's handlers. Must only
+        be called from within the event loop.
+
+        :param role: (str) Name of the handler, such as 'handle_event'.
+
+        :param message: (any) The message to handle.
+
+        :return: (any) The handler's result.
+        """
+        result = getattr(self.roles, role)(message)
+        # Scans wait until anything already scheduled has been handled, so
+        # that rules arriving together share a single scan.
+        if self.roles.is_scan_pending():
+            self.loop.call_soon(self.start_pending_scan)
+        return result
+
+    def start_pending_scan(self):
+        if self.roles.is_scan_pending():
+            self.roles.start_retroactive_scan()
+
+    def check_retention(self):
+        timeout = self.roles.check_retention()
+        if timeout is not None:
+            self._retention_timer = \
+                self.loop.call_later(timeout, self.check_retention)
+
+    def update_observer(self, rules):
+        self.file_monitor_process.update_rules(
+            [rule[RULE_PATH] for rule in rules])
+
+    def log(self, message):
+        write_to_log(self.runner_log_file, message[0], message[1])
+        if self.print_logging:
+            print(str(message[0]) + ': ' + str(message[1]))
+
+    async def _stop_roles(self):
+        if self._retention_timer:
+            self._retention_timer.cancel()
+        for worker in self.workers:
+            worker.task.cancel()
+        await asyncio.gather(
+            *[worker.task for worker in self.workers],
+            return_exceptions=True
+        )
+
+    def run(self):
+        # Roles are started as the runner is created
+        pass
+
+    def join(self):
+        self.file_monitor_process.join()
+        self.state_monitor_process.join()
+        self.loop_thread.join()
+
+    def stop(self):
+        self.file_monitor_process.stop()
+        self.file_monitor_process.join()
+        self.state_monitor_process.stop()
+        self.state_monitor_process.join()
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(
+                self._stop_roles(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        # Any job still being processed is left to finish in the background
+        self.executor.shutdown(wait=False)
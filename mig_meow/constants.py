@@ -117,6 +117,7 @@ SWEEP = 'parameterize_over'
 SWEEP_START = 'start'
 SWEEP_STOP = 'stop'
 SWEEP_JUMP = 'increment'
+CHUNK_SIZE = 'chunk_size'
 ENVIRONMENTS = 'environments'
 VGRID = 'vgrid'
 SOURCE = 'source'
@@ -146,6 +147,7 @@ VALID_PATTERN_OPTIONAL = {
     OUTPUT: dict,
     VARIABLES: dict,
     SWEEP: dict,
+    CHUNK_SIZE: int
 }
 
 VALID_SWEEP_MIN = {
@@ -268,6 +270,9 @@ SSH_HOSTNAME = "hostname"
 SSH_USER = "user"
 SSH_CERT = "rsa"
 SSH_MOUNT = "mount"
+SSH_PORT = "port"
+SSH_KNOWN_HOSTS = "known_hosts"
+SSH_AUTO_ADD_HOST_KEYS = "auto_add_host_keys"
 VALID_SSH_WORKER_MIN = {
     SSH_USER: str,
     SSH_HOSTNAME: str,
@@ -276,7 +281,9 @@ VALID_SSH_WORKER_MIN = {
 }
 
 VALID_SSH_WORKER_OPTIONAL = {
-
+    SSH_PORT: int,
+    SSH_KNOWN_HOSTS: str,
+    SSH_AUTO_ADD_HOST_KEYS: bool
 }
 
 ANCESTORS = 'ancestors'
@@ -335,6 +342,60 @@ MONITOR_LOGFILE_NAME = 'monitor_widget'
 REPORT_LOGFILE_NAME = 'report_widget'
 RUNNER_LOGFILE_NAME = 'workflow_runner'
 
+RULE_ID = 'id'
+RULE_PATH = 'path'
+RULE_PATTERN = 'pattern'
+RULE_RECIPE = 'recipe'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FAILED = 'failed'
+DONE = 'done'
+
+JOB_STATES = [
+    QUEUED,
+    RUNNING,
+    DONE,
+    FAILED
+]
+
+# Tag for job state changes, sent from workers to the administrator by way of
+# the job queue.
+JOB_TRANSITION = 'transition'
+
+JOB_ID = 'id'
+JOB_PATTERN = 'pattern'
+JOB_RECIPE = 'recipe'
+JOB_RULE = 'rule'
+JOB_PATH = 'path'
+JOB_STATUS = 'status'
+JOB_CREATE_TIME = 'create'
+JOB_START_TIME = 'start'
+JOB_END_TIME = 'end'
+JOB_ERROR = 'error'
+JOB_REQUIREMENTS = 'requirements'
+JOB_OUTPUTS = 'outputs'
+
+RETENTION_MAX_AGE = 'max_age'
+RETENTION_MAX_COUNT = 'max_count'
+RETENTION_KEEP_FAILED_ONLY = 'keep_failed_only'
+RETENTION_ARCHIVE = 'archive'
+RETENTION_INTERVAL = 'interval'
+
+VALID_RETENTION_MIN = {
+
+}
+
+VALID_RETENTION_OPTIONAL = {
+    RETENTION_MAX_AGE: int,
+    RETENTION_MAX_COUNT: int,
+    RETENTION_KEEP_FAILED_ONLY: bool,
+    RETENTION_ARCHIVE: bool,
+    RETENTION_INTERVAL: int
+}
+
+RETENTION_NAME = 'Retention'
+
 KEYWORD_PATH = "{PATH}"
 KEYWORD_REL_PATH = "{REL_PATH}"
 KEYWORD_DIR = "{DIR}"
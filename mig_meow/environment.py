@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import re
+import stat
+import sys
+import tempfile
+
+from importlib import metadata
+
+from .constants import COMPARITORS
+
+# Comparitors understood when matching job requirements. This extends the
+# comparitors accepted for MiG environments, which are left unchanged.
+REQUIREMENT_COMPARITORS = COMPARITORS + ['<=']
+
+# Cache kept in a per user directory, as other users could write to a file
+# placed in the shared temporary directory.
+ENVIRONMENT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME')
+    or os.path.join(os.path.expanduser('~'), '.cache'),
+    'mig_meow'
+)
+ENVIRONMENT_CACHE_FILE = os.path.join(
+    ENVIRONMENT_CACHE_DIR,
+    'environment_%s.json'
+    % hashlib.sha1(sys.executable.encode()).hexdigest()[:16]
+)
+
+CACHE_KEY = 'key'
+CACHE_PACKAGES = 'packages'
+
+# Fingerprint of the current interpreter, once it has been found
+_fingerprint = None
+
+
+def normalise_package_name(name):
+    """
+    Normalises a package name, so that names differing only in case or in
+    the use of '-', '_' and '.' are treated as the same package.
+
+    :param name: (str) The package name.
+
+    :return: (str) The normalised name.
+    """
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def parse_version(version):
+    """
+    Parses the leading release segment of a version string, so that it can
+    be compared against other versions. Any pre or post release suffix is
+    ignored.
+
+    :param version: (str) The version, such as '1.21.0' or '2.0.0rc1'.
+
+    :return: (tuple) The release numbers, without any trailing zeros.
+    """
+    match = re.match(r'\d+(\.\d+)*', version.strip())
+    if not match:
+        return ()
+    release = [int(part) for part in match.group(0).split('.')]
+    while release and release[-1] == 0:
+        release.pop()
+    return tuple(release)
+
+
+def parse_requirement(requirement):
+    """
+    Splits a dependency, as accepted by is_valid_local_environment, into its
+    package name and any version constraint.
+
+    :param requirement: (str) The dependency, such as 'numpy' or
+    'numpy>=1.18'.
+
+    :return: (Tuple(str, str, tuple)) The normalised package name, the
+    comparitor and the parsed version. The comparitor and version are None
+    if no version is required.
+    """
+    for comparitor in REQUIREMENT_COMPARITORS:
+        if comparitor in requirement:
+            name, version = requirement.split(comparitor, 1)
+            return normalise_package_name(name), comparitor, \
+                parse_version(version)
+    return normalise_package_name(requirement), None, None
+
+
+def is_requirement_met(requirement, fingerprint):
+    """
+    Checks if a dependency is met by an environment.
+
+    :param requirement: (str) The dependency, such as 'numpy' or
+    'numpy>=1.18'.
+
+    :param fingerprint: (dict) The environment's installed packages, as
+    returned by get_environment_fingerprint.
+
+    :return: (bool) True if the dependency is installed at an acceptable
+    version, False otherwise.
+    """
+    name, comparitor, version = parse_requirement(requirement)
+    if name not in fingerprint:
+        return False
+    if comparitor is None:
+        return True
+    installed = parse_version(fingerprint[name])
+    if comparitor == '==':
+        return installed == version
+    if comparitor == '>=':
+        return installed >= version
+    return installed <= version
+
+
+def get_cache_key():
+    """
+    Gets a key identifying the current interpreter and the state of its
+    package directories. As installing or removing packages modifies these
+    directories, the key changes whenever the installed packages may have.
+
+    :return: (str) The key.
+    """
+    state = [sys.executable, sys.version]
+    for path in sys.path:
+        try:
+            state.append('%s:%d' % (path, os.stat(path).st_mtime_ns))
+        except OSError:
+            pass
+    return hashlib.sha1('\n'.join(state).encode()).hexdigest()
+
+
+def scan_environment():
+    """
+    Finds all packages installed in the current interpreter.
+
+    :return: (dict) The installed packages, mapping normalised package names
+    to their versions.
+    """
+    packages = {}
+    for distribution in metadata.distributions():
+        name = distribution.metadata['Name']
+        if name:
+            packages.setdefault(
+                normalise_package_name(name), distribution.version)
+    return packages
+
+
+def is_trusted_file(descriptor):
+    """
+    Checks that an open file can only have been written by the current user,
+    and so can be trusted.
+
+    :param descriptor: (int) Descriptor of the open file. This is checked
+    rather than a path, so that the file cannot be swapped once checked.
+
+    :return: (bool) True if the file is owned by the current user and cannot
+    be written by anyone else, False otherwise.
+    """
+    status = os.fstat(descriptor)
+    # Ownership cannot be checked on platforms without user ids
+    if hasattr(os, 'getuid') and status.st_uid != os.getuid():
+        return False
+    return not status.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def get_environment_fingerprint(cache_file=ENVIRONMENT_CACHE_FILE):
+    """
+    Gets the packages installed in the current interpreter. These are only
+    found once per process, and are cached in a file so that other processes
+    using the same interpreter need not find them again, unless the
+    installed packages may have changed.
+
+    :param cache_file: (str)[optional] File to cache the packages in. If
+    None, no file is used. Default is ENVIRONMENT_CACHE_FILE.
+
+    :return: (dict) The installed packages, mapping normalised package names
+    to their versions.
+    """
+    global _fingerprint
+    if _fingerprint is not None:
+        return _fingerprint
+
+    key = get_cache_key()
+    if cache_file:
+        try:
+            with open(cache_file, 'r') as input_file:
+                if not is_trusted_file(input_file.fileno()):
+                    raise ValueError(
+                        "Cache file '%s' could have been written by another "
+                        "user." % cache_file)
+                cached = json.load(input_file)
+            if cached[CACHE_KEY] == key:
+                _fingerprint = cached[CACHE_PACKAGES]
+                return _fingerprint
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    _fingerprint = scan_environment()
+
+    if cache_file:
+        # Written to a temporary file first, so that workers starting
+        # together never read a partly written cache
+        try:
+            cache_dir = os.path.dirname(cache_file) or '.'
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            descriptor, temp_path = tempfile.mkstemp(dir=cache_dir)
+            with os.fdopen(descriptor, 'w') as output_file:
+                json.dump(
+                    {CACHE_KEY: key, CACHE_PACKAGES: _fingerprint},
+                    output_file
+                )
+            os.replace(temp_path, cache_file)
+        except OSError:
+            pass
+
+    return _fingerprint
+
+
+class RequirementMatcher:
+    """
+    Matches job requirements against the environment of a worker. The
+    result for each distinct requirement is only worked out once, so that
+    checking a job is a set difference against what is already known.
+    """
+    def __init__(self, fingerprint=None):
+        """
+        Constructor for a RequirementMatcher.
+
+        :param fingerprint: (dict)[optional] The worker's installed packages,
+        as returned by get_environment_fingerprint. If None, no requirements
+        are met.
+        """
+        self.fingerprint = fingerprint or {}
+        self.met = set()
+        self.unmet = set()
+
+    def missing(self, requirements):
+        """
+        Gets which requirements are not met.
+
+        :param requirements: (list) The dependencies to check.
+
+        :return: (set) The dependencies not met.
+        """
+        requirements = set(requirements)
+        for requirement in requirements - self.met - self.unmet:
+            if is_requirement_met(requirement, self.fingerprint):
+                self.met.add(requirement)
+            else:
+                self.unmet.add(requirement)
+        return requirements & self.unmet
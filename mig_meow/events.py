@@ -0,0 +1,438 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+
+from watchdog.events import FileCreatedEvent, FileModifiedEvent, \
+    DirModifiedEvent
+
+from .rules import get_literal_prefix
+
+EVENT_SOURCE_WATCHDOG = 'watchdog'
+EVENT_SOURCE_INOTIFY = 'inotify'
+
+EVENT_SOURCES = [
+    EVENT_SOURCE_WATCHDOG,
+    EVENT_SOURCE_INOTIFY
+]
+
+# Values from linux/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# Directories that inputs may appear in only need to report finished writes
+# and files moved into them. Those that may contain such directories only
+# need to report new directories. Kernel side filtering on these masks means
+# that other activity, such as every individual write, never reaches Python.
+FILE_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+DIR_MASK = IN_CREATE | IN_MOVED_TO
+
+# Attribute set on events that are only emitted once a file is complete,
+# either because its writer has closed it or because it was moved into place.
+WRITE_COMPLETE = '_write_complete'
+
+# Attribute set on the event emitted for the vgrid itself when the kernel
+# event queue has overflowed, and so events may have been lost.
+QUEUE_OVERFLOW = '_queue_overflow'
+
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(
+            ctypes.util.find_library('c') or 'libc.so.6',
+            use_errno=True
+        )
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = \
+            [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return _libc
+
+
+def is_inotify_available():
+    """
+    Checks if the inotify event source can be used on this system.
+
+    :return: (bool) True if inotify is available, False otherwise.
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        libc = _get_libc()
+    except OSError:
+        return False
+    return hasattr(libc, 'inotify_init1')
+
+
+def get_watch_roots(rule_paths):
+    """
+    Gets the directories within which files matching any of a number of rule
+    paths may appear.
+
+    :param rule_paths: (list) Rule trigger paths, relative to the vgrid.
+
+    :return: (dict) A dict of directories, relative to the vgrid, to
+    whether matching files may also appear anywhere below them.
+    """
+    roots = {}
+    for path in rule_paths:
+        prefix, recursive = get_literal_prefix(path)
+        roots[prefix] = roots.get(prefix, False) or recursive
+    return roots
+
+
+def _is_within(path, directory):
+    return directory == '' or path.startswith(directory + os.path.sep)
+
+
+class InotifyObserver(threading.Thread):
+    """
+    File event source using the Linux inotify API directly. It can be used
+    in place of a watchdog Observer to monitor a vgrid, but rather than
+    watching every directory for every kind of event, it only watches the
+    directories that some rule's trigger path can reach, and only for the
+    events that could trigger a job. Watches are updated as rules are
+    added and removed, and as directories are created within the vgrid.
+
+    Only a single handler can be scheduled, which is passed either
+    FileModifiedEvents, once a file has been written and closed, or
+    FileCreatedEvents, when a file is moved into a watched directory. Both
+    are marked with WRITE_COMPLETE.
+
+    If the kernel event queue overflows, a DirModifiedEvent for the vgrid
+    marked with QUEUE_OVERFLOW is passed to the handler, and all watched
+    directories are rescanned, emitting FileCreatedEvents for any files
+    within them, so that files whose events were lost are not missed.
+    """
+    def __init__(self, rule_paths=None):
+        """
+        Constructor for an InotifyObserver.
+
+        :param rule_paths: (list)[optional] Initial rule trigger paths to
+        watch for. These can be changed later with update_rules.
+        """
+        threading.Thread.__init__(self, daemon=True)
+        libc = _get_libc()
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        # Written to in order to wake the observer thread, either to stop or
+        # to apply new rules.
+        self._wake_reader, self._wake_writer = os.pipe()
+        self._pending_rule_paths = None
+        self._pending_lock = threading.Lock()
+        self._handler = None
+        self._path = None
+        self._roots = {}
+        # Watch descriptors to watched directories relative to the vgrid,
+        # and the reverse of those to (watch descriptor, mask).
+        self._watches = {}
+        self._paths = {}
+        self._rule_paths = list(rule_paths) if rule_paths else []
+        self._stopping = False
+
+    def schedule(self, event_handler, path, recursive=True):
+        """
+        Sets the handler to pass events to, and the directory to watch.
+
+        :param event_handler: (FileSystemEventHandler) The handler to pass
+        events to.
+
+        :param path: (str) The vgrid to watch.
+
+        :param recursive: (bool)[optional] Accepted for compatibility with
+        watchdog Observers. Which directories are watched is always
+        determined by rule paths.
+
+        :return: No return.
+        """
+        self._handler = event_handler
+        self._path = path
+        if self._rule_paths:
+            self.set_rules(self._rule_paths)
+
+    def watched(self):
+        """
+        Gets the currently watched directories.
+
+        :return: (dict) A dict of directories, relative to the vgrid, to the
+        inotify event mask each is watched with.
+        """
+        return {path: mask for path, (_, mask) in self._paths.items()}
+
+    def _full_path(self, relative):
+        if not relative:
+            return self._path
+        return os.path.join(self._path, relative)
+
+    def _is_recursive(self, relative):
+        for root, recursive in self._roots.items():
+            if recursive and (relative == root or _is_within(relative, root)):
+                return True
+        return False
+
+    def _get_mask(self, relative):
+        """
+        Gets the events a directory should be watched for, given the current
+        rules.
+
+        :param relative: (str) The directory, relative to the vgrid.
+
+        :return: (int) The inotify event mask, or 0 if the directory does not
+        need to be watched.
+        """
+        mask = 0
+        for root, recursive in self._roots.items():
+            if relative == root:
+                mask |= FILE_MASK
+                if recursive:
+                    mask |= DIR_MASK
+            elif recursive and _is_within(relative, root):
+                mask |= FILE_MASK | DIR_MASK
+            elif _is_within(root, relative):
+                mask |= DIR_MASK
+        if mask:
+            mask |= IN_MOVE_SELF
+        return mask
+
+    def _add_watch(self, relative, mask):
+        full_path = self._full_path(relative)
+        wd = _get_libc().inotify_add_watch(
+            self._fd, os.fsencode(full_path), mask | IN_ONLYDIR)
+        if wd < 0:
+            error = ctypes.get_errno()
+            # Directory may have been removed since being found
+            if error in [errno.ENOENT, errno.ENOTDIR, errno.EACCES]:
+                return False
+            raise OSError(error, os.strerror(error), full_path)
+        # The same directory may have been watched under a previous name
+        previous = self._watches.get(wd, None)
+        if previous is not None and previous != relative:
+            self._paths.pop(previous, None)
+        self._watches[wd] = relative
+        self._paths[relative] = (wd, mask)
+        return True
+
+    def _remove_watch(self, relative):
+        wd, _ = self._paths.pop(relative)
+        if self._watches.get(wd, None) == relative:
+            self._watches.pop(wd)
+            _get_libc().inotify_rm_watch(self._fd, wd)
+
+    def _emit(self, event):
+        if self._handler:
+            self._handler.dispatch(event)
+
+    def _watch_tree(self, relative, emit=False):
+        """
+        Watches a directory and any directories below it that need to be
+        watched.
+
+        :param relative: (str) The directory, relative to the vgrid.
+
+        :param emit: (bool)[optional] If True, created events are emitted
+        for any files already in newly watched directories. This is used for
+        directories that have only just appeared, as files may have been
+        written to them before they could be watched. Default is False.
+
+        :return: No return.
+        """
+        to_watch = [relative]
+        while to_watch:
+            current = to_watch.pop()
+            mask = self._get_mask(current)
+            if not mask:
+                continue
+            recursive = self._is_recursive(current)
+            existing = self._paths.get(current, None)
+            # Watched directories within a recursive root already have their
+            # whole subtree watched.
+            if not emit and recursive and existing and existing[1] == mask:
+                continue
+            if not self._add_watch(current, mask):
+                continue
+
+            full_path = self._full_path(current)
+            if recursive or (emit and mask & IN_CLOSE_WRITE):
+                try:
+                    with os.scandir(full_path) as scanned:
+                        entries = list(scanned)
+                except OSError:
+                    continue
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        to_watch.append(os.path.join(current, entry.name))
+                    elif emit and mask & IN_CLOSE_WRITE and entry.is_file():
+                        self._emit(FileCreatedEvent(entry.path))
+            if not recursive:
+                # Only the directories leading to roots are of interest.
+                names = set()
+                for root in self._roots:
+                    if root != current and _is_within(root, current):
+                        names.add(root[len(current):].lstrip(
+                            os.path.sep).split(os.path.sep)[0])
+                for name in sorted(names):
+                    child = os.path.join(current, name)
+                    if os.path.isdir(self._full_path(child)):
+                        to_watch.append(child)
+
+    def set_rules(self, rule_paths):
+        """
+        Updates the watched directories to match a new set of rules. Once
+        the observer is started this should only be called from its own
+        thread, so should be requested with update_rules.
+
+        :param rule_paths: (list) Rule trigger paths, relative to the vgrid.
+
+        :return: No return.
+        """
+        self._rule_paths = list(rule_paths)
+        if self._path is None:
+            return
+        self._roots = get_watch_roots(rule_paths)
+        for relative in list(self._paths):
+            if relative in self._paths and not self._get_mask(relative):
+                self._remove_watch(relative)
+        if self._roots:
+            self._watch_tree('')
+
+    def _handle_event(self, wd, mask, name):
+        relative = self._watches.get(wd, None)
+        if relative is None:
+            return
+
+        if mask & IN_IGNORED:
+            self._watches.pop(wd)
+            if self._paths.get(relative, (None,))[0] == wd:
+                self._paths.pop(relative)
+            return
+
+        if mask & IN_MOVE_SELF:
+            # If moved within the vgrid the directory will already have been
+            # watched under its new name, otherwise it has gone.
+            if not os.path.isdir(self._full_path(relative)):
+                for path in list(self._paths):
+                    if path in self._paths and (
+                            path == relative or _is_within(path, relative)):
+                        self._remove_watch(path)
+            return
+
+        if not name:
+            return
+        path = os.path.join(relative, name) if relative else name
+
+        if mask & IN_ISDIR:
+            self._watch_tree(path, emit=True)
+            return
+
+        # Files are only created in directories watched for new directories
+        if mask & IN_CREATE:
+            return
+        if not self._paths.get(relative, (None, 0))[1] & IN_CLOSE_WRITE:
+            return
+
+        if mask & IN_CLOSE_WRITE:
+            event = FileModifiedEvent(self._full_path(path))
+        else:
+            event = FileCreatedEvent(self._full_path(path))
+        setattr(event, WRITE_COMPLETE, True)
+        self._emit(event)
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        overflowed = False
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflowed = True
+                continue
+            self._handle_event(wd, mask, name)
+        if overflowed:
+            self._rescan()
+
+    def _rescan(self):
+        """
+        Recovers from a kernel event queue overflow. The handler is told of
+        the overflow, and any files in watched directories are emitted again
+        as the events for some of them may have been lost.
+
+        :return: No return.
+        """
+        event = DirModifiedEvent(self._path)
+        setattr(event, QUEUE_OVERFLOW, True)
+        self._emit(event)
+        if self._roots:
+            self._watch_tree('', emit=True)
+
+    def update_rules(self, rule_paths):
+        """
+        Requests that the watched directories are updated to match a new set
+        of rules. This can be called from any thread. If several updates are
+        requested before the observer thread can apply them, only the most
+        recent is applied.
+
+        :param rule_paths: (list) Rule trigger paths, relative to the vgrid.
+
+        :return: No return.
+        """
+        with self._pending_lock:
+            self._pending_rule_paths = list(rule_paths)
+        if not self._stopping:
+            os.write(self._wake_writer, b'\0')
+
+    def run(self):
+        inputs = [self._fd, self._wake_reader]
+        try:
+            while True:
+                ready, _, _ = select.select(inputs, [], [])
+                if self._wake_reader in ready:
+                    os.read(self._wake_reader, READ_SIZE)
+                    if self._stopping:
+                        return
+                    with self._pending_lock:
+                        rule_paths = self._pending_rule_paths
+                        self._pending_rule_paths = None
+                    if rule_paths is not None:
+                        self.set_rules(rule_paths)
+                if self._fd in ready:
+                    self._read_events()
+        finally:
+            os.close(self._fd)
+            os.close(self._wake_reader)
+            os.close(self._wake_writer)
+
+    def stop(self):
+        """
+        Stops the observer. It should then be joined. Stopping an observer
+        that has already stopped has no effect.
+
+        :return: No return.
+        """
+        if self._stopping:
+            return
+        self._stopping = True
+        os.write(self._wake_writer, b'\0')
@@ -1,34 +1,233 @@
 
 import os
 import json
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
 import yaml
 
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
 from .constants import NAME, PERSISTENCE_ID, INPUT_FILE, TRIGGER_PATHS, \
     RECIPES, OUTPUT, VARIABLES, OBJECT_TYPE, VGRID, TASK_FILE, \
     TRIGGER_RECIPES, SWEEP, DEFAULT_MEOW_IMPORT_EXPORT_DIR, PATTERNS, \
-    RECIPE_NAME, PATTERN_NAME
+    RECIPE_NAME, PATTERN_NAME, CHUNK_SIZE
 from .meow import Pattern, check_patterns_dict, check_recipes_dict, \
     is_valid_pattern_object
 from .validation import valid_pattern_name, dir_exists, valid_dir_path, \
     is_valid_recipe_dict, valid_recipe_name, valid_pattern_path, \
     valid_recipe_path
 
+RMTREE_WORKERS = min(8, os.cpu_count() or 1)
+LOAD_WORKERS = min(8, os.cpu_count() or 1)
+# Fewest files worth starting processes to read in parallel
+PARALLEL_LOAD_THRESHOLD = 64
+LOAD_ERRORS = 'errors'
+# The C parser is far faster, and gives the same results where available
+YAML_LOADER = getattr(yaml, 'CLoader', yaml.Loader)
+TRASH_PREFIX = '.deleting_'
+
+
+def _remove_subtree(directory):
+    """
+    Removes a directory and all its contents, without recursion.
+
+    :param directory: (str) The directory to remove.
+
+    :return: No return
+    """
+    to_scan = [directory]
+    to_remove = []
+    while to_scan:
+        current = to_scan.pop()
+        to_remove.append(current)
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    to_scan.append(entry.path)
+                else:
+                    os.unlink(entry.path)
+    # Directories are scanned parents first, so are removed in reverse
+    for current in reversed(to_remove):
+        os.rmdir(current)
+
 
-def rmtree(directory):
+def _remove_trees(directories, workers):
     """
-    Remove a directory and all its contents. 
-    Should be faster than shutil.rmtree
-    
-    :param: (str) The firectory to empty and remove
+    Removes several directory trees, spread across a pool of threads.
+
+    :param directories: (list) The directories to remove.
+
+    :param workers: (int) The maximum number of threads to use.
 
     :return: No return
     """
-    for root, dirs, files in os.walk(directory, topdown=False):
-        for file in files:
-            os.remove(os.path.join(root, file))
-        for dir in dirs:
-            rmtree(os.path.join(root, dir))
-    os.rmdir(directory)
+    # Descend until there is more than one subtree, so that there is work to
+    # split between threads.
+    chain = []
+    while len(directories) == 1:
+        directory = directories[0]
+        chain.append(directory)
+        directories = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                else:
+                    os.unlink(entry.path)
+
+    if workers > 1 and len(directories) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Calling result re-raises any error met during removal
+            for future in [executor.submit(_remove_subtree, directory)
+                           for directory in directories]:
+                future.result()
+    else:
+        for directory in directories:
+            _remove_subtree(directory)
+
+    for directory in reversed(chain):
+        os.rmdir(directory)
+
+
+def move_to_trash(directories, location):
+    """
+    Moves directories into a new hidden directory, from which they can be
+    removed later. As this only renames the directories it is fast
+    regardless of their contents.
+
+    :param directories: (list) The directories to move.
+
+    :param location: (str) Where to create the hidden directory. Must be on
+    the same file system as all the directories.
+
+    :return: (str) Path to the hidden directory.
+    """
+    trash = tempfile.mkdtemp(prefix=TRASH_PREFIX, dir=location)
+    for index, directory in enumerate(directories):
+        # Prefixed with index to avoid collisions between basenames
+        os.rename(
+            directory,
+            os.path.join(
+                trash, '%d_%s' % (index, os.path.basename(directory)))
+        )
+    return trash
+
+
+def _remove_in_background(directories, location, workers):
+    trash = move_to_trash(directories, location)
+    remover = threading.Thread(
+        target=_remove_trees,
+        args=([trash], workers)
+    )
+    remover.start()
+    return remover
+
+
+def rmtrees(directories, workers=RMTREE_WORKERS, background=False):
+    """
+    Remove several directories and all their contents. Removal is spread
+    across a pool of threads.
+
+    :param directories: (list) The directories to remove.
+
+    :param workers: (int) [optional] The maximum number of threads used in
+    removal. Default is RMTREE_WORKERS.
+
+    :param background: (boolean) [optional] If True, the directories are
+    first moved into a hidden directory alongside them, and are then removed
+    by a background thread. This function then returns as soon as the
+    directories have been moved. Default is False.
+
+    :return: (Thread) The thread removing the directories if background is
+    True, otherwise None.
+    """
+    directories = [directory for directory in directories
+                   if os.path.exists(directory)]
+    if not directories:
+        return None
+
+    if not background:
+        _remove_trees(directories, workers)
+        return None
+
+    # Each hidden directory is made beside the directories moved into it, so
+    # that moving them is only ever a rename within the same directory.
+    by_parent = {}
+    for directory in directories:
+        parent = os.path.dirname(os.path.abspath(directory))
+        by_parent.setdefault(parent, []).append(directory)
+    trash = [move_to_trash(grouped, parent)
+             for parent, grouped in by_parent.items()]
+    remover = threading.Thread(
+        target=_remove_trees,
+        args=(trash, workers)
+    )
+    remover.start()
+    return remover
+
+
+def rmtrees_detached(directories, workers=RMTREE_WORKERS):
+    """
+    Remove several directories and all their contents in a new process,
+    which is detached from this one. This process can therefore exit
+    without waiting for the removal to finish.
+
+    :param directories: (list) The directories to remove.
+
+    :param workers: (int) [optional] The maximum number of threads used in
+    removal. Default is RMTREE_WORKERS.
+
+    :return: (Popen) The process removing the directories.
+    """
+    # The package may not be installed, so the new interpreter is pointed at
+    # the copy in use here.
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = [package_root]
+    if os.environ.get('PYTHONPATH'):
+        paths.append(os.environ['PYTHONPATH'])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(paths))
+    return subprocess.Popen(
+        [
+            sys.executable,
+            '-c',
+            'import sys; from mig_meow.fileio import rmtrees; '
+            'rmtrees(sys.argv[2:], workers=int(sys.argv[1]))',
+            str(workers)
+        ] + [os.path.abspath(directory) for directory in directories],
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+
+def rmtree(directory, workers=RMTREE_WORKERS, background=False):
+    """
+    Remove a directory and all its contents. Subdirectories are removed in
+    parallel across a pool of threads.
+
+    :param directory: (str) The directory to empty and remove.
+
+    :param workers: (int) [optional] The maximum number of threads used in
+    removal. Default is RMTREE_WORKERS.
+
+    :param background: (boolean) [optional] If True, the directory is
+    renamed and then removed by a background thread, so that this function
+    returns as soon as the directory has been renamed. Default is False.
+
+    :return: (Thread) The thread removing the directory if background is
+    True, otherwise None.
+    """
+    if background:
+        return _remove_in_background(
+            [directory], os.path.dirname(os.path.abspath(directory)), workers)
+
+    _remove_trees([directory], workers)
+    return None
 
 
 def write_notebook(source, filename):
@@ -68,7 +267,7 @@ def read_yaml(filepath):
     :return: (object) An object read from the file.
     """
     with open(filepath, 'r') as yaml_file:
-        return yaml.load(yaml_file, Loader=yaml.Loader)
+        return yaml.load(yaml_file, Loader=YAML_LOADER)
 
 
 def make_dir(path, can_exist=True, ensure_clean=False):
@@ -121,6 +320,8 @@ def patten_to_yaml_dict(pattern):
         VARIABLES: pattern.variables,
         SWEEP: pattern.sweep
     }
+    if pattern.chunk_size:
+        pattern_yaml[CHUNK_SIZE] = pattern.chunk_size
     return pattern_yaml
 
 
@@ -184,57 +385,208 @@ def recipe_from_yaml_dict(yaml_dict, name):
     return recipe_dict
 
 
-def read_dir(directory=DEFAULT_MEOW_IMPORT_EXPORT_DIR):
+class LoadCache:
+    """
+    Cache of the patterns and recipes read by load_dir, keyed by file path.
+    Each entry is only used while its file has the same modification time
+    and size as when it was read, so reading an unchanged directory again
+    only needs each file to be stat'ed. Entries are kept pickled, so that
+    changes made to a returned pattern or recipe do not alter the cache.
+    """
+    def __init__(self):
+        """
+        Constructor for an empty LoadCache.
+        """
+        self.entries = {}
+
+    def get(self, path, stat):
+        """
+        Gets a cached pattern or recipe.
+
+        :param path: (str) The file it was read from.
+
+        :param stat: (os.stat_result) The file's current state.
+
+        :return: (Pattern or dict) The cached pattern or recipe, or None if
+        there is no entry for the file as it is now.
+        """
+        entry = self.entries.get(path)
+        if entry and entry[0] == (stat.st_mtime_ns, stat.st_size):
+            return pickle.loads(entry[1])
+        return None
+
+    def put(self, path, stat, data):
+        """
+        Adds a pattern or recipe to the cache.
+
+        :param path: (str) The file it was read from.
+
+        :param stat: (os.stat_result) The file's state when read.
+
+        :param data: (bytes) The pickled pattern or recipe.
+
+        :return: No return.
+        """
+        self.entries[path] = ((stat.st_mtime_ns, stat.st_size), data)
+
+    def prune(self, paths):
+        """
+        Removes any entries for files other than those given, such as those
+        that have since been deleted.
+
+        :param paths: (set) The files to keep entries for.
+
+        :return: No return.
+        """
+        for path in list(self.entries):
+            if path not in paths:
+                self.entries.pop(path)
+
+
+def _load_file(kind, path, serialise, catch):
+    """
+    Reads a single pattern or recipe file. Used by load_dir and read_dir,
+    including from within a process pool.
+
+    :param kind: (str) Either 'patterns' or 'recipes'.
+
+    :param path: (str) The file to read.
+
+    :param serialise: (bool) If True, the read object is returned pickled.
+
+    :param catch: (bool) If True, any error reading the file is returned
+    rather than raised.
+
+    :return: (Tuple(object, str)) The read object and None, or None and an
+    error message if the file could not be read.
+    """
+    try:
+        if kind == PATTERNS:
+            loaded = read_pattern(path)
+        else:
+            loaded = read_recipe(path)
+    except Exception as ex:
+        if not catch:
+            raise
+        return None, str(ex)
+    if serialise:
+        return pickle.dumps(loaded), None
+    return loaded, None
+
+
+def load_dir(directory=DEFAULT_MEOW_IMPORT_EXPORT_DIR, workers=LOAD_WORKERS,
+             cache=None):
     """
     Reads in MEOW Patterns and Recipes from yaml files, contained in a local
-    directory. This expects there to be two directories within the given
-    directory, one containing the Patterns and another containing the Recipes.
+    directory, in bulk. Large directories are read in parallel across a pool
+    of processes. Each file is validated once as it is read, and a file that
+    cannot be read is reported rather than stopping the others from being
+    read.
 
-    :param directory: (str) The directory to read from. Default is
+    :param directory: (str)[optional] The directory to read from. Default is
     'meow_directory'.
 
-    :return: (dict) A dict of Patterns and Recipe objects.
+    :param workers: (int)[optional] The most processes to read files with.
+    Directories of fewer than PARALLEL_LOAD_THRESHOLD files are always read
+    in this process. Default is LOAD_WORKERS.
+
+    :param cache: (LoadCache)[optional] Cache of previously read files. Any
+    file unchanged since it was cached is not read again. Default is None.
+
+    :return: (dict) A dict of Pattern objects and Recipe dicts, each keyed by
+    their file name, along with a dict of error messages keyed by the path
+    of each file that could not be read.
     """
+    return _load_dir(directory, workers, cache, True)
+
+
+def _load_dir(directory, workers, cache, catch):
     valid_dir_path(directory, 'directory')
     dir_exists(directory)
 
-    pattern_dir = os.path.join(directory, PATTERNS)
-    recipe_dir = os.path.join(directory, RECIPES)
-
     result = {
         PATTERNS: {},
-        RECIPES: {}
+        RECIPES: {},
+        LOAD_ERRORS: {}
     }
 
-    if os.path.exists(pattern_dir):
-        pattern_files = [
-            f for f in os.listdir(pattern_dir)
-            if os.path.isfile(os.path.join(pattern_dir, f))
-        ]
-        for file_name in pattern_files:
-            pattern = read_dir_pattern(
-                file_name,
-                directory=directory,
-                print_errors=True
-            )
-            result[PATTERNS][file_name] = pattern
-
-    if os.path.exists(recipe_dir):
-        recipe_files = [
-            f for f in os.listdir(recipe_dir)
-            if os.path.isfile(os.path.join(recipe_dir, f))
-        ]
-        for file_name in recipe_files:
-            recipe = read_dir_recipe(
-                file_name,
-                directory=directory,
-                print_errors=True
-            )
-            result[RECIPES][file_name] = recipe
+    to_load = []
+    seen = set()
+    for kind in [PATTERNS, RECIPES]:
+        kind_dir = os.path.join(directory, kind)
+        if not os.path.exists(kind_dir):
+            continue
+        with os.scandir(kind_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                seen.add(entry.path)
+                if cache:
+                    cached = cache.get(entry.path, stat)
+                    if cached is not None:
+                        result[kind][entry.name] = cached
+                        continue
+                to_load.append((kind, entry.name, entry.path, stat))
+
+    parallel = workers > 1 and len(to_load) >= PARALLEL_LOAD_THRESHOLD
+    # Objects sent between processes are pickled anyway, so are kept pickled
+    # for the cache
+    serialise = parallel or cache is not None
+    arguments = (
+        [kind for kind, _, _, _ in to_load],
+        [path for _, _, path, _ in to_load],
+        [serialise] * len(to_load),
+        [catch] * len(to_load)
+    )
+    if parallel:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            loaded = list(executor.map(
+                _load_file,
+                *arguments,
+                chunksize=max(1, len(to_load) // (workers * 4))
+            ))
+    else:
+        loaded = list(map(_load_file, *arguments))
+
+    for (kind, name, path, stat), (data, error) in zip(to_load, loaded):
+        if error:
+            result[LOAD_ERRORS][path] = error
+            continue
+        if cache is not None:
+            cache.put(path, stat, data)
+        result[kind][name] = pickle.loads(data) if serialise else data
+
+    if cache is not None:
+        cache.prune(seen)
 
     return result
 
 
+def read_dir(directory=DEFAULT_MEOW_IMPORT_EXPORT_DIR, workers=1, cache=None):
+    """
+    Reads in MEOW Patterns and Recipes from yaml files, contained in a local
+    directory. This expects there to be two directories within the given
+    directory, one containing the Patterns and another containing the Recipes.
+    An exception is raised for the first file that cannot be read. Use
+    load_dir to instead have every unreadable file reported.
+
+    :param directory: (str) The directory to read from. Default is
+    'meow_directory'.
+
+    :param workers: (int)[optional] The most processes to read files with.
+    Default is 1, reading every file in this process.
+
+    :param cache: (LoadCache)[optional] Cache of previously read files.
+    Default is None.
+
+    :return: (dict) A dict of Patterns and Recipe objects.
+    """
+    result = _load_dir(directory, workers, cache, False)
+    result.pop(LOAD_ERRORS)
+    return result
+
+
 def write_dir(patterns, recipes, directory=DEFAULT_MEOW_IMPORT_EXPORT_DIR):
     """
     Saves the given patterns and recipes in the given directory.
@@ -318,7 +670,8 @@ def read_dir_recipe(recipe_name, directory=DEFAULT_MEOW_IMPORT_EXPORT_DIR,
     return read_recipe(os.path.join(recipe_dir, recipe_name))
 
 
-def write_dir_pattern(pattern, directory=DEFAULT_MEOW_IMPORT_EXPORT_DIR):
+def write_dir_pattern(pattern, directory=DEFAULT_MEOW_IMPORT_EXPORT_DIR,
+                      trusted=False):
     """
     Saves a given pattern locally.
 
@@ -326,26 +679,31 @@ def write_dir_pattern(pattern, directory=DEFAULT_MEOW_IMPORT_EXPORT_DIR):
 
     :param directory: (str) The directory to write the Pattern to.
 
+    :param trusted: (bool)[optional] If True, the pattern is taken as having
+    already been checked and is not checked again. Default is False.
+
     :return: (str) The path written to.
     """
-    valid, feedback = is_valid_pattern_object(pattern, integrity=True)
+    if not trusted:
+        valid, feedback = is_valid_pattern_object(pattern, integrity=True)
 
-    if not valid:
-        msg = "Could not export %s %s. %s" \
-              % (PATTERN_NAME, pattern.name, feedback)
-        raise ValueError(msg)
+        if not valid:
+            msg = "Could not export %s %s. %s" \
+                  % (PATTERN_NAME, pattern.name, feedback)
+            raise ValueError(msg)
 
     dir_exists(directory, create=True)
     pattern_dir = os.path.join(directory, PATTERNS)
     dir_exists(pattern_dir, create=True)
 
     pattern_file_path = os.path.join(pattern_dir, pattern.name)
-    write_pattern(pattern, path=pattern_file_path)
+    write_pattern(pattern, path=pattern_file_path, trusted=True)
 
     return pattern_file_path
 
 
-def write_dir_recipe(recipe, directory=DEFAULT_MEOW_IMPORT_EXPORT_DIR):
+def write_dir_recipe(recipe, directory=DEFAULT_MEOW_IMPORT_EXPORT_DIR,
+                     trusted=False):
     """
     Saves a given recipe locally.
 
@@ -353,21 +711,26 @@ def write_dir_recipe(recipe, directory=DEFAULT_MEOW_IMPORT_EXPORT_DIR):
 
     :param directory: (str) The directory to write the Recipe to.
 
+    :param trusted: (bool)[optional] If True, the recipe is taken as having
+    already been checked and is not checked again. Default is False.
+
     :return: (str) The path written to.
     """
-    valid, feedback = is_valid_recipe_dict(recipe)
-    dir_exists(directory, create=True)
+    if not trusted:
+        valid, feedback = is_valid_recipe_dict(recipe)
 
-    if not valid:
-        msg = "Could not export %s %s. %s" \
-              % (RECIPE_NAME, recipe['NAME'], feedback)
-        raise ValueError(msg)
+        if not valid:
+            msg = "Could not export %s %s. %s" \
+                  % (RECIPE_NAME, recipe['NAME'], feedback)
+            raise ValueError(msg)
+
+    dir_exists(directory, create=True)
 
     recipe_dir = os.path.join(directory, RECIPES)
     dir_exists(recipe_dir, create=True)
 
     recipe_file_path = os.path.join(recipe_dir, recipe[NAME])
-    write_recipe(recipe, path=recipe_file_path)
+    write_recipe(recipe, path=recipe_file_path, trusted=True)
 
     return recipe_file_path
 
@@ -472,13 +835,14 @@ def read_recipe(recipe_path, print_errors=False):
             raise Exception(msg)
 
 
-def write_pattern(pattern, path=None):
-    valid, feedback = is_valid_pattern_object(pattern, integrity=True)
+def write_pattern(pattern, path=None, trusted=False):
+    if not trusted:
+        valid, feedback = is_valid_pattern_object(pattern, integrity=True)
 
-    if not valid:
-        msg = "Could not export %s %s. %s" \
-              % (PATTERN_NAME, pattern.name, feedback)
-        raise ValueError(msg)
+        if not valid:
+            msg = "Could not export %s %s. %s" \
+                  % (PATTERN_NAME, pattern.name, feedback)
+            raise ValueError(msg)
 
     if path:
         pattern_file_path = path
@@ -488,12 +852,13 @@ def write_pattern(pattern, path=None):
     write_yaml(pattern_yaml, pattern_file_path)
 
 
-def write_recipe(recipe, path=None):
-    valid, feedback = is_valid_recipe_dict(recipe)
-    if not valid:
-        msg = "Could not export %s %s. %s" \
-              % (RECIPE_NAME, recipe['NAME'], feedback)
-        raise ValueError(msg)
+def write_recipe(recipe, path=None, trusted=False):
+    if not trusted:
+        valid, feedback = is_valid_recipe_dict(recipe)
+        if not valid:
+            msg = "Could not export %s %s. %s" \
+                  % (RECIPE_NAME, recipe['NAME'], feedback)
+            raise ValueError(msg)
 
     if path:
         recipe_file_path = path
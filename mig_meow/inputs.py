@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import threading
+
+from .constants import NAME, RECIPE
+from .fileio import patten_to_yaml_dict
+from .notebooks import RECIPE_HASH, notebook_digest
+
+INPUT_INDEX_FILE = '.input_index.jsonl'
+
+INPUT_RULE = 'rule'
+INPUT_PATH = 'path'
+INPUT_SIZE = 'size'
+INPUT_MTIME = 'mtime'
+INPUT_HASH = 'hash'
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def get_rule_key(pattern, recipe, path):
+    """
+    Gets a key identifying a rule across runner restarts. Rule ids are
+    generated anew each time a rule is created, so cannot be used for this.
+    The key will differ if any part of the pattern or recipe differs, so
+    inputs are not skipped when what would be done with them has changed.
+
+    :param pattern: (Pattern) The rule's pattern.
+
+    :param recipe: (dict) The rule's recipe. This may refer to its notebook
+    by hash, as done by NotebookStore.slim_recipe, and will give the same key
+    as when it contains the notebook.
+
+    :param path: (str) The rule's trigger path.
+
+    :return: (str) A hex digest identifying the rule.
+    """
+    if RECIPE_HASH in recipe:
+        recipe_digest = recipe[RECIPE_HASH]
+    else:
+        recipe_digest = notebook_digest(recipe[RECIPE])
+    definition = json.dumps(
+        [
+            pattern.name,
+            patten_to_yaml_dict(pattern),
+            recipe[NAME],
+            recipe_digest,
+            path
+        ],
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha1(definition.encode()).hexdigest()
+
+
+def hash_file(path):
+    """
+    Gets a hash of a file's contents.
+
+    :param path: (str) The file to hash.
+
+    :return: (str) A hex digest of the file contents.
+    """
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(HASH_BLOCK_SIZE), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class InputIndex:
+    """
+    Persistent record of which inputs have already been successfully
+    processed by which rules, along with the state of each input when it was
+    processed. This allows a runner to skip inputs that have not changed,
+    for instance when retroactively scanning for inputs after a restart.
+
+    Records are appended to a file as they are made, so that the file never
+    has to be rewritten as it grows. Earlier records for the same rule and
+    input are superseded by later ones, and are dropped when the index is
+    loaded.
+    """
+    def __init__(self, path=None, hash_inputs=False):
+        """
+        Constructor for an InputIndex. Any existing records at path are
+        loaded.
+
+        :param path: (str)[optional] File to persist the index to. If not
+        provided the index is kept only in memory.
+
+        :param hash_inputs: (bool)[optional] If True, the contents of inputs
+        are hashed when recorded. An input whose modification time has
+        changed but whose contents have not will then still be skipped.
+        Default is False.
+        """
+        self.path = path
+        self.hash_inputs = hash_inputs
+        self._entries = {}
+        # Inputs may be checked, and so recorded, from several threads
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """
+        Loads records from the index file, compacting the file if it
+        contains many superseded records.
+
+        :return: No return.
+        """
+        if not os.path.exists(self.path):
+            return
+        lines = 0
+        with open(self.path, 'r') as index_file:
+            for line in index_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Could be a partial write from a runner that was killed
+                    continue
+                lines += 1
+                self._entries[(entry[INPUT_RULE], entry[INPUT_PATH])] = (
+                    entry[INPUT_SIZE],
+                    entry[INPUT_MTIME],
+                    entry.get(INPUT_HASH, None)
+                )
+        if lines > 2 * len(self._entries):
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the index file to hold only the current record for each
+        rule and input.
+
+        :return: No return.
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as index_file:
+            for (rule_key, path), state in self._entries.items():
+                index_file.write(self._to_line(rule_key, path, state))
+        os.replace(tmp_path, self.path)
+
+    def _to_line(self, rule_key, path, state):
+        size, mtime, content_hash = state
+        entry = {
+            INPUT_RULE: rule_key,
+            INPUT_PATH: path,
+            INPUT_SIZE: size,
+            INPUT_MTIME: mtime
+        }
+        if content_hash:
+            entry[INPUT_HASH] = content_hash
+        return json.dumps(entry) + '\n'
+
+    def get_state(self, full_path):
+        """
+        Gets the current state of an input.
+
+        :param full_path: (str) Path to the input.
+
+        :return: (Tuple(int, int, str)) The size, modification time in
+        nanoseconds, and content hash of the input. The hash is None unless
+        hash_inputs is set. Returns None if the input cannot be read.
+        """
+        try:
+            stats = os.stat(full_path)
+            if not os.path.isfile(full_path):
+                return None
+            content_hash = None
+            if self.hash_inputs:
+                content_hash = hash_file(full_path)
+        except OSError:
+            return None
+        return stats.st_size, stats.st_mtime_ns, content_hash
+
+    def is_unchanged(self, rule_key, path, full_path):
+        """
+        Checks if an input has already been processed by a rule, and is
+        unchanged since.
+
+        :param rule_key: (str) Key of the rule, from get_rule_key.
+
+        :param path: (str) Path of the input, relative to the vgrid.
+
+        :param full_path: (str) Path to the input.
+
+        :return: (bool) True if the input was processed and has not changed,
+        False otherwise. If only found to be unchanged by hashing it, the
+        input's new modification time is recorded.
+        """
+        entry = self._entries.get((rule_key, path), None)
+        if not entry:
+            return False
+        size, mtime, content_hash = entry
+        try:
+            stats = os.stat(full_path)
+        except OSError:
+            return False
+        if stats.st_size != size:
+            return False
+        if stats.st_mtime_ns == mtime:
+            return True
+        # Only now is it worth reading the whole file
+        if self.hash_inputs and content_hash:
+            try:
+                if hash_file(full_path) != content_hash:
+                    return False
+            except OSError:
+                return False
+            # Recorded so the file need not be read again until it is next
+            # modified.
+            self.record(
+                rule_key,
+                path,
+                (stats.st_size, stats.st_mtime_ns, content_hash)
+            )
+            return True
+        return False
+
+    def record(self, rule_key, path, state):
+        """
+        Records that an input has been processed by a rule.
+
+        :param rule_key: (str) Key of the rule, from get_rule_key.
+
+        :param path: (str) Path of the input, relative to the vgrid.
+
+        :param state: (Tuple(int, int, str)) The state of the input when it
+        was processed, from get_state.
+
+        :return: No return.
+        """
+        with self._lock:
+            self._entries[(rule_key, path)] = state
+            if not self.path:
+                return
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                return
+            with open(self.path, 'a') as index_file:
+                index_file.write(self._to_line(rule_key, path, state))
@@ -0,0 +1,353 @@
+import json
+import os
+import threading
+
+from datetime import datetime
+
+from .constants import QUEUED, RUNNING, DONE, FAILED, JOB_STATES, JOB_ID, \
+    JOB_PATTERN, JOB_RECIPE, JOB_RULE, JOB_PATH, JOB_STATUS, \
+    JOB_CREATE_TIME, JOB_START_TIME, JOB_END_TIME, JOB_ERROR
+
+JOB_TABLE_FILE = '.job_table.json'
+
+
+class JobRecord:
+    """
+    Compact record of a single job as tracked by the workflow runner
+    administrator. Slots are used as a runner may track a great many of
+    these at once.
+    """
+    __slots__ = (
+        'job_id',
+        'pattern',
+        'recipe',
+        'rule',
+        'path',
+        'status',
+        'create_time',
+        'start_time',
+        'end_time',
+        'error'
+    )
+
+    def __init__(self, job_id, pattern, recipe, rule, path,
+                 create_time=None):
+        """
+        Constructor for a JobRecord. New records are always queued.
+
+        :param job_id: (str) The unique id of the job.
+
+        :param pattern: (str) Name of the pattern that created the job.
+
+        :param recipe: (str) Name of the recipe that the job runs.
+
+        :param rule: (str) Id of the rule that scheduled the job.
+
+        :param path: (str) Path of the file that triggered the job.
+
+        :param create_time: (datetime)[optional] When the job was created.
+        Defaults to now.
+        """
+        self.job_id = job_id
+        self.pattern = pattern
+        self.recipe = recipe
+        self.rule = rule
+        self.path = path
+        self.status = QUEUED
+        if create_time is None:
+            create_time = datetime.now()
+        self.create_time = create_time
+        self.start_time = None
+        self.end_time = None
+        self.error = None
+
+    def to_dict(self):
+        """
+        Expresses this record as a dict, using the same keys as the job meta
+        file.
+
+        :return: (dict) The job record as a dict.
+        """
+        return {
+            JOB_ID: self.job_id,
+            JOB_PATTERN: self.pattern,
+            JOB_RECIPE: self.recipe,
+            JOB_RULE: self.rule,
+            JOB_PATH: self.path,
+            JOB_STATUS: self.status,
+            JOB_CREATE_TIME: self.create_time,
+            JOB_START_TIME: self.start_time,
+            JOB_END_TIME: self.end_time,
+            JOB_ERROR: self.error
+        }
+
+
+class JobTable:
+    """
+    In memory table of all jobs known to a workflow runner. Jobs are indexed
+    by both status and pattern so that either may be queried without
+    inspecting every job. The table can optionally be written to disk
+    periodically by a background thread, so that the runner itself never
+    waits on file IO to record a state change.
+    """
+    def __init__(self, flush_path=None, flush_interval=1):
+        """
+        Constructor for a JobTable.
+
+        :param flush_path: (str)[optional] Path to periodically write the
+        table to. If not provided the table is kept only in memory.
+
+        :param flush_interval: (int or float)[optional] Number of seconds
+        between writes to flush_path. Default is 1.
+        """
+        self._records = {}
+        self._by_status = {state: {} for state in JOB_STATES}
+        self._by_pattern = {}
+        self._pattern_counts = {}
+        self._lock = threading.Lock()
+        # Count of changes made, and the count as of the last write, so that
+        # changes made during a write are not lost
+        self._changes = 0
+        self._flushed_changes = 0
+        self._stop_flushing = threading.Event()
+        self._flush_thread = None
+        self.flush_path = flush_path
+        self.flush_interval = flush_interval
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, job_id):
+        return job_id in self._records
+
+    def __iter__(self):
+        return iter(list(self._records))
+
+    def _update_counts(self, pattern, status, change):
+        if pattern not in self._pattern_counts:
+            self._pattern_counts[pattern] = {state: 0 for state in JOB_STATES}
+        self._pattern_counts[pattern][status] += change
+
+    def add(self, job_id, pattern, recipe, rule, path, create_time=None):
+        """
+        Adds a newly queued job to the table.
+
+        :param job_id: (str) The unique id of the job.
+
+        :param pattern: (str) Name of the pattern that created the job.
+
+        :param recipe: (str) Name of the recipe that the job runs.
+
+        :param rule: (str) Id of the rule that scheduled the job.
+
+        :param path: (str) Path of the file that triggered the job.
+
+        :param create_time: (datetime)[optional] When the job was created.
+
+        :return: (JobRecord) The new job record.
+        """
+        record = JobRecord(
+            job_id, pattern, recipe, rule, path, create_time=create_time)
+        with self._lock:
+            self._records[job_id] = record
+            self._by_status[QUEUED][job_id] = None
+            if pattern not in self._by_pattern:
+                self._by_pattern[pattern] = {}
+            self._by_pattern[pattern][job_id] = None
+            self._update_counts(pattern, QUEUED, 1)
+            self._changes += 1
+        return record
+
+    def update(self, job_id, status, error=None):
+        """
+        Records a change in state of a job. Start and end times are noted as
+        the job moves into running, done or failed.
+
+        :param job_id: (str) The id of the job to update.
+
+        :param status: (str) The new status of the job. Must be one of
+        JOB_STATES.
+
+        :param error: (str)[optional] Any error message explaining a failed
+        job.
+
+        :return: (bool) True if the job was updated, False if the job or
+        status is not known.
+        """
+        if job_id not in self._records or status not in JOB_STATES:
+            return False
+        with self._lock:
+            record = self._records[job_id]
+            del self._by_status[record.status][job_id]
+            self._update_counts(record.pattern, record.status, -1)
+            record.status = status
+            self._by_status[status][job_id] = None
+            self._update_counts(record.pattern, status, 1)
+            if status == RUNNING:
+                record.start_time = datetime.now()
+            elif status in [DONE, FAILED]:
+                record.end_time = datetime.now()
+            if error is not None:
+                record.error = error
+            self._changes += 1
+        return True
+
+    def remove(self, job_id):
+        """
+        Removes a job from the table entirely.
+
+        :param job_id: (str) The id of the job to remove.
+
+        :return: (bool) True if the job was removed, False if it was not in
+        the table.
+        """
+        if job_id not in self._records:
+            return False
+        with self._lock:
+            record = self._records.pop(job_id)
+            del self._by_status[record.status][job_id]
+            del self._by_pattern[record.pattern][job_id]
+            if not self._by_pattern[record.pattern]:
+                del self._by_pattern[record.pattern]
+            self._update_counts(record.pattern, record.status, -1)
+            if not any(self._pattern_counts[record.pattern].values()):
+                del self._pattern_counts[record.pattern]
+            self._changes += 1
+        return True
+
+    def get(self, job_id):
+        """
+        Gets the record of a single job.
+
+        :param job_id: (str) The id of the job.
+
+        :return: (JobRecord) The job record, or None if no such job exists.
+        """
+        return self._records.get(job_id, None)
+
+    def ids(self, status=None, pattern=None):
+        """
+        Gets the ids of jobs in the table, in the order they were added.
+
+        :param status: (str)[optional] If provided, only jobs with this
+        status are returned.
+
+        :param pattern: (str)[optional] If provided, only jobs created by
+        this pattern are returned.
+
+        :return: (list) A list of job ids.
+        """
+        if status is None and pattern is None:
+            return list(self._records)
+        if status is not None and pattern is not None:
+            by_pattern = self._by_pattern.get(pattern, {})
+            return [job_id for job_id in self._by_status.get(status, {})
+                    if job_id in by_pattern]
+        if status is not None:
+            return list(self._by_status.get(status, {}))
+        return list(self._by_pattern.get(pattern, {}))
+
+    def count(self, status):
+        """
+        Gets the number of jobs with a given status.
+
+        :param status: (str) The status to count.
+
+        :return: (int) The number of jobs with status.
+        """
+        return len(self._by_status.get(status, {}))
+
+    def counts(self):
+        """
+        Gets the number of jobs in each state.
+
+        :return: (dict) A dict of states to job counts.
+        """
+        return {state: len(self._by_status[state]) for state in JOB_STATES}
+
+    def pattern_counts(self):
+        """
+        Gets the number of jobs in each state, for each pattern.
+
+        :return: (dict) A dict of pattern names to dicts of states to job
+        counts. This is a copy, so is not changed by later updates.
+        """
+        with self._lock:
+            return {pattern: dict(counts)
+                    for pattern, counts in self._pattern_counts.items()}
+
+    def snapshot(self):
+        """
+        Gets a copy of every record in the table as a list of dicts.
+
+        :return: (list) A list of job dicts, as produced by
+        JobRecord.to_dict.
+        """
+        with self._lock:
+            return [record.to_dict() for record in self._records.values()]
+
+    def flush(self):
+        """
+        Writes the current table to flush_path, if the table has changed
+        since the last write. The file is replaced atomically so that it is
+        never seen partially written.
+
+        :return: (bool) True if the table was written, False otherwise.
+        """
+        if not self.flush_path or self._changes == self._flushed_changes:
+            return False
+        directory = os.path.dirname(self.flush_path)
+        if directory and not os.path.isdir(directory):
+            return False
+        changes = self._changes
+        records = self.snapshot()
+        tmp_path = self.flush_path + '.tmp'
+        with open(tmp_path, 'w') as table_file:
+            json.dump(records, table_file, default=str)
+        os.replace(tmp_path, self.flush_path)
+        # Only marked as written once the write has succeeded
+        self._flushed_changes = changes
+        return True
+
+    def _flush_loop(self):
+        while not self._stop_flushing.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError:
+                # Directory may have been removed underneath us. Try again
+                # next time.
+                pass
+
+    def start_flushing(self):
+        """
+        Starts a background thread periodically writing the table to
+        flush_path.
+
+        :return: No return.
+        """
+        if not self.flush_path or self._flush_thread:
+            return
+        self._stop_flushing.clear()
+        self._flush_thread = threading.Thread(
+            target=self._flush_loop,
+            daemon=True
+        )
+        self._flush_thread.start()
+
+    def stop_flushing(self, remove=False):
+        """
+        Stops any background thread writing the table to disk.
+
+        :param remove: (bool)[optional] If True, any table file that has
+        already been written is deleted. Default is False.
+
+        :return: No return.
+        """
+        if self._flush_thread:
+            self._stop_flushing.set()
+            self._flush_thread.join()
+            self._flush_thread = None
+        if remove and self.flush_path:
+            for path in [self.flush_path, self.flush_path + '.tmp']:
+                if os.path.exists(path):
+                    os.remove(path)
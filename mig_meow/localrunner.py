@@ -2,45 +2,57 @@
 # This code is heavily based off the 'mig/server/grid_events.py' file
 # contained in the MiG source code at: https://sourceforge.net/projects/migrid/
 
-import copy
-import glob
 import os
+import posixpath
 import time
-import re
-import fnmatch
+import shlex
 import shutil
-import socket
 import subprocess
 import stat
 import threading
-import paramiko
-import pkg_resources
 
-from cryptography.hazmat.primitives import serialization as cryptography_serialisation
-from cryptography.hazmat.primitives.asymmetric import rsa
-from cryptography.hazmat.backends import default_backend as cryptography_default_backend
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from multiprocessing import Process, Pipe, current_process
-from multiprocessing.connection import wait
 from random import SystemRandom
+from types import SimpleNamespace
 from watchdog.observers import Observer
 from watchdog.events import PatternMatchingEventHandler, FileCreatedEvent, \
     FileModifiedEvent, FileDeletedEvent, DirCreatedEvent, DirModifiedEvent, \
     DirDeletedEvent
 
 from .constants import PATTERNS, RECIPES, NAME, SOURCE, CHAR_LOWERCASE, \
-    CHAR_UPPERCASE, CHAR_NUMERIC, RECIPE, KEYWORD_DIR, KEYWORD_EXTENSION, \
+    CHAR_UPPERCASE, CHAR_NUMERIC, KEYWORD_DIR, KEYWORD_EXTENSION, \
     KEYWORD_FILENAME, KEYWORD_JOB, KEYWORD_PATH, KEYWORD_PREFIX, \
-    KEYWORD_REL_DIR, KEYWORD_REL_PATH, KEYWORD_VGRID, VGRID, ENVIRONMENTS
+    KEYWORD_REL_DIR, KEYWORD_REL_PATH, KEYWORD_VGRID, VGRID, ENVIRONMENTS, \
+    QUEUED, RUNNING, FAILED, DONE, JOB_ID, JOB_PATTERN, JOB_RECIPE, JOB_RULE, \
+    JOB_PATH, JOB_STATUS, JOB_CREATE_TIME, JOB_START_TIME, JOB_END_TIME, \
+    JOB_ERROR, JOB_REQUIREMENTS, JOB_OUTPUTS, JOB_STATES, RETENTION_ARCHIVE, \
+    RULE_ID, RULE_PATH, RULE_PATTERN, RULE_RECIPE, JOB_TRANSITION
+from .environment import get_environment_fingerprint, RequirementMatcher
+from .jobs import JobTable, JOB_TABLE_FILE
+from .remote import SSHConnection, INPUT_CACHE_DIR, read_archive
+from .notebooks import NotebookStore, NOTEBOOK_STORE_DIR, RECIPE_HASH
 from .logging import create_localrunner_logfile, write_to_log
 from .fileio import write_dir_pattern, write_dir_recipe, make_dir, \
-    read_dir_recipe, read_dir_pattern, write_notebook, write_yaml, read_yaml, \
-    delete_dir_pattern, delete_dir_recipe, rmtree
-from .meow import get_parameter_sweep_values, is_valid_pattern_object, Pattern
+    read_dir_recipe, read_dir_pattern, write_yaml, read_yaml, \
+    delete_dir_pattern, delete_dir_recipe, rmtrees_detached, move_to_trash
+from .events import InotifyObserver, is_inotify_available, \
+    EVENT_SOURCE_WATCHDOG, EVENT_SOURCE_INOTIFY, EVENT_SOURCES, \
+    WRITE_COMPLETE, QUEUE_OVERFLOW
+from .inputs import InputIndex, get_rule_key, hash_file, INPUT_INDEX_FILE
+from .ringbuffer import wait, RingPipe, TRANSPORT_PIPE, \
+    TRANSPORT_SHARED_MEMORY, TRANSPORTS
+from .rules import RuleIndex, SCAN_DONE
+from .retention import select_expired_jobs, retire_jobs, \
+    get_retention_interval
+from .meow import ParameterSweep, is_valid_pattern_object, Pattern
 from .validation import valid_dir_path, check_input, is_valid_recipe_dict, \
-    is_valid_local_environment, valid_runner_workers, is_valid_ssh_worker
+    is_valid_local_environment, valid_runner_workers, is_valid_ssh_worker, \
+    is_valid_retention_dict
 
 _trigger_event = '_trigger_event'
+_rule_ids = '_rule_ids'
 
 RUNNER_DATA = '.workflow_runner_data'
 OUTPUT_DATA = 'job_output'
@@ -54,10 +66,6 @@ OP_EVENT = 'Event'
 
 LOGGER = 'logger'
 RULES = 'rules'
-RULE_ID = 'id'
-RULE_PATH = 'path'
-RULE_PATTERN = 'pattern'
-RULE_RECIPE = 'recipe'
 ADMIN = 'admin'
 MONITOR = 'monitor'
 WORKERS = 'workers'
@@ -69,22 +77,32 @@ OUTPUT_DIR = 'output_dir'
 RETRO_ACTIVE = 'retro'
 PRINT = 'print'
 
-QUEUED = 'queued'
-RUNNING = 'running'
-FAILED = 'failed'
-DONE = 'done'
-
-JOB_ID = 'id'
-JOB_PATTERN = 'pattern'
-JOB_RECIPE = 'recipe'
-JOB_RULE = 'rule'
-JOB_PATH = 'path'
-JOB_STATUS = 'status'
-JOB_CREATE_TIME = 'create'
-JOB_START_TIME = 'start'
-JOB_END_TIME = 'end'
-JOB_ERROR = 'error'
-JOB_REQUIREMENTS = 'requirements'
+# Seconds a gracefully stopping runner waits for its processes to finish
+STOP_TIMEOUT = 5
+
+# When file events trigger jobs. See LocalWorkflowFileMonitor.
+TRIGGER_MODIFIED = 'modified'
+TRIGGER_CLOSED = 'closed'
+TRIGGER_QUIET = 'quiet'
+TRIGGER_EVENT_TYPES = {
+    TRIGGER_MODIFIED: ['created', 'modified'],
+    TRIGGER_CLOSED: ['closed'],
+    TRIGGER_QUIET: ['created', 'modified', 'closed']
+}
+TRIGGER_MODES = list(TRIGGER_EVENT_TYPES)
+DEFAULT_QUIET_PERIOD = 2
+# Seconds the state monitor waits for a burst of edits to a pattern or recipe
+# file to end before reading it. See LocalWorkflowStateMonitor.
+STATE_DEBOUNCE_PERIOD = 0.1
+
+STATS_TOTAL = 'total'
+STATS_PATTERNS = 'patterns'
+INPUT_STATE = 'state'
+# Status of a message passed back to the administrator once an input has
+# been hashed, alongside those of retroactive scans.
+INPUT_HASHED = 'hashed'
+# Most threads hashing inputs at once, when inputs are hashed
+INPUT_HASH_WORKERS = min(4, os.cpu_count() or 1)
 
 META_FILE = 'job.yml'
 BASE_FILE = 'base.ipynb'
@@ -92,6 +110,34 @@ PARAMS_FILE = 'params.yml'
 JOB_FILE = 'job.ipynb'
 RESULT_FILE = 'result.ipynb'
 
+# Requests that can be made of the administrator, either individually or as
+# part of a batch.
+USER_OPERATIONS = [
+    'start_workers',
+    'stop_workers',
+    'check_running_status',
+    'get_running_status',
+    'stop_runner',
+    'get_all_jobs',
+    'get_queued_jobs',
+    'get_all_input_paths',
+    'check_status',
+    'add_pattern',
+    'modify_pattern',
+    'remove_pattern',
+    'add_recipe',
+    'modify_recipe',
+    'remove_recipe',
+    'check_recipes',
+    'check_patterns',
+    'check_rules',
+    'check_jobs',
+    'check_queue',
+    'get_stats',
+    'get_jobs',
+    'apply_retention'
+]
+
 
 def get_runner_patterns(runner_data):
     return os.path.join(runner_data, PATTERNS)
@@ -158,6 +204,58 @@ def replace_keywords(old_dict, job_id, src_path, vgrid):
     return new_dict
 
 
+def is_job_transition(message):
+    """
+    Checks if a message passed between runner processes is a job state
+    transition. These are of the form (JOB_TRANSITION, job_id, status), or
+    (JOB_TRANSITION, job_id, status, error) for jobs that have failed.
+
+    :param message: (any) The message to check.
+
+    :return: (bool) True if the message is a job transition, False otherwise.
+    """
+    return isinstance(message, tuple) \
+        and len(message) in [3, 4] \
+        and message[0] == JOB_TRANSITION
+
+
+def get_vgrid_path(src_path, vgrid):
+    """
+    Gets the path of a file event, relative to the vgrid it occurred in.
+
+    :param src_path: (str) The path of the event.
+
+    :param vgrid: (str) The vgrid being monitored.
+
+    :return: (str) The path relative to vgrid.
+    """
+    vgrid_path = src_path.replace(vgrid, '', 1)
+    while vgrid_path.startswith(os.path.sep):
+        vgrid_path = vgrid_path[1:]
+    return vgrid_path
+
+
+def make_channel(transport, rings=None):
+    """
+    Creates a one way channel between runner processes.
+
+    :param transport: (str) Either 'pipe', for a multiprocessing Pipe, or
+    'shared_memory', for a shared memory ring buffer. Ring buffers must only
+    be written to by a single process.
+
+    :param rings: (list)[optional] If provided, any created ring buffer is
+    appended to it, so that it can be unlinked once no longer used.
+
+    :return: (Tuple) The reading and writing ends of the channel.
+    """
+    if transport == TRANSPORT_SHARED_MEMORY:
+        reader, writer = RingPipe()
+        if rings is not None:
+            rings.append(reader.ring)
+        return reader, writer
+    return Pipe(duplex=False)
+
+
 def make_fake_event(path, state, is_directory=False):
     """Create a fake state change event for path. Looks up path to see if the
     change is a directory or file.
@@ -178,21 +276,74 @@ def make_fake_event(path, state, is_directory=False):
     return fake
 
 
-def administrator(
-        from_user, to_user, from_state, from_file, to_queue, from_queue,
-        to_worker_writers, from_worker_readers, to_logger, vgrid, job_data,
-        meow_data, retro_active, workers_start):
+def administrator_roles(
+        to_queue, from_queue, to_worker_writers, from_worker_readers,
+        to_logger, scan_writer, vgrid, job_data, meow_data, retro_active,
+        workers_start, output_data=OUTPUT_DATA, retention=None,
+        skip_unchanged_inputs=False, hash_inputs=False, to_monitor=None,
+        initial_patterns=None, initial_recipes=None):
+    """
+    Sets up the state of a runner administrator, and the handlers for each
+    kind of message it can receive. These are shared by the administrator
+    process and by runners that fill the administrator role some other way.
+
+    :param to_queue: (Connection) Connection to send job ids and requests to
+    the job queue.
+
+    :param from_queue: (Connection) Connection to receive replies and job
+    transitions from the job queue.
+
+    :param to_worker_writers: (list) Connections to send requests to each
+    worker.
+
+    :param from_worker_readers: (list) Connections to receive replies from
+    each worker, in the same order as to_worker_writers.
+
+    :param to_logger: (Connection) Connection to send log messages to.
+
+    :param scan_writer: (Connection) Connection retroactive scans send their
+    matches to, and inputs hashed in the background send their state to.
+    These should be passed to handle_scan_message.
+
+    :param vgrid: (str) The vgrid being monitored.
+
+    :param job_data: (str) Directory jobs are created in.
+
+    :param meow_data: (str) Directory patterns and recipes are stored in.
+
+    :param retro_active: (bool) If True, rules are also applied to files that
+    already exist when they are created.
+
+    :param workers_start: (bool) If True, workers are started immediately.
+
+    :param initial_patterns: (dict)[optional] Patterns to add immediately,
+    rather than waiting for them to be found by the state monitor.
+
+    :param initial_recipes: (dict)[optional] Recipes to add immediately,
+    rather than waiting for them to be found by the state monitor.
+
+    :return: (SimpleNamespace) The message handlers. These are
+    handle_state_message, handle_user_message, handle_event,
+    handle_queue_message and handle_scan_message, along with
+    is_scan_pending, start_retroactive_scan and check_retention for the
+    administrator's own periodic work.
+    """
 
     def add_pattern(pattern):
         op = OP_CREATE
-        if pattern.name in patterns:
-            if patterns[pattern.name] == pattern:
+        existing = patterns.get(pattern.name, None)
+        if existing:
+            if existing == pattern:
                 return
-            else:
+            op = OP_MODIFIED
+        if existing and existing.recipes == pattern.recipes:
+            patterns[pattern.name] = pattern
+            update_pattern_rules(pattern)
+        else:
+            if existing:
                 remove_pattern(pattern.name)
-                op = OP_MODIFIED
-        patterns[pattern.name] = pattern
-        identify_rules(new_pattern=pattern)
+            patterns[pattern.name] = pattern
+            identify_rules(new_pattern=pattern)
         to_logger.send(
             (
                 'administrator.add_pattern',
@@ -201,6 +352,9 @@ def administrator(
         )
 
     def add_recipe(recipe):
+        # Recipes are kept with their notebook stored separately, so that it
+        # is not compared or copied along with the rest of the recipe.
+        recipe = notebooks.slim_recipe(recipe)
         op = OP_CREATE
         if recipe[NAME] in recipes:
             if recipes[recipe[NAME]] == recipe:
@@ -241,6 +395,7 @@ def administrator(
         if recipe_name in recipes:
             recipes.pop(recipe_name)
             remove_rules(deleted_recipe_name=recipe_name)
+            sweep_notebooks()
             to_logger.send(
                 (
                     'administrator.remove_recipe',
@@ -256,6 +411,15 @@ def administrator(
                 )
             )
 
+    def sweep_notebooks():
+        """
+        Removes stored notebooks that no current recipe refers to. Existing
+        jobs are unaffected, as they have their own link to their notebook.
+
+        :return: No return.
+        """
+        notebooks.sweep({recipe[RECIPE_HASH] for recipe in recipes.values()})
+
     def create_new_rule(pattern_name, recipe_name, path):
         rule = {
             RULE_ID: generate_id(),
@@ -264,6 +428,12 @@ def administrator(
             RULE_PATH: path
         }
         rules.append(rule)
+        rule_index.add(rule)
+        rule_keys[rule[RULE_ID]] = get_rule_key(
+            patterns[pattern_name],
+            recipes[recipe_name],
+            path
+        )
 
         to_logger.send(
             (
@@ -273,43 +443,220 @@ def administrator(
             )
         )
 
+        # Existing files are found by a retroactive scan, shared between all
+        # new rules and run in the background.
+        if retro_active:
+            pending_scan_rules.append(rule)
+
+    def update_monitor():
+        """
+        Sends the current rules to the file monitor, so that it can discard
+        events that match no rule without passing them on.
+
+        :return: No return.
+        """
+        if to_monitor:
+            to_monitor.send(list(rules))
+
+    def start_retroactive_scan():
+        """
+        Starts a background scan of the vgrid for existing files matching any
+        rules created since the last scan. The vgrid is walked only once
+        regardless of how many rules are being scanned for, and matches are
+        passed back to the administrator as they are found.
+
+        :return: No return.
+        """
+        scan_index = RuleIndex(pending_scan_rules)
+        del pending_scan_rules[:]
+        scanner = threading.Thread(
+            target=scan_index.scan,
+            args=(vgrid, scan_writer),
+            daemon=True
+        )
+        scanner.start()
+        scanners.append(scanner)
+
+    def handle_scan_message(message):
+        status, matches = message
+        if status == SCAN_DONE:
+            scanners.pop(0).join()
+            return
+        if status == INPUT_HASHED:
+            handle_hashed_input(*matches)
+            return
+
+        for rule_id, path in matches:
+            # Rule may have been removed since the scan started
+            rule = rule_index.get(rule_id)
+            if not rule:
+                continue
+            trigger_path = os.path.join(vgrid, path)
+            local_path = trigger_path[trigger_path.find(os.path.sep)+1:]
+            schedule_rule_jobs(rule, local_path, trigger_path, path)
+
+    def hash_input(rule_id, src_path, trigger_path, input_path, rule_key):
+        """
+        Gets the state of an input, and whether it has changed since last
+        processed. This reads the whole input so is run in the background,
+        with the result sent to the administrator to be passed to
+        handle_hashed_input.
+
+        :param rule_id: (str) Id of the triggered rule.
+
+        :param src_path: (str) The path which generated the triggering event.
+
+        :param trigger_path: (str) The path given to the pattern's trigger
+        file variable.
+
+        :param input_path: (str) The path of the triggering input, relative
+        to the vgrid.
+
+        :param rule_key: (str) Key of the rule, from get_rule_key.
+
+        :return: No return.
+        """
+        full_path = os.path.join(vgrid, input_path)
+        unchanged = input_index.is_unchanged(rule_key, input_path, full_path)
+        input_state = None
+        if not unchanged:
+            input_state = input_index.get_state(full_path)
+        scan_writer.send((
+            INPUT_HASHED,
+            (rule_id, src_path, trigger_path, input_path, unchanged,
+             input_state)
+        ))
+
+    def handle_hashed_input(rule_id, src_path, trigger_path, input_path,
+                            unchanged, input_state):
+        # Rule may have been removed while the input was being hashed
+        rule = rule_index.get(rule_id)
+        if not rule:
+            return
+        if unchanged:
+            log_unchanged_input(rule, input_path)
+            return
+        schedule_rule_jobs(
+            rule, src_path, trigger_path, input_path, hashed_state=input_state)
+
+    def log_unchanged_input(rule, input_path):
+        to_logger.send(
+            (
+                'administrator.schedule_rule_jobs',
+                'Skipping unchanged input %s for rule %s'
+                % (input_path, rule[RULE_ID])
+            )
+        )
+
+    def schedule_rule_jobs(rule, src_path, trigger_path, input_path,
+                           hashed_state=None):
+        """
+        Schedules all jobs for a rule being triggered. This is one job, or
+        one for each value in the pattern's parameter sweep. If the input has
+        already been successfully processed by an identical rule, and has not
+        changed since, then no jobs are scheduled.
+
+        :param rule: (dict) The triggered rule.
+
+        :param src_path: (str) The path which generated the triggering event.
+
+        :param trigger_path: (str) The path given to the pattern's trigger
+        file variable.
+
+        :param input_path: (str) The path of the triggering input, relative
+        to the vgrid.
+
+        :param hashed_state: (tuple)[optional] State of the input, if it has
+        already been hashed and found to have changed.
+
+        :return: No return.
+        """
+        input_state = hashed_state
+        if input_index is not None and input_state is None:
+            rule_key = rule_keys[rule[RULE_ID]]
+            # Hashing reads the whole input, so is done in the background
+            # rather than holding up the administrator.
+            if input_index.hash_inputs:
+                if not hashers:
+                    hashers.append(ThreadPoolExecutor(
+                        max_workers=INPUT_HASH_WORKERS))
+                hashers[0].submit(
+                    hash_input,
+                    rule[RULE_ID],
+                    src_path,
+                    trigger_path,
+                    input_path,
+                    rule_key
+                )
+                return
+            full_path = os.path.join(vgrid, input_path)
+            if input_index.is_unchanged(rule_key, input_path, full_path):
+                log_unchanged_input(rule, input_path)
+                return
+            input_state = input_index.get_state(full_path)
+
         pattern = patterns[rule[RULE_PATTERN]]
+        scheduled = []
 
         yaml_dict = {}
         for var, val in pattern.variables.items():
             yaml_dict[var] = val
         for var, val in pattern.outputs.items():
             yaml_dict[var] = val
-        yaml_dict[pattern.trigger_file] = path
-
-        if retro_active:
-            testing_path = os.path.join(vgrid, path)
-
-            globbed = glob.glob(testing_path)
-
-            for globble in globbed:
-                yaml_dict[pattern.trigger_file] = globble
-
-                local_path = globble[globble.find(os.path.sep)+1:]
-
-                if not pattern.sweep:
-                    schedule_job(
+        yaml_dict[pattern.trigger_file] = trigger_path
+
+        if not pattern.sweep:
+            scheduled.append(schedule_job(
+                rule,
+                src_path,
+                yaml_dict
+            ))
+        else:
+            for var, val in pattern.sweep.items():
+                sweep = ParameterSweep(val)
+                # Each job is given a list of consecutive sweep values
+                if pattern.chunk_size:
+                    values = sweep.chunks(pattern.chunk_size)
+                else:
+                    values = sweep
+                for value in values:
+                    yaml_dict[var] = value
+                    scheduled.append(schedule_job(
                         rule,
-                        local_path,
+                        src_path,
                         yaml_dict
-                    )
-                else:
-                    for var, val in pattern.sweep.items():
-                        values = get_parameter_sweep_values(val)
-                        for value in values:
-                            yaml_dict[var] = value
-                            schedule_job(
-                                rule,
-                                local_path,
-                                yaml_dict
-                            )
+                    ))
+
+        # Input is only recorded as processed once all of its jobs are done
+        if input_state:
+            input_key = (rule_keys[rule[RULE_ID]], input_path)
+            pending_inputs[input_key] = {
+                INPUT_STATE: input_state,
+                JOBS: set(scheduled),
+                FAILED: False
+            }
+            for job_id in scheduled:
+                job_inputs[job_id] = input_key
+
+    def update_processed_inputs(job_id, status):
+        if job_id not in job_inputs or status not in [DONE, FAILED]:
+            return
+        input_key = job_inputs.pop(job_id)
+        pending = pending_inputs.get(input_key, None)
+        # Input may have since triggered again, replacing this record
+        if not pending or job_id not in pending[JOBS]:
+            return
+        pending[JOBS].remove(job_id)
+        if status == FAILED:
+            pending[FAILED] = True
+        if not pending[JOBS]:
+            pending_inputs.pop(input_key)
+            if not pending[FAILED]:
+                input_index.record(
+                    input_key[0], input_key[1], pending[INPUT_STATE])
 
     def identify_rules(new_pattern=None, new_recipe=None):
+        created = False
         if new_pattern:
             if len(new_pattern.recipes) > 1:
                 to_logger.send(
@@ -327,6 +674,7 @@ def administrator(
                         recipe_name,
                         input_path
                     )
+                    created = True
 
         if new_recipe:
             for name, pattern in patterns.items():
@@ -346,6 +694,52 @@ def administrator(
                             recipe_name,
                             input_path
                         )
+                        created = True
+
+        # The monitor is sent all rules at once, so only once all are made
+        if created:
+            update_monitor()
+
+    def update_pattern_rules(pattern):
+        """
+        Brings the rules of a modified pattern up to date, where the
+        pattern's recipe has not changed. Rules depend only on the recipe and
+        trigger paths, so rules are only created or removed for trigger paths
+        that have been added or removed, and only added paths are
+        retroactively scanned for. All other rules are kept, along with
+        their ids.
+
+        :param pattern: (Pattern) The modified pattern, already in patterns.
+
+        :return: No return.
+        """
+        recipe_name = pattern.recipes[0]
+        # Without its recipe the pattern has no rules to update
+        if recipe_name not in recipes:
+            return
+        trigger_paths = set(pattern.trigger_paths)
+        kept_paths = set()
+        to_delete = []
+        for rule in rules:
+            if rule[RULE_PATTERN] != pattern.name:
+                continue
+            if rule[RULE_PATH] in trigger_paths \
+                    and rule[RULE_PATH] not in kept_paths:
+                kept_paths.add(rule[RULE_PATH])
+                # Keys cover the whole pattern, so change with it
+                rule_keys[rule[RULE_ID]] = get_rule_key(
+                    pattern, recipes[recipe_name], rule[RULE_PATH])
+            else:
+                to_delete.append(rule)
+        delete_rules(to_delete)
+        created = False
+        for input_path in pattern.trigger_paths:
+            if input_path not in kept_paths:
+                kept_paths.add(input_path)
+                create_new_rule(pattern.name, recipe_name, input_path)
+                created = True
+        if created:
+            update_monitor()
 
     def remove_rules(deleted_pattern_name=None, deleted_recipe_name=None):
         to_delete = []
@@ -356,14 +750,21 @@ def administrator(
             if deleted_recipe_name:
                 if rule[RULE_RECIPE] == deleted_recipe_name:
                     to_delete.append(rule)
+        delete_rules(to_delete)
+
+    def delete_rules(to_delete):
         for delete in to_delete:
             rules.remove(delete)
+            rule_index.remove(delete[RULE_ID])
+            rule_keys.pop(delete[RULE_ID], None)
             to_logger.send(
                 (
                     'administrator.remove_rules',
                     'Removing rule: %s.' % delete
                 )
             )
+        if to_delete:
+            update_monitor()
 
     def schedule_job(rule, src_path, yaml_dict):
         """
@@ -377,7 +778,7 @@ def administrator(
 
         :param yaml_dict: (dict) Any variables to be applied.
 
-        :return: No return.
+        :return: (str) The id of the scheduled job.
         """
         recipe = recipes[rule[RULE_RECIPE]]
 
@@ -405,6 +806,13 @@ def administrator(
             vgrid
         )
 
+        # Recorded so that remote workers know which files the job may write
+        # outside of its job directory.
+        job_dict[JOB_OUTPUTS] = [
+            yaml_dict[var] for var in patterns[rule[RULE_PATTERN]].outputs
+            if isinstance(yaml_dict.get(var), str)
+        ]
+
         job_dir = os.path.join(job_data, job_dict[JOB_ID])
         make_dir(job_dir)
 
@@ -412,12 +820,19 @@ def administrator(
         write_yaml(job_dict, meta_file)
 
         base_file = os.path.join(job_dir, BASE_FILE)
-        write_notebook(recipe[RECIPE], base_file)
+        notebooks.link(recipe[RECIPE_HASH], base_file)
 
         yaml_file = os.path.join(job_dir, PARAMS_FILE)
         write_yaml(yaml_dict, yaml_file)
 
-        jobs.append(job_dict[JOB_ID])
+        jobs.add(
+            job_dict[JOB_ID],
+            rule[RULE_PATTERN],
+            rule[RULE_RECIPE],
+            rule[RULE_ID],
+            src_path,
+            create_time=job_dict[JOB_CREATE_TIME]
+        )
 
         to_queue.send(job_dict[JOB_ID])
 
@@ -428,14 +843,18 @@ def administrator(
                 % (job_dict[JOB_ID], rule[RULE_ID], rule[RULE_PATTERN])
             )
         )
+        return job_dict[JOB_ID]
 
     def handle_event(event):
-        src_path = event.src_path
-        event_type = event.event_type
+        # Monitors with their own copy of the rules send only the event type
+        # and path, along with the ids of the rules they matched.
+        if isinstance(event, tuple):
+            event_type, src_path, rule_ids = event
+        else:
+            event_type, src_path, rule_ids = \
+                event.event_type, event.src_path, None
 
-        handle_path = src_path.replace(vgrid, '', 1)
-        while handle_path.startswith(os.path.sep):
-            handle_path = handle_path[1:]
+        handle_path = get_vgrid_path(src_path, vgrid)
 
         to_logger.send(
             (
@@ -444,47 +863,23 @@ def administrator(
             )
         )
 
-        for rule in rules:
-            target_path = rule[RULE_PATH]
-            recursive_regexp = fnmatch.translate(target_path)
-            direct_regexp = recursive_regexp.replace('.*', '[^/]*')
-            recursive_hit = re.match(recursive_regexp, handle_path)
-            direct_hit = re.match(direct_regexp, handle_path)
-
-            if direct_hit or recursive_hit:
-                pattern = patterns[rule[RULE_PATTERN]]
+        if rule_ids is None:
+            matched = rule_index.match(handle_path)
+        else:
+            # Rules may have been removed since the event was matched
+            matched = [rule_index.get(rule_id) for rule_id in rule_ids
+                       if rule_id in rule_index]
 
-                to_logger.send(
-                    (
-                        'administrator.handle_event',
-                        'Starting new job for %s using rule %s'
-                        % (src_path, rule)
-                    )
+        for rule in matched:
+            to_logger.send(
+                (
+                    'administrator.handle_event',
+                    'Starting new job for %s using rule %s'
+                    % (src_path, rule)
                 )
+            )
 
-                yaml_dict = {}
-                for var, val in pattern.variables.items():
-                    yaml_dict[var] = val
-                for var, val in pattern.outputs.items():
-                    yaml_dict[var] = val
-                yaml_dict[pattern.trigger_file] = src_path
-
-                if not pattern.sweep:
-                    schedule_job(
-                        rule,
-                        src_path,
-                        yaml_dict
-                    )
-                else:
-                    for var, val in pattern.sweep.items():
-                        values = get_parameter_sweep_values(val)
-                        for value in values:
-                            yaml_dict[var] = value
-                            schedule_job(
-                                rule,
-                                src_path,
-                                yaml_dict
-                            )
+            schedule_rule_jobs(rule, src_path, src_path, handle_path)
 
     def start_workers():
         for to_worker in to_worker_writers:
@@ -521,30 +916,157 @@ def administrator(
 
     def stop_runner(clear_jobs=False):
         stop_workers()
-
+        wait_for_retirement()
+        # Inputs still waiting to be hashed would no longer be processed
+        for hasher in hashers:
+            hasher.shutdown(wait=True, cancel_futures=True)
+
+        # Directories are only renamed here, and are deleted by a separate
+        # process so that the runner can stop without waiting on them. Each
+        # is renamed within its own parent directory.
+        trash = []
         if os.path.exists(meow_data) \
                 and os.path.isdir(meow_data) \
                 and meow_data == RUNNER_DATA:
-            rmtree(meow_data)
+            trash.append(move_to_trash(
+                [meow_data],
+                os.path.dirname(os.path.abspath(meow_data))
+            ))
+
+        # Table is no longer needed if the jobs themselves are going.
+        jobs.stop_flushing(remove=clear_jobs)
+        if not clear_jobs:
+            jobs.flush()
 
         if clear_jobs and os.path.exists(job_data):
-            for job in jobs:
-                job_dir = os.path.join(job_data, job)
-                if os.path.exists(job_dir):
-                    rmtree(job_dir)
-            if len(os.listdir(job_data)) == 0:
-                os.rmdir(job_data)
+            job_dirs = [os.path.join(job_data, job) for job in jobs
+                        if os.path.exists(os.path.join(job_data, job))]
+            if os.path.exists(notebooks.directory):
+                job_dirs.append(notebooks.directory)
+            # The job directory goes too if it would otherwise be left empty
+            if len(os.listdir(job_data)) == len(job_dirs):
+                trash.append(move_to_trash(
+                    [job_data],
+                    os.path.dirname(os.path.abspath(job_data))
+                ))
+            elif job_dirs:
+                trash.append(move_to_trash(job_dirs, job_data))
+
+        if trash:
+            rmtrees_detached(trash)
         return True
 
     def get_all_jobs():
-        jobs_queue = copy.deepcopy(jobs)
-        return jobs_queue
+        return jobs.ids()
 
     def get_queued_jobs():
         to_queue.send('get_queue')
-        queue = from_queue.recv()
+        queue = receive_from_queue()
         return queue
 
+    def receive_from_queue():
+        # Job transitions may arrive at any time, so apply any that are
+        # ahead of the expected reply.
+        while True:
+            message = from_queue.recv()
+            if is_job_transition(message):
+                apply_transition(message)
+            else:
+                return message
+
+    def apply_pending_transitions():
+        # Nothing else is sent by the queue unless requested, so anything
+        # waiting is a job transition.
+        while from_queue.poll():
+            message = from_queue.recv()
+            if is_job_transition(message):
+                apply_transition(message)
+
+    def apply_transition(message):
+        error = None
+        if len(message) == 4:
+            error = message[3]
+        jobs.update(message[1], message[2], error=error)
+        update_processed_inputs(message[1], message[2])
+
+    def get_stats():
+        apply_pending_transitions()
+        stats = {
+            STATS_TOTAL: len(jobs),
+            STATS_PATTERNS: jobs.pattern_counts()
+        }
+        stats.update(jobs.counts())
+        return stats
+
+    def get_jobs(query):
+        apply_pending_transitions()
+        status = None
+        pattern = None
+        if query:
+            status = query.get(JOB_STATUS, None)
+            pattern = query.get(JOB_PATTERN, None)
+        return [jobs.get(job_id).to_dict()
+                for job_id in jobs.ids(status=status, pattern=pattern)]
+
+    def apply_retention(wait_for_removal=False):
+        """
+        Removes any finished jobs that should no longer be retained from the
+        job table. Their directories are removed, and archived if requested,
+        in a background thread so that the administrator is not held up.
+
+        :param wait_for_removal: (bool)[optional] If True, waits until the
+        job directories have been removed before returning. Default is
+        False.
+
+        :return: (list) A list of the ids of the removed jobs.
+        """
+        if not retention:
+            return []
+        apply_pending_transitions()
+
+        expired = select_expired_jobs(
+            [jobs.get(job_id) for job_id in jobs.ids()],
+            retention
+        )
+        if not expired:
+            return []
+
+        expired_jobs = [record.to_dict() for record in expired]
+        for job in expired_jobs:
+            jobs.remove(job[JOB_ID])
+
+        # Only one retirement at a time, so the archive index is only
+        # written to by a single thread.
+        wait_for_retirement()
+        retirement = threading.Thread(
+            target=retire_jobs,
+            args=(
+                expired_jobs,
+                job_data,
+                output_data,
+                retention.get(RETENTION_ARCHIVE, False)
+            ),
+            daemon=True
+        )
+        retirement.start()
+        retirements.append(retirement)
+        sweep_notebooks()
+
+        to_logger.send(
+            (
+                'administrator.apply_retention',
+                'Retired %s jobs' % len(expired_jobs)
+            )
+        )
+
+        if wait_for_removal:
+            wait_for_retirement()
+        return [job[JOB_ID] for job in expired_jobs]
+
+    def wait_for_retirement():
+        while retirements:
+            retirements.pop().join()
+
     def get_all_input_paths():
         input_paths = []
         for rule in rules:
@@ -552,8 +1074,9 @@ def administrator(
         return input_paths
 
     def check_status():
-        queued_jobs = len(get_queued_jobs())
-        all_jobs = len(get_all_jobs())
+        apply_pending_transitions()
+        queued_jobs = jobs.count(QUEUED)
+        all_jobs = len(jobs)
         input_paths = get_all_input_paths()
 
         status = "[%s/%s] %s" % (queued_jobs, all_jobs, input_paths)
@@ -642,7 +1165,7 @@ def administrator(
             )
             return False
         else:
-            write_dir_recipe(recipe, directory=meow_data)
+            write_dir_recipe(recipe, directory=meow_data, trusted=True)
 
             to_logger.send(
                 (
@@ -663,7 +1186,7 @@ def administrator(
             )
             return False
         else:
-            write_dir_recipe(recipe, directory=meow_data)
+            write_dir_recipe(recipe, directory=meow_data, trusted=True)
 
             to_logger.send(
                 (
@@ -698,162 +1221,300 @@ def administrator(
         return True
 
     def check_recipes():
-        recipes_dict = copy.deepcopy(recipes)
-        return recipes_dict
+        return {name: notebooks.expand_recipe(recipe)
+                for name, recipe in recipes.items()}
 
     def check_patterns():
-        patterns_dict = copy.deepcopy(patterns)
-        return patterns_dict
+        return patterns
 
     def check_rules():
-        rules_list = copy.deepcopy(rules)
-        return rules_list
+        return rules
 
     def check_jobs():
-        jobs_list = copy.deepcopy(jobs)
-        return jobs_list
+        return jobs.ids()
 
     def check_queue():
         return get_queued_jobs()
 
-    # Start of administrator
+    def handle_user_request(operation, args):
+        """
+        Performs a single user request. Results are not copied before being
+        returned, as sending them back through a pipe already pickles them
+        into an independent snapshot.
 
-    patterns = {}
-    recipes = {}
-    rules = []
-    jobs = []
+        :param operation: (str) The name of the requested operation.
 
-    if workers_start:
-        start_workers()
+        :param args: (any) Any arguments to the operation.
 
-    while True:
-        ready = wait([
-            from_state,
-            from_user,
-            from_file
-        ])
+        :return: (any) The result of the operation.
+        """
+        if operation == 'start_workers':
+            return start_workers()
 
-        if from_state in ready:
-            input_message = from_state.recv()
-            operation = input_message['operation']
-            if 'pattern' in input_message:
-                if operation == OP_CREATE:
-                    add_pattern(input_message['pattern'])
-                elif operation == OP_DELETED:
-                    remove_pattern(input_message['pattern'])
-            elif 'recipe' in input_message:
-                if operation == OP_CREATE:
-                    add_recipe(input_message['recipe'])
-                elif operation == OP_DELETED:
-                    remove_recipe(input_message['recipe'])
+        elif operation == 'stop_workers':
+            return stop_workers()
 
-        elif from_user in ready:
-            input_message = from_user.recv()
-            operation = input_message[0]
-            args = input_message[1]
+        elif operation == 'check_running_status':
+            return check_running_status()
 
-            if operation == 'start_workers':
-                result = start_workers()
-                to_user.send(result)
+        elif operation == 'get_running_status':
+            return get_running_status()
 
-            elif operation == 'stop_workers':
-                result = stop_workers()
-                to_user.send(result)
+        elif operation == 'stop_runner':
+            return stop_runner(clear_jobs=args)
 
-            elif operation == 'check_running_status':
-                result = check_running_status()
-                to_user.send(result)
+        elif operation == 'get_all_jobs':
+            return get_all_jobs()
 
-            elif operation == 'get_running_status':
-                result = get_running_status()
-                to_user.send(result)
+        elif operation == 'get_queued_jobs':
+            return get_queued_jobs()
 
-            elif operation == 'stop_runner':
-                result = stop_runner(clear_jobs=args)
-                to_user.send(result)
+        elif operation == 'get_all_input_paths':
+            return get_all_input_paths()
 
-            elif operation == 'get_all_jobs':
-                result = get_all_jobs()
-                to_user.send(result)
+        elif operation == 'check_status':
+            return check_status()
 
-            elif operation == 'get_queued_jobs':
-                result = get_queued_jobs()
-                to_user.send(result)
+        elif operation == 'add_pattern':
+            return add_pattern_dir(args)
 
-            elif operation == 'get_all_input_paths':
-                result = get_all_input_paths()
-                to_user.send(result)
+        elif operation == 'modify_pattern':
+            return modify_pattern_dir(args)
 
-            elif operation == 'check_status':
-                result = check_status()
-                to_user.send(result)
+        elif operation == 'remove_pattern':
+            return remove_pattern_dir(args)
 
-            elif operation == 'add_pattern':
-                result = add_pattern_dir(args)
-                to_user.send(result)
+        elif operation == 'add_recipe':
+            return add_recipe_dir(args)
 
-            elif operation == 'modify_pattern':
-                result = modify_pattern_dir(args)
-                to_user.send(result)
+        elif operation == 'modify_recipe':
+            return modify_recipe_dir(args)
 
-            elif operation == 'remove_pattern':
-                result = remove_pattern_dir(args)
-                to_user.send(result)
+        elif operation == 'remove_recipe':
+            return remove_recipe_dir(args)
 
-            elif operation == 'add_recipe':
-                result = add_recipe_dir(args)
-                to_user.send(result)
+        elif operation == 'check_recipes':
+            return check_recipes()
 
-            elif operation == 'modify_recipe':
-                result = modify_recipe_dir(args)
-                to_user.send(result)
+        elif operation == 'check_patterns':
+            return check_patterns()
 
-            elif operation == 'remove_recipe':
-                result = remove_recipe_dir(args)
-                to_user.send(result)
+        elif operation == 'check_rules':
+            return check_rules()
 
-            elif operation == 'check_recipes':
-                result = check_recipes()
-                to_user.send(result)
+        elif operation == 'check_jobs':
+            return check_jobs()
 
-            elif operation == 'check_patterns':
-                result = check_patterns()
-                to_user.send(result)
+        elif operation == 'check_queue':
+            return check_queue()
 
-            elif operation == 'check_rules':
-                result = check_rules()
-                to_user.send(result)
+        elif operation == 'get_stats':
+            return get_stats()
 
-            elif operation == 'check_jobs':
-                result = check_jobs()
-                to_user.send(result)
+        elif operation == 'get_jobs':
+            return get_jobs(args)
 
-            elif operation == 'check_queue':
-                result = check_queue()
-                to_user.send(result)
+        elif operation == 'apply_retention':
+            return apply_retention(wait_for_removal=True)
 
-            elif operation == 'kill':
-                to_user.send('dead')
-                return
+        raise Exception('Unknown message format: %s' % operation)
 
-            else:
-                raise Exception('Unknown message format: %s' % input_message)
+    def handle_state_message(message):
+        operation = message['operation']
+        if 'pattern' in message:
+            if operation == OP_CREATE:
+                add_pattern(message['pattern'])
+            elif operation == OP_DELETED:
+                remove_pattern(message['pattern'])
+        elif 'recipe' in message:
+            if operation == OP_CREATE:
+                add_recipe(message['recipe'])
+            elif operation == OP_DELETED:
+                remove_recipe(message['recipe'])
+
+    def handle_user_message(message):
+        """
+        Performs a user request, or batch of requests.
+
+        :param message: (Tuple(str, any)) The requested operation and its
+        arguments.
+
+        :return: (any) The reply to send to the user. This is 'dead' if the
+        administrator has been killed, in which case no more messages should
+        be handled.
+        """
+        operation = message[0]
+        args = message[1]
+
+        if operation == 'kill':
+            wait_for_retirement()
+            jobs.stop_flushing()
+            return 'dead'
+
+        elif operation == 'batch':
+            results = []
+            for batched_operation, batched_args in args:
+                results.append(
+                    handle_user_request(batched_operation, batched_args)
+                )
+            return results
+
+        return handle_user_request(operation, args)
+
+    def handle_queue_message(message):
+        if is_job_transition(message):
+            apply_transition(message)
+
+    def is_scan_pending():
+        return bool(pending_scan_rules) and not scanners
+
+    def check_retention():
+        """
+        Applies the retention policy if it is due.
+
+        :return: (float) Seconds until the retention policy is next due, or
+        None if there is no retention policy.
+        """
+        nonlocal next_retention
+        if not next_retention:
+            return None
+        if time.time() >= next_retention:
+            apply_retention()
+            next_retention = time.time() + get_retention_interval(retention)
+        return max(0, next_retention - time.time())
+
+    patterns = {}
+    recipes = {}
+    notebooks = NotebookStore(os.path.join(job_data, NOTEBOOK_STORE_DIR))
+    rules = []
+    rule_index = RuleIndex()
+    rule_keys = {}
+    input_index = None
+    if skip_unchanged_inputs:
+        input_index = InputIndex(
+            path=os.path.join(output_data, INPUT_INDEX_FILE),
+            hash_inputs=hash_inputs
+        )
+    pending_inputs = {}
+    job_inputs = {}
+    pending_scan_rules = []
+    scanners = []
+    # Pool hashing inputs, made when first needed
+    hashers = []
+    jobs = JobTable(flush_path=os.path.join(job_data, JOB_TABLE_FILE))
+    jobs.start_flushing()
+    retirements = []
+
+    if workers_start:
+        start_workers()
+
+    if initial_patterns:
+        for pattern in initial_patterns.values():
+            add_pattern(pattern)
+    if initial_recipes:
+        for recipe in initial_recipes.values():
+            add_recipe(recipe)
+
+    next_retention = None
+    if retention:
+        next_retention = time.time() + get_retention_interval(retention)
+
+    return SimpleNamespace(
+        handle_state_message=handle_state_message,
+        handle_user_message=handle_user_message,
+        handle_event=handle_event,
+        handle_queue_message=handle_queue_message,
+        handle_scan_message=handle_scan_message,
+        is_scan_pending=is_scan_pending,
+        start_retroactive_scan=start_retroactive_scan,
+        check_retention=check_retention
+    )
+
+
+def administrator(
+        from_user, to_user, from_state, from_file, to_queue, from_queue,
+        to_worker_writers, from_worker_readers, to_logger, vgrid, job_data,
+        meow_data, retro_active, workers_start, output_data=OUTPUT_DATA,
+        retention=None, skip_unchanged_inputs=False, hash_inputs=False,
+        to_monitor=None, initial_patterns=None, initial_recipes=None):
+    scan_reader, scan_writer = Pipe(duplex=False)
+    roles = administrator_roles(
+        to_queue,
+        from_queue,
+        to_worker_writers,
+        from_worker_readers,
+        to_logger,
+        scan_writer,
+        vgrid,
+        job_data,
+        meow_data,
+        retro_active,
+        workers_start,
+        output_data=output_data,
+        retention=retention,
+        skip_unchanged_inputs=skip_unchanged_inputs,
+        hash_inputs=hash_inputs,
+        to_monitor=to_monitor,
+        initial_patterns=initial_patterns,
+        initial_recipes=initial_recipes
+    )
+
+    all_inputs = [
+        from_state,
+        from_user,
+        from_file,
+        from_queue,
+        scan_reader
+    ]
+
+    while True:
+        timeout = roles.check_retention()
+
+        # Scans wait until no more pattern or recipe changes are pending,
+        # so that rules arriving together share a single scan.
+        if roles.is_scan_pending() and not wait([from_state], timeout=0):
+            roles.start_retroactive_scan()
+
+        ready = wait(all_inputs, timeout=timeout)
+
+        if from_state in ready:
+            roles.handle_state_message(from_state.recv())
+
+        elif from_user in ready:
+            input_message = from_user.recv()
+            result = roles.handle_user_message(input_message)
+            to_user.send(result)
+            if result == 'dead':
+                # If asked, the workers and job queue are told to stop too,
+                # so that the whole runner can stop at once.
+                if input_message[1]:
+                    for to_worker in to_worker_writers:
+                        to_worker.send('kill')
+                    to_queue.send('kill')
+                return
 
         elif from_file in ready:
-            input_message = from_file.recv()
-            handle_event(input_message)
+            roles.handle_event(from_file.recv())
+
+        elif from_queue in ready:
+            roles.handle_queue_message(from_queue.recv())
+
+        elif scan_reader in ready:
+            roles.handle_scan_message(scan_reader.recv())
 
 
 def job_queue(from_admin, to_admin, from_worker_readers, to_worker_writers,
               to_logger, job_home):
     queue = []
-    worker_module_lists = []
+    # Requirements are read from each job's meta file only once
+    job_requirements = {}
+    worker_matchers = []
 
     all_inputs = [from_admin]
 
     for channel_reader in from_worker_readers:
         all_inputs.append(channel_reader)
-        worker_module_lists.append([])
+        worker_matchers.append(RequirementMatcher())
 
     while True:
         ready = wait(all_inputs)
@@ -861,8 +1522,8 @@ def job_queue(from_admin, to_admin, from_worker_readers, to_worker_writers,
         if from_admin in ready:
             input_message = from_admin.recv()
             if input_message == 'get_queue':
-                current_queue = copy.deepcopy(queue)
-                to_admin.send(current_queue)
+                # Sending pickles the queue, so no further copy is needed
+                to_admin.send(queue)
 
             elif input_message == 'kill':
                 to_admin.send('dead')
@@ -878,24 +1539,28 @@ def job_queue(from_admin, to_admin, from_worker_readers, to_worker_writers,
                 if from_worker_readers[i] in ready:
                     input_message = from_worker_readers[i].recv()
                     to_worker = to_worker_writers[i]
-                    # Is module list
-                    if isinstance(input_message, list):
-                        worker_module_lists[i] = input_message
+                    # Is environment fingerprint
+                    if isinstance(input_message, dict):
+                        worker_matchers[i] = RequirementMatcher(input_message)
+                    # Is job state change, which the administrator tracks
+                    if is_job_transition(input_message):
+                        to_admin.send(input_message)
                     if input_message == 'request':
                         assigned_job = None
                         for job_id in queue:
-                            job_dir = os.path.join(job_home, job_id)
-                            meta_path = os.path.join(job_dir, META_FILE)
-                            job_data = read_yaml(meta_path)
-
-                            requirements = job_data[JOB_REQUIREMENTS]
+                            if job_id not in job_requirements:
+                                job_dir = os.path.join(job_home, job_id)
+                                meta_path = os.path.join(job_dir, META_FILE)
+                                job_data = read_yaml(meta_path)
+                                job_requirements[job_id] = \
+                                    job_data[JOB_REQUIREMENTS]
+
+                            requirements = job_requirements[job_id]
                             missing_requirement = False
                             if 'dependencies' in requirements:
-                                for requirement in \
-                                        requirements['dependencies']:
-                                    if requirement not in \
-                                            worker_module_lists[i]:
-                                        missing_requirement = True
+                                missing_requirement = \
+                                    worker_matchers[i].missing(
+                                        requirements['dependencies'])
                             if not missing_requirement:
                                 assigned_job = job_id
                                 break
@@ -911,6 +1576,7 @@ def job_queue(from_admin, to_admin, from_worker_readers, to_worker_writers,
                                 )
                         if assigned_job:
                             queue.remove(assigned_job)
+                            job_requirements.pop(assigned_job, None)
 
                             to_logger.send(
                                 (
@@ -921,18 +1587,56 @@ def job_queue(from_admin, to_admin, from_worker_readers, to_worker_writers,
                         to_worker.send(assigned_job)
 
 
+def get_worker_delay(worker_id, wait_time):
+    """
+    Gets how long a worker waits between requests for jobs. This is offset
+    by the worker's id, so that workers do not all make requests at once.
+
+    :param worker_id: (int) The id of the worker.
+
+    :param wait_time: (int) The base time to wait, in seconds.
+
+    :return: (int) The time to wait, in seconds.
+    """
+    return wait_time + (worker_id % wait_time)
+
+
 def job_processor(processing_method, processing_method_args, from_timer,
                   to_timer, from_admin, to_admin, to_queue, from_queue,
-                  to_logger, processor_id, job_home, output_data):
+                  to_logger, processor_id, job_home, output_data,
+                  wait_time=10):
+    """
+    Worker process, requesting jobs from the job queue and processing them.
+
+    :param from_timer: (Connection) Connection on which a worker_timer
+    process says when to next request a job. If None, the worker keeps its
+    own time instead, waiting wait_time between requests, and to_timer is
+    not used.
+
+    :param wait_time: (int)[optional] The time to wait between requests if
+    there is no timer process. Default is 10.
+    """
     state = 'stopped'
 
-    to_timer.send('sleep')
+    next_request = None
+    if from_timer:
+        to_timer.send('sleep')
+    else:
+        next_request = \
+            time.time() + get_worker_delay(processor_id, wait_time)
 
-    module_list = [p.project_name for p in pkg_resources.working_set]
-    to_queue.send(module_list)
+    to_queue.send(get_environment_fingerprint())
 
     while True:
-        ready = wait([from_admin, from_timer])
+        if from_timer:
+            ready = wait([from_admin, from_timer])
+            request_due = from_timer in ready
+        else:
+            ready = wait(
+                [from_admin],
+                timeout=max(0, next_request - time.time())
+            )
+            request_due = time.time() >= next_request
 
         if from_admin in ready:
             input_message = from_admin.recv()
@@ -947,12 +1651,16 @@ def job_processor(processing_method, processing_method_args, from_timer,
                 state = 'stopped'
 
             elif input_message == 'kill':
-                to_timer.send('kill')
+                if to_timer:
+                    to_timer.send('kill')
                 to_admin.send('dead')
                 return
 
-        elif from_timer in ready:
-            input_message = from_timer.recv()
+        elif request_due:
+            if from_timer:
+                input_message = from_timer.recv()
+            else:
+                input_message = 'done'
 
             if input_message == 'done' and state == 'running':
                 to_queue.send('request')
@@ -971,8 +1679,15 @@ def job_processor(processing_method, processing_method_args, from_timer,
                     processing_method_args["job_home"] = job_home
                     processing_method_args["output_data"] = output_data
 
+                    to_queue.send((JOB_TRANSITION, job_id, RUNNING))
+
                     status, msg = processing_method(processing_method_args)
 
+                    if status:
+                        to_queue.send((JOB_TRANSITION, job_id, DONE))
+                    else:
+                        to_queue.send((JOB_TRANSITION, job_id, FAILED, msg))
+
                     if not status:
                         to_logger.send(
                             (
@@ -995,7 +1710,11 @@ def job_processor(processing_method, processing_method_args, from_timer,
                         )
                     )
 
-            to_timer.send('sleep')
+            if from_timer:
+                to_timer.send('sleep')
+            else:
+                next_request = \
+                    time.time() + get_worker_delay(processor_id, wait_time)
 
 
 def local_processing(processing_method_args):
@@ -1012,11 +1731,11 @@ def local_processing(processing_method_args):
 
     job_data = read_yaml(meta_path)
 
+    # Running state is reported to the administrator by the job processor, so
+    # the meta file is only written once the job has finished.
     job_data[JOB_STATUS] = RUNNING
     job_data[JOB_START_TIME] = datetime.now()
 
-    write_yaml(job_data, meta_path)
-
     error = False
     cmd = 'notebook_parameterizer ' \
           + base_path + ' ' \
@@ -1080,57 +1799,159 @@ def local_processing(processing_method_args):
     return True, ''
 
 
+def is_declared_output(path, outputs):
+    """
+    Checks if a path is one of a job's declared outputs, or is within one.
+
+    :param path: (str) The normalised relative path.
+
+    :param outputs: (list) The normalised relative paths of the outputs.
+
+    :return: (bool) True if the path is a declared output, False otherwise.
+    """
+    for output in outputs:
+        if path == output or path.startswith(output + os.sep):
+            return True
+    return False
+
+
 def ssh_processing(processing_method_args):
+    """
+    Processes a job on a remote worker, reached over SSH. The connection to
+    the worker is kept in processing_method_args, so is reused by every job
+    the worker processes. The job files and triggering input are copied to
+    the worker's mount directory as a single compressed stream and the job
+    is run there in the same command, before the results are copied back as
+    another stream. Inputs the worker already has are not copied again.
+
+    :param processing_method_args: (dict) Must contain the 'worker'
+    definition, as checked by is_valid_ssh_worker, along with the 'job_id',
+    'job_home' and 'output_data'.
+
+    :return: (Tuple(bool, str)) True if the job was processed successfully,
+    False otherwise, along with any error message.
+    """
     job_id = processing_method_args["job_id"]
     job_home = processing_method_args["job_home"]
     output_data = processing_method_args["output_data"]
 
-    resource_hostname = "localhost"
-    resource_username = "patch_of_scotland"
-    resource_rsa = "/home/patch_of_scotland/.ssh/id_rsa_skimbleshanks.pub"
-    resource_mount_point = "test_tmp_dir/mountpoint"
-
-    server_hostname = socket.getfqdn()
-    server_username = os.getlogin()
-    server_rsa_private = "/home/patch_of_scotland/.ssh/id_rsa_sshfs_testing"
-    server_rsa_public = "/home/patch_of_scotland/.ssh/id_rsa_sshfs_testing.pub"
-    server_known_hosts = "/home/patch_of_scotland/.ssh/known_hosts_sshfs_testing"
-    server_authorised_keys = "/home/patch_of_scotland/.ssh/authorized_keys"
-    server_mount_target = "/home/patch_of_scotland/TestSpace/sshfs/onHost"
-
-    ssh_client = paramiko.SSHClient()
-    # This will do for now but should be more rigorous in future
-    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh_client.connect(
-        hostname=resource_hostname,
-        username=resource_username,
-        key_filename=resource_rsa,
-    )
-    sftp_client = ssh_client.open_sftp()
+    connection = processing_method_args.get("connection")
+    if connection is None:
+        connection = SSHConnection(processing_method_args["worker"])
+        processing_method_args["connection"] = connection
 
-    ssh_client.exec_command(f"mkdir -p {resource_mount_point}")
+    job_dir = os.path.join(job_home, job_id)
+    meta_path = os.path.join(job_dir, META_FILE)
 
-    sftp_client.put("/home/patch_of_scotland/.ssh/id_rsa_skimbleshanks test_tmp_dir/id_rsa_skimbleshanks")
+    job_data = read_yaml(meta_path)
+
+    job_data[JOB_STATUS] = RUNNING
+    job_data[JOB_START_TIME] = datetime.now()
 
-    ssh_client.exec_command(f"mkdir {resource_mount_point}")
+    remote_dir = connection.remote_path(job_id)
+    error = None
+    try:
+        job_files = [META_FILE, BASE_FILE, PARAMS_FILE]
+        files = [
+            (os.path.join(job_dir, filename), posixpath.join(job_id, filename))
+            for filename in job_files
+        ]
+        commands = []
+
+        # Inputs are kept in a cache on the worker by their hash, so that
+        # one the worker already has is not sent again. They are copied in
+        # relative to the remote job directory, as they are relative to the
+        # runner locally. A copy rather than a link is used, so that a job
+        # writing to its input cannot change the cached input for later
+        # jobs.
+        input_path = job_data.get(JOB_PATH)
+        if input_path and not os.path.isabs(input_path) \
+                and os.path.isfile(input_path):
+            digest = connection.hash_input(input_path)
+            cached_input = posixpath.join(INPUT_CACHE_DIR, digest)
+            if connection.missing_inputs([digest]):
+                files.append((input_path, cached_input))
+            staged_input = posixpath.join(job_id, input_path)
+            commands.append('mkdir -p %s && cp %s %s' % (
+                shlex.quote(posixpath.dirname(staged_input)),
+                cached_input,
+                shlex.quote(staged_input)
+            ))
+            job_files.append(input_path)
+
+        # Staging and running the job are sent together, so the job is run
+        # in one round trip
+        commands.append(
+            'cd %s && notebook_parameterizer %s %s -o %s && papermill %s %s'
+            % (
+                shlex.quote(job_id),
+                BASE_FILE,
+                PARAMS_FILE,
+                JOB_FILE,
+                JOB_FILE,
+                RESULT_FILE
+            )
+        )
+        status, _, stderr = \
+            connection.upload(files, command=' && '.join(commands))
+        if status:
+            error = 'Exit status %s. %s' \
+                    % (status, stderr.decode(errors='replace'))
+            # The cache may have been cleared on the worker
+            connection.remote_inputs.clear()
+            connection.execute('rm -rf %s' % shlex.quote(remote_dir))
+        else:
+            # Declared outputs are placed relative to the runner, as they
+            # would be had the job been processed locally. Anything else the
+            # notebook wrote is kept in the job directory.
+            outputs = [
+                os.path.normpath(output)
+                for output in job_data.get(JOB_OUTPUTS, [])
+                if not os.path.isabs(output)
+            ]
+            results = connection.download(job_id, skip=job_files)
+            for name, contents in read_archive(results):
+                if name not in [JOB_FILE, RESULT_FILE] \
+                        and is_declared_output(name, outputs):
+                    local_path = name
+                else:
+                    local_path = os.path.join(job_dir, name)
+                local_dir = os.path.dirname(local_path)
+                if local_dir:
+                    os.makedirs(local_dir, exist_ok=True)
+                with open(local_path, 'wb') as output_file:
+                    output_file.write(contents)
 
-    _, stdout, stderr = ssh_client.exec_command(f"sshfs {server_username}@{server_hostname}:{server_mount_target} {resource_mount_point} -oIdentityFile={server_rsa_private} -oUserKnownHostsFile={server_known_hosts} -o reconnect -C")
+    except Exception as ex:
+        error = ex
 
-    print(stdout.readlines())
-    print(stderr.readlines())
+    if error is not None:
+        job_data[JOB_STATUS] = FAILED
+        job_data[JOB_END_TIME] = datetime.now()
+        msg = 'Job %s could not be processed on %s. %s' \
+              % (job_id, connection.hostname, error)
+        job_data[JOB_ERROR] = msg
+        write_yaml(job_data, meta_path)
+        return False, msg
 
-    _, stdout, stderr = ssh_client.exec_command(f"fusermount -u {resource_mount_point}")
+    job_data[JOB_STATUS] = DONE
+    job_data[JOB_END_TIME] = datetime.now()
+    write_yaml(job_data, meta_path)
 
-    print(stdout.readlines())
-    print(stderr.readlines())
+    job_output_dir = os.path.join(output_data, job_id)
 
-    ssh_client.exec_command("rm -rf test_tmp_dir")
+    shutil.move(job_dir, job_output_dir)
 
-    sftp_client.close()
-    ssh_client.close()
+    return True, ''
 
 
 def setup_ssh_files():
+    from cryptography.hazmat.primitives import \
+        serialization as cryptography_serialisation
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.backends import \
+        default_backend as cryptography_default_backend
+
     key = rsa.generate_private_key(
         backend=cryptography_default_backend(),
         public_exponent=65537,
@@ -1202,7 +2023,7 @@ def worker_timer(from_worker, to_worker, worker_id, wait_time=10):
         msg = from_worker.recv()
 
         if msg == 'sleep':
-            time.sleep(wait_time + (worker_id % wait_time))
+            time.sleep(get_worker_delay(worker_id, wait_time))
 
             to_worker.send('done')
         elif msg == 'kill':
@@ -1232,37 +2053,173 @@ def logger(all_input_channel_readers, print_logging=True, file_logging=False):
                 continue
 
 
+def setup_runner(
+        path, workers, patterns, recipes, meow_data, job_data, output_data,
+        daemon, reuse_vgrid, start_workers, retro_active_jobs, print_logging,
+        file_logging, wait_time, retention, skip_unchanged_inputs,
+        hash_inputs, event_source, trigger_mode, quiet_period, transport,
+        fast_start):
+    """
+    Checks the arguments given to a runner, and creates the directories it
+    will use. Takes the same arguments as WorkflowRunner.
+
+    :return: No return.
+    """
+    valid_dir_path(path, 'path')
+    valid_runner_workers(workers)
+    check_input(patterns, dict, PATTERNS, or_none=True)
+    check_input(recipes, dict, RECIPES, or_none=True)
+    valid_dir_path(meow_data, 'meow_data')
+    valid_dir_path(job_data, 'job_data')
+    valid_dir_path(output_data, 'output_data')
+    check_input(daemon, bool, 'daemon')
+    check_input(reuse_vgrid, bool, 'reuse_vgrid')
+    check_input(start_workers, bool, 'start_workers')
+    check_input(retro_active_jobs, bool, 'retro_active_jobs')
+    check_input(print_logging, bool, 'print_logging')
+    check_input(file_logging, bool, 'file_logging')
+    check_input(wait_time, int, 'wait_time')
+    check_input(retention, dict, 'retention', or_none=True)
+    check_input(skip_unchanged_inputs, bool, 'skip_unchanged_inputs')
+    check_input(hash_inputs, bool, 'hash_inputs')
+    check_input(event_source, str, 'event_source')
+    if event_source not in EVENT_SOURCES:
+        raise ValueError(
+            "Unknown event_source '%s'. Valid options are: %s. "
+            % (event_source, EVENT_SOURCES)
+        )
+    if event_source == EVENT_SOURCE_INOTIFY \
+            and not is_inotify_available():
+        raise ValueError(
+            "Event source '%s' is not available on this system. "
+            % event_source
+        )
+    check_input(trigger_mode, str, 'trigger_mode')
+    if trigger_mode not in TRIGGER_MODES:
+        raise ValueError(
+            "Unknown trigger_mode '%s'. Valid options are: %s. "
+            % (trigger_mode, TRIGGER_MODES)
+        )
+    if trigger_mode == TRIGGER_CLOSED and not is_inotify_available():
+        raise ValueError(
+            "Trigger mode '%s' relies on close events, which are not "
+            "available on this system. " % trigger_mode
+        )
+    check_input(quiet_period, (int, float), 'quiet_period')
+    if quiet_period < 0:
+        raise ValueError('quiet_period cannot be negative. ')
+    check_input(fast_start, bool, 'fast_start')
+    check_input(transport, str, 'transport')
+    if transport not in TRANSPORTS:
+        raise ValueError(
+            "Unknown transport '%s'. Valid options are: %s. "
+            % (transport, TRANSPORTS)
+        )
+    if retention:
+        valid, msg = is_valid_retention_dict(retention, strict=True)
+        if not valid:
+            raise ValueError(msg)
+
+    make_dir(path, can_exist=reuse_vgrid)
+    make_dir(job_data)
+    if meow_data == RUNNER_DATA:
+        make_dir(meow_data, ensure_clean=True)
+    else:
+        make_dir(meow_data)
+    make_dir(output_data)
+    make_dir(get_runner_patterns(meow_data), ensure_clean=True)
+    make_dir(get_runner_recipes(meow_data), ensure_clean=True)
+
+
+def write_initial_state(to_logger, patterns, recipes, meow_data):
+    """
+    Writes the patterns and recipes a runner is created with to its
+    meow_data directory.
+
+    :param to_logger: (Connection) Connection to send log messages to.
+
+    :param patterns: (dict) The patterns to write. May be None.
+
+    :param recipes: (dict) The recipes to write. May be None.
+
+    :param meow_data: (str) The runner's meow_data directory.
+
+    :return: No return.
+    """
+    if patterns:
+        for name, pattern in patterns.items():
+            to_logger.send(
+                (
+                    'WorkflowRunner._init',
+                    "Adding pattern %s. " % name
+                )
+            )
+
+            write_dir_pattern(pattern, directory=meow_data)
+
+    to_logger.send(
+        (
+            'WorkflowRunner._init',
+            'Added all predefined patterns. '
+        )
+    )
+
+    if recipes:
+        for name, recipe in recipes.items():
+            to_logger.send(
+                (
+                    'WorkflowRunner._init',
+                    "Adding recipe %s. " % name
+                )
+            )
+
+            write_dir_recipe(recipe, directory=meow_data)
+
+    to_logger.send(
+        (
+            'WorkflowRunner._init',
+             'Added all predefined recipes. '
+        )
+    )
+
+
 class WorkflowRunner:
     def __init__(self, path, workers, patterns=None, recipes=None,
                  meow_data=RUNNER_DATA, job_data=JOB_DIR,
                  output_data=OUTPUT_DATA, daemon=False, reuse_vgrid=True,
                  start_workers=True, retro_active_jobs=True,
-                 print_logging=True, file_logging=False, wait_time=10):
-
-        valid_dir_path(path, 'path')
-        valid_runner_workers(workers)
-        check_input(patterns, dict, PATTERNS, or_none=True)
-        check_input(recipes, dict, RECIPES, or_none=True)
-        valid_dir_path(meow_data, 'meow_data')
-        valid_dir_path(job_data, 'job_data')
-        valid_dir_path(output_data, 'output_data')
-        check_input(daemon, bool, 'daemon')
-        check_input(reuse_vgrid, bool, 'reuse_vgrid')
-        check_input(start_workers, bool, 'start_workers')
-        check_input(retro_active_jobs, bool, 'retro_active_jobs')
-        check_input(print_logging, bool, 'print_logging')
-        check_input(file_logging, bool, 'file_logging')
-        check_input(wait_time, int, 'wait_time')
-
-        make_dir(path, can_exist=reuse_vgrid)
-        make_dir(job_data)
-        if meow_data == RUNNER_DATA:
-            make_dir(meow_data, ensure_clean=True)
-        else:
-            make_dir(meow_data)
-        make_dir(output_data)
-        make_dir(get_runner_patterns(meow_data), ensure_clean=True)
-        make_dir(get_runner_recipes(meow_data), ensure_clean=True)
+                 print_logging=True, file_logging=False, wait_time=10,
+                 retention=None, skip_unchanged_inputs=False,
+                 hash_inputs=False, event_source=EVENT_SOURCE_WATCHDOG,
+                 trigger_mode=TRIGGER_MODIFIED,
+                 quiet_period=DEFAULT_QUIET_PERIOD, transport=TRANSPORT_PIPE,
+                 fast_start=False):
+
+        setup_runner(
+            path,
+            workers,
+            patterns,
+            recipes,
+            meow_data,
+            job_data,
+            output_data,
+            daemon,
+            reuse_vgrid,
+            start_workers,
+            retro_active_jobs,
+            print_logging,
+            file_logging,
+            wait_time,
+            retention,
+            skip_unchanged_inputs,
+            hash_inputs,
+            event_source,
+            trigger_mode,
+            quiet_period,
+            transport,
+            fast_start
+        )
+        self.fast_start = fast_start
 
         user_to_admin_reader, user_to_admin_writer = Pipe(duplex=False)
         admin_to_user_reader, admin_to_user_writer = Pipe(duplex=False)
@@ -1271,17 +2228,30 @@ class WorkflowRunner:
         self.user_to_admin = user_to_admin_writer
         self.admin_to_user = admin_to_user_reader
 
+        self.rings = []
+        # Channels carrying events, job ids, state transitions and log
+        # records may use the chosen transport. Control channels are always
+        # pipes, as is the administrator's logging channel, which is also
+        # written to from this process.
         state_to_admin_reader, state_to_admin_writer = Pipe(duplex=False)
-        state_to_logger_reader, state_to_logger_writer = Pipe(duplex=False)
-
-        file_to_admin_reader, file_to_admin_writer = Pipe(duplex=False)
-        file_to_logger_reader, file_to_logger_writer = Pipe(duplex=False)
-
-        admin_to_queue_reader, admin_to_queue_writer = Pipe(duplex=False)
-        queue_to_admin_reader, queue_to_admin_writer = Pipe(duplex=False)
+        state_to_logger_reader, state_to_logger_writer = \
+            make_channel(transport, self.rings)
+
+        file_to_admin_reader, file_to_admin_writer = \
+            make_channel(transport, self.rings)
+        file_to_logger_reader, file_to_logger_writer = \
+            make_channel(transport, self.rings)
+
+        admin_to_queue_reader, admin_to_queue_writer = \
+            make_channel(transport, self.rings)
+        queue_to_admin_reader, queue_to_admin_writer = \
+            make_channel(transport, self.rings)
         admin_to_logger_reader, admin_to_logger_writer = Pipe(duplex=False)
 
-        queue_to_logger_reader, queue_to_logger_writer = Pipe(duplex=False)
+        queue_to_logger_reader, queue_to_logger_writer = \
+            make_channel(transport, self.rings)
+
+        admin_to_monitor_reader, admin_to_monitor_writer = Pipe(duplex=False)
 
         all_logger_inputs = [
             user_to_logger_reader,
@@ -1292,6 +2262,7 @@ class WorkflowRunner:
         ]
 
         workers_and_timers_list = []
+        self.timer_processes = []
         admin_to_workers = []
         worker_to_admins = []
         worker_to_queues = []
@@ -1299,13 +2270,23 @@ class WorkflowRunner:
         if isinstance(workers, int):
             workers = [{}] * workers
         for processor_id, worker_type in enumerate(workers):
-            worker_to_timer_reader, worker_to_timer_writer = Pipe(duplex=False)
-            timer_to_worker_reader, timer_to_worker_writer = Pipe(duplex=False)
+            # When starting fast, workers keep their own time rather than
+            # each needing a timer process.
+            worker_to_timer_reader, worker_to_timer_writer = None, None
+            timer_to_worker_reader, timer_to_worker_writer = None, None
+            if not fast_start:
+                worker_to_timer_reader, worker_to_timer_writer = \
+                    Pipe(duplex=False)
+                timer_to_worker_reader, timer_to_worker_writer = \
+                    Pipe(duplex=False)
             admin_to_worker_reader, admin_to_worker_writer = Pipe(duplex=False)
             worker_to_admin_reader, worker_to_admin_writer = Pipe(duplex=False)
-            worker_to_queue_reader, worker_to_queue_writer = Pipe(duplex=False)
-            queue_to_worker_reader, queue_to_worker_writer = Pipe(duplex=False)
-            worker_to_logger_reader, worker_to_logger_writer = Pipe(duplex=False)
+            worker_to_queue_reader, worker_to_queue_writer = \
+                make_channel(transport, self.rings)
+            queue_to_worker_reader, queue_to_worker_writer = \
+                make_channel(transport, self.rings)
+            worker_to_logger_reader, worker_to_logger_writer = \
+                make_channel(transport, self.rings)
 
             # Defaults, used in local processing
             processing_type = local_processing
@@ -1313,7 +2294,9 @@ class WorkflowRunner:
 
             if is_valid_ssh_worker(worker_type)[0]:
                 processing_type = ssh_processing
-                processing_arguments = {}
+                processing_arguments = {
+                    'worker': worker_type
+                }
 
             worker = Process(
                 target=job_processor,
@@ -1330,21 +2313,25 @@ class WorkflowRunner:
                     processor_id,
                     job_data,
                     output_data
-                )
+                ),
+                kwargs={
+                    'wait_time': wait_time
+                }
             )
+            workers_and_timers_list.append(worker)
 
-            timer = Process(
-                target=worker_timer,
-                args=(
-                    worker_to_timer_reader,
-                    timer_to_worker_writer,
-                    processor_id,
-                    wait_time
+            if not fast_start:
+                timer = Process(
+                    target=worker_timer,
+                    args=(
+                        worker_to_timer_reader,
+                        timer_to_worker_writer,
+                        processor_id,
+                        wait_time
+                    )
                 )
-            )
-
-            workers_and_timers_list.append(worker)
-            workers_and_timers_list.append(timer)
+                workers_and_timers_list.append(timer)
+                self.timer_processes.append(timer)
             admin_to_workers.append(admin_to_worker_writer)
             worker_to_admins.append(worker_to_admin_reader)
             worker_to_queues.append(worker_to_queue_reader)
@@ -1368,7 +2355,18 @@ class WorkflowRunner:
                 meow_data,
                 retro_active_jobs,
                 start_workers
-            )
+            ),
+            kwargs={
+                'output_data': output_data,
+                'retention': retention,
+                'skip_unchanged_inputs': skip_unchanged_inputs,
+                'hash_inputs': hash_inputs,
+                'to_monitor': admin_to_monitor_writer,
+                # When starting fast, the administrator is given its initial
+                # state directly rather than waiting for the state monitor
+                'initial_patterns': patterns if fast_start else None,
+                'initial_recipes': recipes if fast_start else None
+            }
         )
 
         job_queue_process = Process(
@@ -1392,6 +2390,7 @@ class WorkflowRunner:
             )
         )
 
+        self.administrator_process = administrator_process
         self.process_list = [
             job_queue_process,
             administrator_process,
@@ -1404,8 +2403,29 @@ class WorkflowRunner:
         # Start all non-monitoring processes
         self.run()
 
-        state_monitor = LocalWorkflowStateMonitor(
-            state_to_admin_writer, state_to_logger_writer, meow_data)
+        # Shares its store with the administrator, so that only the hash of
+        # each recipe's notebook need be sent to it.
+        notebooks = NotebookStore(os.path.join(job_data, NOTEBOOK_STORE_DIR))
+        if fast_start:
+            # Written before the state monitor starts, so as not to cause
+            # events for state the administrator already has.
+            write_initial_state(
+                admin_to_logger_writer, patterns, recipes, meow_data)
+            state_monitor = LocalWorkflowStateMonitor(
+                state_to_admin_writer,
+                state_to_logger_writer,
+                meow_data,
+                known_patterns=patterns,
+                known_recipes=recipes,
+                notebooks=notebooks
+            )
+        else:
+            state_monitor = LocalWorkflowStateMonitor(
+                state_to_admin_writer,
+                state_to_logger_writer,
+                meow_data,
+                notebooks=notebooks
+            )
         self.state_monitor_process = Observer()
         self.state_monitor_process.schedule(
             state_monitor,
@@ -1414,8 +2434,19 @@ class WorkflowRunner:
         )
 
         file_monitor = LocalWorkflowFileMonitor(
-            file_to_admin_writer, file_to_logger_writer)
-        self.file_monitor_process = Observer()
+            file_to_admin_writer,
+            file_to_logger_writer,
+            trigger_mode=trigger_mode,
+            quiet_period=quiet_period,
+            from_admin=admin_to_monitor_reader,
+            vgrid=path
+        )
+        if event_source == EVENT_SOURCE_INOTIFY:
+            self.file_monitor_process = InotifyObserver()
+            file_monitor.add_rule_listener(
+                self.file_monitor_process.update_rules)
+        else:
+            self.file_monitor_process = Observer()
         self.file_monitor_process.schedule(
             file_monitor,
             path,
@@ -1433,41 +2464,9 @@ class WorkflowRunner:
             )
         )
 
-        if patterns:
-            for name, pattern in patterns.items():
-                admin_to_logger_writer.send(
-                    (
-                        'WorkflowRunner._init',
-                        "Adding pattern %s. " % name
-                    )
-                )
-
-                write_dir_pattern(pattern, directory=meow_data)
-
-        admin_to_logger_writer.send(
-            (
-                'WorkflowRunner._init',
-                'Added all predefined patterns. '
-            )
-        )
-
-        if recipes:
-            for name, recipe in recipes.items():
-                admin_to_logger_writer.send(
-                    (
-                        'WorkflowRunner._init',
-                        "Adding recipe %s. " % name
-                    )
-                )
-
-                write_dir_recipe(recipe, directory=meow_data)
-
-        admin_to_logger_writer.send(
-            (
-                'WorkflowRunner._init',
-                 'Added all predefined recipes. '
-            )
-        )
+        if not fast_start:
+            write_initial_state(
+                admin_to_logger_writer, patterns, recipes, meow_data)
 
         if not daemon:
             try:
@@ -1480,6 +2479,8 @@ class WorkflowRunner:
         clean_up_ssh()
 
     def run(self):
+        # Processes are started one at a time, as starting them from several
+        # threads would fork a multithreaded parent.
         self.logger_process.start()
         for my_process in self.process_list:
             my_process.start()
@@ -1492,18 +2493,60 @@ class WorkflowRunner:
         self.logger_process.join()
 
     def stop(self):
+        if self.fast_start:
+            self.stop_gracefully()
+        else:
+            self.file_monitor_process.stop()
+            self.file_monitor_process.join()
+            self.state_monitor_process.stop()
+            self.state_monitor_process.join()
+            for my_process in self.process_list:
+                if hasattr(my_process, 'terminate'):
+                    my_process.terminate()
+                else:
+                    my_process.stop()
+                my_process.join()
+            self.logger_process.terminate()
+            self.logger_process.join()
+        for ring in self.rings:
+            ring.close()
+            ring.unlink()
+        self.rings = []
+
+    def stop_gracefully(self, timeout=STOP_TIMEOUT):
+        """
+        Stops all runner processes together. The administrator is asked to
+        stop, and to tell the workers and job queue to stop, so that any
+        running job can finish and the job table is flushed. Any process
+        still running after the timeout is terminated.
+
+        :param timeout: (int)[optional] The number of seconds to wait for
+        processes to stop before terminating them. Default is STOP_TIMEOUT.
+
+        :return: No return.
+        """
         self.file_monitor_process.stop()
-        self.file_monitor_process.join()
         self.state_monitor_process.stop()
+        self.file_monitor_process.join()
         self.state_monitor_process.join()
+
+        # Timers hold no state so need not be stopped gracefully
+        for timer in self.timer_processes:
+            timer.terminate()
+
+        if self.administrator_process.is_alive():
+            self.user_to_admin.send(('kill', True))
+            if wait([self.admin_to_user], timeout=timeout):
+                self.admin_to_user.recv()
+
+        deadline = time.time() + timeout
         for my_process in self.process_list:
-            if hasattr(my_process, 'terminate'):
+            my_process.join(timeout=max(0, deadline - time.time()))
+
+        for my_process in self.process_list + [self.logger_process]:
+            if my_process.is_alive():
                 my_process.terminate()
-            else:
-                my_process.stop()
             my_process.join()
-        self.logger_process.terminate()
-        self.logger_process.join()
 
     def start_workers(self):
         self.user_to_admin.send(
@@ -1707,6 +2750,124 @@ class WorkflowRunner:
         result = self.admin_to_user.recv()
         return result
 
+    def get_stats(self):
+        """
+        Gets counts of the jobs in the runner by their current state. These
+        counts are kept up to date as jobs are scheduled and processed, so
+        this does not depend on how many jobs have been run.
+
+        :return: (dict) A dict of the total number of jobs, the number
+        queued, running, done and failed, and a dict of the same counts for
+        each pattern.
+        """
+        self.user_to_admin.send(
+            (
+                'get_stats',
+                None
+            )
+        )
+        result = self.admin_to_user.recv()
+        return result
+
+    def get_jobs(self, status=None, pattern=None):
+        """
+        Gets the jobs known to the runner, optionally filtered by status
+        and/or pattern.
+
+        :param status: (str)[optional] If provided, only jobs with this
+        status are returned. Must be one of 'queued', 'running', 'done' or
+        'failed'.
+
+        :param pattern: (str)[optional] If provided, only jobs created by the
+        pattern with this name are returned.
+
+        :return: (list) A list of job dicts, in the order the jobs were
+        scheduled.
+        """
+        check_input(status, str, 'status', or_none=True)
+        check_input(pattern, str, 'pattern', or_none=True)
+        if status is not None and status not in JOB_STATES:
+            raise ValueError(
+                "Invalid status '%s'. Valid statuses are: %s"
+                % (status, JOB_STATES)
+            )
+
+        self.user_to_admin.send(
+            (
+                'get_jobs',
+                {
+                    JOB_STATUS: status,
+                    JOB_PATTERN: pattern
+                }
+            )
+        )
+        result = self.admin_to_user.recv()
+        return result
+
+    def apply_retention(self):
+        """
+        Immediately applies the runner's retention policy, rather than
+        waiting for it to be applied periodically. Does nothing if the runner
+        has no retention policy.
+
+        :return: (list) A list of the ids of jobs that are no longer
+        retained.
+        """
+        self.user_to_admin.send(
+            (
+                'apply_retention',
+                None
+            )
+        )
+        result = self.admin_to_user.recv()
+        return result
+
+    def batch(self, operations):
+        """
+        Sends several requests to the administrator as a single message, and
+        waits for all of their results in a single reply. Useful for
+        monitoring as several status calls can be made in one round trip.
+
+        :param operations: (list) The requests to make. Each entry can be
+        either the str name of a request, such as 'check_status', or a tuple
+        of the request name and its argument, such as
+        ('remove_pattern', 'adder'). 'stop_runner' cannot be batched.
+
+        :return: (list) The results of each request, in the same order as
+        they were given.
+        """
+        check_input(operations, list, 'operations')
+
+        requests = []
+        for operation in operations:
+            if isinstance(operation, str):
+                operation = (operation, None)
+            if not isinstance(operation, tuple) or len(operation) != 2:
+                raise TypeError(
+                    "Batched operation '%s' must be either a str or a tuple "
+                    "of (str, args). " % str(operation)
+                )
+            if operation[0] not in USER_OPERATIONS:
+                raise ValueError(
+                    "Unknown batched operation '%s'. Valid are: %s. "
+                    % (operation[0], USER_OPERATIONS)
+                )
+            if operation[0] == 'stop_runner':
+                raise ValueError(
+                    "Cannot batch 'stop_runner' as the runner must also be "
+                    "stopped locally. Call 'stop_runner' directly. "
+                )
+            requests.append(operation)
+
+        self.user_to_admin.send(
+            (
+                'batch',
+                requests
+            )
+        )
+        result = self.admin_to_user.recv()
+        return result
+
 
 class LocalWorkflowStateMonitor(PatternMatchingEventHandler):
     """
@@ -1716,8 +2877,30 @@ class LocalWorkflowStateMonitor(PatternMatchingEventHandler):
     def __init__(
             self, to_admin, to_logger,  meow_data, patterns=None,
             ignore_patterns=None, ignore_directories=False,
-            case_sensitive=False):
-        """Constructor"""
+            case_sensitive=False, known_patterns=None, known_recipes=None,
+            notebooks=None, debounce_period=STATE_DEBOUNCE_PERIOD):
+        """
+        Constructor
+
+        :param known_patterns: (dict)[optional] Patterns the administrator
+        already has. Their files are not read, nor are they sent to the
+        administrator again.
+
+        :param known_recipes: (dict)[optional] Recipes the administrator
+        already has. Their files are not read, nor are they sent to the
+        administrator again.
+
+        :param notebooks: (NotebookStore)[optional] Store for recipe
+        notebooks. If given, recipes are sent to the administrator with
+        their notebook replaced by its hash, rather than with the notebook
+        itself.
+
+        :param debounce_period: (int or float)[optional] Seconds to wait
+        after an event for further events for the same file. Only the last
+        of a burst of events is then handled, as editors often write a file
+        several times when saving it. If 0, every event is handled as it
+        arrives. Default is STATE_DEBOUNCE_PERIOD.
+        """
 
         PatternMatchingEventHandler.__init__(
             self,
@@ -1729,8 +2912,19 @@ class LocalWorkflowStateMonitor(PatternMatchingEventHandler):
         self.to_logger = to_logger
         self.to_admin = to_admin
         self.meow_data = meow_data
-        self.state_patterns = {}
-        self.state_recipes = {}
+        self.notebooks = notebooks
+        self.state_patterns = dict(known_patterns or {})
+        self.state_recipes = {
+            name: self.slim_recipe(recipe)
+            for name, recipe in (known_recipes or {}).items()
+        }
+        # Size, modification time and hash of each file last read, by file
+        # type and name, so that unchanged files are not read again.
+        self.file_states = {}
+        self.debounce_period = debounce_period
+        self._debounced = {}
+        self._debounce_condition = threading.Condition()
+        self._debounce_thread = None
 
         self.to_logger.send(
             (
@@ -1742,13 +2936,17 @@ class LocalWorkflowStateMonitor(PatternMatchingEventHandler):
         # Check pre-existing Patterns and Recipes
         runner_patterns = get_runner_patterns(self.meow_data)
         for file_path in os.listdir(runner_patterns):
+            if file_path in self.state_patterns:
+                continue
             try:
+                state = self.get_file_state(PATTERNS, file_path)
                 pattern = read_dir_pattern(
                     file_path,
                     directory=self.meow_data
                 )
 
                 self.add_pattern(pattern)
+                self.file_states[(PATTERNS, file_path)] = state
             except Exception as exc:
                 self.to_logger.send(
                     ('LocalWorkflowStateMonitor._init', str(exc))
@@ -1756,7 +2954,10 @@ class LocalWorkflowStateMonitor(PatternMatchingEventHandler):
 
         runner_recipes = get_runner_recipes(self.meow_data)
         for file_path in os.listdir(runner_recipes):
+            if file_path in self.state_recipes:
+                continue
             try:
+                state = self.get_file_state(RECIPES, file_path)
                 recipe = read_dir_recipe(
                     file_path,
                     directory=self.meow_data
@@ -1768,6 +2969,7 @@ class LocalWorkflowStateMonitor(PatternMatchingEventHandler):
                 #     )
                 # )
                 self.add_recipe(recipe)
+                self.file_states[(RECIPES, file_path)] = state
             except Exception as exc:
                 self.to_logger.send(
                     ('LocalWorkflowStateMonitor._init', str(exc))
@@ -1841,6 +3043,22 @@ class LocalWorkflowStateMonitor(PatternMatchingEventHandler):
             return
 
         if event_type in ['created', 'modified']:
+            if file_type not in (PATTERNS, RECIPES):
+                return
+            previous = self.file_states.get((file_type, file_path))
+            state = self.get_file_state(file_type, file_path)
+            if state is None:
+                # File has gone, and its deletion will be handled separately
+                return
+            if previous and state[2] == previous[2]:
+                self.file_states[(file_type, file_path)] = state
+                self.to_logger.send(
+                    (
+                        'LocalWorkflowStateMonitor.update_rules',
+                        "Ignoring unchanged file at %s" % src_path
+                    )
+                )
+                return
             if file_type == PATTERNS:
                 try:
                     pattern = read_dir_pattern(
@@ -1862,7 +3080,7 @@ class LocalWorkflowStateMonitor(PatternMatchingEventHandler):
                     )
                     return
                 self.add_pattern(pattern)
-            elif file_type == RECIPES:
+            else:
                 try:
                     recipe = read_dir_recipe(
                         file_path,
@@ -1877,35 +3095,132 @@ class LocalWorkflowStateMonitor(PatternMatchingEventHandler):
                     )
                     return
                 self.add_recipe(recipe)
+            self.file_states[(file_type, file_path)] = state
         elif event_type == 'deleted':
+            self.file_states.pop((file_type, file_path), None)
             if file_type == PATTERNS:
                 self.remove_pattern(file_path)
             elif file_type == RECIPES:
                 self.remove_recipe(file_path)
 
+    def get_file_state(self, file_type, file_path):
+        """
+        Gets the state of a pattern or recipe file. The file is only hashed
+        if its size or modification time differ from when it was last read,
+        so that unchanged files need not be read at all.
+
+        :param file_type: (str) Either PATTERNS or RECIPES.
+
+        :param file_path: (str) Name of the file within its directory.
+
+        :return: (Tuple(int, int, str)) The file's size, modification time
+        in nanoseconds and hash, or None if it could not be found.
+        """
+        if file_type == PATTERNS:
+            directory = get_runner_patterns(self.meow_data)
+        else:
+            directory = get_runner_recipes(self.meow_data)
+        path = os.path.join(directory, file_path)
+        try:
+            stats = os.stat(path)
+            previous = self.file_states.get((file_type, file_path))
+            if previous \
+                    and previous[:2] == (stats.st_size, stats.st_mtime_ns):
+                return previous
+            return stats.st_size, stats.st_mtime_ns, hash_file(path)
+        except OSError:
+            return None
+
+    def handle_event(self, event):
+        if getattr(event, QUEUE_OVERFLOW, False):
+            self.to_logger.send(
+                (
+                    'LocalWorkflowFileMonitor.handle_event',
+                    "Event queue overflowed for '%s'. Rescanning watched "
+                    "directories. " % event.src_path
+                )
+            )
+            return
+
+        if event.is_directory:
+            return
+        if self.debounce_period:
+            self.debounce(event)
+        else:
+            self.update_rules(event)
+
+    def debounce(self, event):
+        """
+        Holds back an event until there have been no further events for its
+        file for the debounce period. Any held back event for the same file
+        is replaced, so only the last of a burst of events is handled.
+
+        :param event: (FileSystemEvent) The event to hold back.
+
+        :return: No return.
+        """
+        with self._debounce_condition:
+            self._debounced[event.src_path] = \
+                (event, time.time() + self.debounce_period)
+            if not self._debounce_thread:
+                self._debounce_thread = threading.Thread(
+                    target=self.__debounce_loop,
+                    daemon=True
+                )
+                self._debounce_thread.start()
+            self._debounce_condition.notify()
+
+    def __debounce_loop(self):
+        while True:
+            due = []
+            with self._debounce_condition:
+                while not self._debounced:
+                    self._debounce_condition.wait()
+                now = time.time()
+                deadline = min(
+                    entry[1] for entry in self._debounced.values())
+                if deadline > now:
+                    self._debounce_condition.wait(deadline - now)
+                    continue
+                for src_path, (event, deadline) \
+                        in list(self._debounced.items()):
+                    if deadline <= now:
+                        self._debounced.pop(src_path)
+                        due.append(event)
+            try:
+                for event in due:
+                    self.update_rules(event)
+            # Events held back while the runner stops can find the
+            # administrator or logger gone, so there is nothing left to do.
+            except (BrokenPipeError, EOFError):
+                with self._debounce_condition:
+                    self._debounced.clear()
+                    self._debounce_thread = None
+                return
+
     def on_modified(self, event):
         """Handle modified rule file"""
 
-        self.update_rules(event)
+        self.handle_event(event)
 
     def on_created(self, event):
         """Handle new rule file"""
 
-        self.update_rules(event)
+        self.handle_event(event)
 
     def on_deleted(self, event):
         """Handle deleted rule file"""
 
-        self.update_rules(event)
+        self.handle_event(event)
 
     def add_pattern(self, pattern):
         op = OP_CREATE
         if pattern.name in self.state_patterns:
             if self.state_patterns[pattern.name] == pattern:
                 return
-            else:
-                self.remove_pattern(pattern.name)
-                op = OP_MODIFIED
+            # Not removed first, so that the administrator can keep any
+            # rules the modification does not affect.
+            op = OP_MODIFIED
         self.state_patterns[pattern.name] = pattern
 
         msg = {
@@ -1921,7 +3236,13 @@ class LocalWorkflowStateMonitor(PatternMatchingEventHandler):
             )
         )
 
+    def slim_recipe(self, recipe):
+        if self.notebooks:
+            return self.notebooks.slim_recipe(recipe)
+        return recipe
+
     def add_recipe(self, recipe):
+        recipe = self.slim_recipe(recipe)
         op = OP_CREATE
         if recipe[NAME] in self.state_recipes:
             if self.state_recipes[recipe[NAME]] == recipe:
@@ -2004,8 +3325,32 @@ class LocalWorkflowFileMonitor(PatternMatchingEventHandler):
     def __init__(
             self, to_admin, to_logger, patterns=None,
             ignore_patterns=None, ignore_directories=False,
-            case_sensitive=False):
-        """Constructor"""
+            case_sensitive=False, trigger_mode=TRIGGER_MODIFIED,
+            quiet_period=DEFAULT_QUIET_PERIOD, from_admin=None, vgrid=None):
+        """
+        Constructor
+
+        :param trigger_mode: (str)[optional] When a file event should trigger
+        jobs. 'modified' triggers on every creation or modification.
+        'closed' triggers only once a file is closed after being written, or
+        is moved into place. This relies on close events, which are only
+        reported on Linux. 'quiet' triggers once a file has been neither
+        resized nor modified for quiet_period seconds. Default is 'modified'.
+
+        :param quiet_period: (int or float)[optional] Seconds a file must be
+        unchanged for before triggering in 'quiet' mode. Default is
+        DEFAULT_QUIET_PERIOD.
+
+        :param from_admin: (Connection)[optional] Pipe connection on which
+        the administrator sends its current rules whenever they change. If
+        provided, events are matched against a copy of these rules here, and
+        any matching no rule are discarded. Only the event type, path and
+        ids of matched rules are then sent to the administrator. If not
+        provided, all events are sent to the administrator to be matched.
+
+        :param vgrid: (str)[optional] The vgrid being monitored. Required if
+        from_admin is provided.
+        """
 
         PatternMatchingEventHandler.__init__(
             self,
@@ -2018,6 +3363,23 @@ class LocalWorkflowFileMonitor(PatternMatchingEventHandler):
         self.to_admin = to_admin
         self.recent_jobs = {}
         self._recent_jobs_lock = threading.Lock()
+        self.trigger_mode = trigger_mode
+        self.quiet_period = quiet_period
+        self._quiet_files = {}
+        self._quiet_condition = threading.Condition()
+        self._quiet_thread = None
+        self.from_admin = from_admin
+        self.vgrid = vgrid
+        self.rule_index = None
+        self._rule_listeners = []
+        self._rule_listeners_lock = threading.Lock()
+        if from_admin:
+            self.rule_index = RuleIndex()
+            rule_listener = threading.Thread(
+                target=self.__receive_rules,
+                daemon=True
+            )
+            rule_listener.start()
 
         self.to_logger.send(
             (
@@ -2026,6 +3388,54 @@ class LocalWorkflowFileMonitor(PatternMatchingEventHandler):
             )
         )
 
+    def __receive_rules(self):
+        while True:
+            try:
+                rules = self.from_admin.recv()
+                # Only the most recent rules matter
+                while self.from_admin.poll():
+                    rules = self.from_admin.recv()
+            except (EOFError, OSError):
+                return
+            # Replaced rather than updated, so that events being matched in
+            # other threads always see a complete index.
+            self.rule_index = RuleIndex(rules)
+            rule_paths = [rule[RULE_PATH] for rule in rules]
+            with self._rule_listeners_lock:
+                listeners = list(self._rule_listeners)
+            for listener in listeners:
+                listener(rule_paths)
+
+    def add_rule_listener(self, listener):
+        """
+        Registers a function to be called with the current rule paths
+        whenever the rules change. It is called immediately with the rules
+        as they currently are.
+
+        :param listener: (function) Function taking a list of rule trigger
+        paths.
+
+        :return: No return.
+        """
+        with self._rule_listeners_lock:
+            self._rule_listeners.append(listener)
+        if self.rule_index is not None:
+            listener(
+                [rule[RULE_PATH] for rule in self.rule_index.rules()])
+
+    def match_rules(self, src_path):
+        """
+        Gets the ids of the rules matching an event path.
+
+        :param src_path: (str) The path of the event.
+
+        :return: (list) The ids of all matching rules.
+        """
+        return [
+            rule[RULE_ID] for rule in
+            self.rule_index.match(get_vgrid_path(src_path, self.vgrid))
+        ]
+
     def __handle_trigger(self, event):
         pid = current_process().pid
         event_type = event.event_type
@@ -2074,7 +3484,11 @@ class LocalWorkflowFileMonitor(PatternMatchingEventHandler):
             )
         )
 
-        self.to_admin.send(event)
+        rule_ids = getattr(event, _rule_ids, None)
+        if rule_ids is None:
+            self.to_admin.send(event)
+        else:
+            self.to_admin.send((event_type, src_path, rule_ids))
 
     def run_handler(self, event):
         waiting_for_threaded_resources = True
@@ -2090,21 +3504,112 @@ class LocalWorkflowFileMonitor(PatternMatchingEventHandler):
                 time.sleep(1)
 
     def handle_event(self, event):
+        if getattr(event, QUEUE_OVERFLOW, False):
+            self.to_logger.send(
+                (
+                    'LocalWorkflowFileMonitor.handle_event',
+                    "Event queue overflowed for '%s'. Rescanning watched "
+                    "directories. " % event.src_path
+                )
+            )
+            return
+
         if event.is_directory:
             return
 
-        if event.event_type not in ['created', 'modified']:
+        if event.event_type not in TRIGGER_EVENT_TYPES[self.trigger_mode]:
+            # Files moved into place, or reported by an event source only
+            # once written, are already complete.
+            if self.trigger_mode != TRIGGER_CLOSED \
+                    or not getattr(event, WRITE_COMPLETE, False):
+                return
+
+        # Most events match no rule, so are best discarded before any
+        # threads or inter process communication are involved.
+        if self.rule_index is not None:
+            rule_ids = self.match_rules(event.src_path)
+            if not rule_ids:
+                return
+            setattr(event, _rule_ids, rule_ids)
+
+        if self.trigger_mode == TRIGGER_QUIET:
+            self.wait_for_quiet(event)
             return
 
         event.time_stamp = time.time()
 
         self.run_handler(event)
 
+    def get_file_state(self, path):
+        try:
+            stats = os.stat(path)
+        except OSError:
+            return None
+        return stats.st_size, stats.st_mtime_ns
+
+    def wait_for_quiet(self, event):
+        """
+        Holds back an event until its file has been unchanged for the quiet
+        period. Any further events for the same file restart the wait.
+
+        :param event: (FileSystemEvent) The event to hold back.
+
+        :return: No return.
+        """
+        state = self.get_file_state(event.src_path)
+        if state is None:
+            return
+        with self._quiet_condition:
+            self._quiet_files[event.src_path] = \
+                (event, state, time.time() + self.quiet_period)
+            if not self._quiet_thread:
+                self._quiet_thread = threading.Thread(
+                    target=self.__quiet_loop,
+                    daemon=True
+                )
+                self._quiet_thread.start()
+            self._quiet_condition.notify()
+
+    def __quiet_loop(self):
+        while True:
+            quiet = []
+            with self._quiet_condition:
+                while not self._quiet_files:
+                    self._quiet_condition.wait()
+                now = time.time()
+                deadline = min(
+                    entry[2] for entry in self._quiet_files.values())
+                if deadline > now:
+                    self._quiet_condition.wait(deadline - now)
+                    continue
+                for src_path, (event, state, deadline) \
+                        in list(self._quiet_files.items()):
+                    if deadline > now:
+                        continue
+                    current = self.get_file_state(src_path)
+                    if current is None:
+                        # File has gone, so there is nothing to trigger on
+                        self._quiet_files.pop(src_path)
+                    elif current == state:
+                        self._quiet_files.pop(src_path)
+                        quiet.append(event)
+                    else:
+                        self._quiet_files[src_path] = \
+                            (event, current, now + self.quiet_period)
+            for event in quiet:
+                event.time_stamp = time.time()
+                self.run_handler(event)
+
     def on_modified(self, event):
         """Handle modified files"""
 
         self.handle_event(event)
 
+    def on_closed(self, event):
+        """Handle files closed after writing"""
+
+        self.handle_event(event)
+
     def on_created(self, event):
         """Handle created files"""
 
@@ -2123,4 +3628,5 @@ class LocalWorkflowFileMonitor(PatternMatchingEventHandler):
             'created',
             event.is_directory
         )
+        setattr(fake, WRITE_COMPLETE, True)
         self.handle_event(fake)
@@ -2,7 +2,6 @@ import copy
 import json
 import re
 import os
-import nbformat
 
 from .constants import NOTEBOOK_EXTENSIONS, DESCENDANTS, WORKFLOW_INPUTS, \
     WORKFLOW_OUTPUTS, ANCESTORS, DEFAULT_JOB_NAME, CHAR_UPPERCASE, \
@@ -12,7 +11,7 @@ from .constants import NOTEBOOK_EXTENSIONS, DESCENDANTS, WORKFLOW_INPUTS, \
     INVALID_INPUT_PATH_ERROR, SWEEP_START, SWEEP_STOP, SWEEP_JUMP, \
     MIG_TRIGGER_KEYWORDS, PERSISTENCE_ID, RECIPE_NAME, \
     PATTERN_NAME, INPUT_FILE, NAME, SWEEP, TRIGGER_PATHS, OUTPUT, RECIPES, \
-    VARIABLES, RECIPE, SOURCE, ENVIRONMENTS
+    VARIABLES, RECIPE, SOURCE, ENVIRONMENTS, CHUNK_SIZE
 from .validation import valid_string, is_valid_pattern_dict, \
     valid_file_path, valid_param_sweep, \
     check_input, is_valid_recipe_dict, valid_pattern_name, \
@@ -135,29 +134,198 @@ def parameter_sweep_entry(name, start, stop, increment):
     }
 
 
+# Relative slack allowed when deciding if a float sweep reaches its stop
+SWEEP_TOLERANCE = 1e-9
+SWEEP_BACKENDS = ['python', 'numpy']
+
+
+class ParameterSweep:
+    """
+    The values of a parameter sweep. Each value is worked out from its index,
+    as start + index * increment, so float error does not build up across
+    the sweep and its stop is neither missed nor overshot. Values are only
+    worked out as they are needed, so the length of a sweep, or any part of
+    it, can be had without making every value.
+    """
+    __slots__ = ('start', 'stop', 'increment', 'count')
+
+    def __init__(self, sweep):
+        """
+        Constructor for a ParameterSweep. Will raise a ValueError if the
+        sweep is not valid.
+
+        :param sweep: (dict) The parameter sweep, as created by
+        parameter_sweep_entry.
+        """
+        valid_param_sweep(sweep, 'parameter_sweep')
+
+        self.start = sweep[SWEEP_START]
+        self.stop = sweep[SWEEP_STOP]
+        self.increment = sweep[SWEEP_JUMP]
+
+        if isinstance(self.start, int):
+            self.count = (self.stop - self.start) // self.increment + 1
+        else:
+            steps = (self.stop - self.start) / self.increment
+            self.count = \
+                int(steps + SWEEP_TOLERANCE * max(1.0, abs(steps))) + 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.value(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.value(i) for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(
+                'Parameter sweep index %s out of range. ' % index)
+        return self.value(index)
+
+    def value(self, index):
+        """
+        Gets a single value of the sweep. The last value is never past the
+        stop of the sweep, and is the stop itself if within float error of
+        it.
+
+        :param index: (int) Index of the value, which must be within the
+        sweep.
+
+        :return: (int or float) The value.
+        """
+        value = self.start + index * self.increment
+        if index == self.count - 1 and isinstance(value, float):
+            overshoot = (value - self.stop) * self.increment
+            if overshoot > 0 or abs(value - self.stop) \
+                    <= SWEEP_TOLERANCE * abs(self.stop - self.start):
+                return self.stop
+        return value
+
+    def ranges(self, size):
+        """
+        Splits the sweep into consecutive ranges of indexes, so that the
+        sweep can be shared out in parts.
+
+        :param size: (int) Most indexes in each range.
+
+        :return: (generator) The ranges.
+        """
+        check_input(size, int, 'size')
+        if size < 1:
+            raise ValueError('Range size must be at least 1, not %s. ' % size)
+        for first in range(0, self.count, size):
+            yield range(first, min(first + size, self.count))
+
+    def values(self, indexes=None, backend='python'):
+        """
+        Gets many values of the sweep at once.
+
+        :param indexes: (range)[optional] The indexes of the values. If not
+        provided, every value is returned.
+
+        :param backend: (str)[optional] How to make the values, either
+        'python' for a list or 'numpy' for a numpy array. Default is
+        'python'.
+
+        :return: (list or numpy.ndarray) The values.
+        """
+        if indexes is None:
+            indexes = range(self.count)
+        check_input(indexes, range, 'indexes')
+        if backend not in SWEEP_BACKENDS:
+            raise ValueError(
+                "Unknown backend '%s'. Valid backends are %s. "
+                % (backend, SWEEP_BACKENDS)
+            )
+        indexes = range(*slice(
+            indexes.start, indexes.stop, indexes.step).indices(self.count))
+
+        if backend == 'python':
+            start = self.start
+            increment = self.increment
+            values = [start + index * increment for index in indexes]
+        else:
+            # Only imported here as it is an optional dependency
+            import numpy
+            values = self.start + numpy.arange(
+                indexes.start, indexes.stop, indexes.step) * self.increment
+        if len(values) and indexes[-1] == self.count - 1:
+            values[-1] = self.value(self.count - 1)
+        return values
+
+    def chunks(self, size, backend='python'):
+        """
+        Iterates over the sweep in chunks of values.
+
+        :param size: (int) Most values in each chunk.
+
+        :param backend: (str)[optional] How to make each chunk, either
+        'python' for a list or 'numpy' for a numpy array. Default is
+        'python'.
+
+        :return: (generator) The chunks.
+        """
+        for indexes in self.ranges(size):
+            yield self.values(indexes, backend=backend)
+
+
 def get_parameter_sweep_values(sweep):
     """
+    Gets every value of a parameter sweep.
+
+    :param sweep: (dict) The parameter sweep, as created by
+    parameter_sweep_entry.
 
-    :param sweep:
-    :return:
+    :return: (list) The values.
     """
-    valid_param_sweep(sweep, 'parameter_sweep')
+    return ParameterSweep(sweep).values()
 
-    variables = []
 
-    start = sweep[SWEEP_START]
-    stop = sweep[SWEEP_STOP]
-    increment = sweep[SWEEP_JUMP]
+def freeze_value(value):
+    """
+    Converts a value into a hashable form, so that values which compare as
+    equal also have equal forms. Any value that cannot otherwise be hashed is
+    represented only by its type, as equal values need not have equal reprs.
 
-    par_val = start
-    while par_val <= stop:
-        variables.append(par_val)
-        par_val += increment
+    :param value: (any) The value to convert.
 
-    return variables
+    :return: (any) A hashable form of the value.
+    """
+    if isinstance(value, dict):
+        return frozenset(
+            (key, freeze_value(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_value(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze_value(item) for item in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return type(value).__name__
 
 
 class Pattern:
+    # Fixed attributes, so that large numbers of patterns stay compact.
+    # persistence_id is only set for patterns registered with the MiG.
+    __slots__ = (
+        'name',
+        'trigger_file',
+        'trigger_paths',
+        'recipes',
+        'outputs',
+        'variables',
+        'sweep',
+        'chunk_size',
+        'persistence_id',
+        '_hash'
+    )
+
     def __init__(self, parameters):
         """
         Constructor for new pattern object. Used within MEOW as a more user
@@ -171,6 +339,7 @@ class Pattern:
         pattern. The dict option is used during the importing of data from
         the mig and should only be used by expert users.
         """
+        self._hash = None
         # if given only a string use this as a name, it is the basis of a
         # completely new pattern
         if isinstance(parameters, str):
@@ -182,6 +351,7 @@ class Pattern:
             self.outputs = {}
             self.variables = {}
             self.sweep = {}
+            self.chunk_size = None
         # if given dict we are importing from a stored pattern object
         elif isinstance(parameters, dict):
             valid, msg = is_valid_pattern_dict(parameters)
@@ -199,6 +369,7 @@ class Pattern:
             self.outputs = {}
             self.variables = {}
             self.sweep = {}
+            self.chunk_size = None
 
             self.trigger_file = copy.deepcopy(parameters[INPUT_FILE])
 
@@ -227,6 +398,9 @@ class Pattern:
             if SWEEP in parameters:
                 for name, value in parameters[SWEEP].items():
                     self.add_param_sweep(name, value)
+
+            if CHUNK_SIZE in parameters:
+                self.set_chunk_size(parameters[CHUNK_SIZE])
         else:
             raise TypeError(
                 'Pattern requires either a str input as a name for a new '
@@ -234,6 +408,56 @@ class Pattern:
                 'given a %s. ' % type(parameters)
             )
 
+    def __setattr__(self, name, value):
+        # Any change to the pattern invalidates its hash
+        object.__setattr__(self, name, value)
+        if not name.startswith('_'):
+            object.__setattr__(self, '_hash', None)
+
+    def __delattr__(self, name):
+        object.__delattr__(self, name)
+        object.__setattr__(self, '_hash', None)
+
+    def __getstate__(self):
+        # Cached values are not kept, as str hashes differ between
+        # interpreters
+        return {
+            slot: getattr(self, slot) for slot in self.__slots__
+            if not slot.startswith('_') and hasattr(self, slot)
+        }
+
+    def __setstate__(self, state):
+        self._hash = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __hash__(self):
+        """
+        Gets a hash of the Pattern's contents. This is only worked out once
+        and is then cached until the Pattern is changed, either by setting
+        one of its attributes or through one of its add methods. Changes made
+        directly to its lists or dicts are not noticed, so should be made
+        through the add methods or by setting the changed attribute again.
+        As such, a Pattern should not be changed while used as a dict key or
+        set member.
+
+        :return: (int) The hash.
+        """
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash((
+                self.name,
+                self.trigger_file,
+                freeze_value(self.trigger_paths),
+                freeze_value(self.recipes),
+                freeze_value(self.outputs),
+                freeze_value(self.variables),
+                freeze_value(self.sweep),
+                self.chunk_size,
+                hasattr(self, 'persistence_id'),
+                freeze_value(getattr(self, 'persistence_id', None))
+            )))
+        return self._hash
+
     def __str__(self):
         """
         Creates a string that expressed the current state of the Pattern
@@ -267,11 +491,12 @@ class Pattern:
         :return: (bool) True/False, with True denoting that the two Pattern
         objects are equal.
         """
-
-        if not other:
-            return False
+        if self is other:
+            return True
         if not isinstance(other, Pattern):
             return False
+        # Fields are always compared, as a cached hash is out of date if a
+        # list or dict has been changed in place.
         if self.name != other.name:
             return False
         if self.trigger_file != other.trigger_file:
@@ -286,23 +511,14 @@ class Pattern:
             return False
         if self.sweep != other.sweep:
             return False
-        count = 0
-        try:
-            self.persistence_id
-            count += 1
-        except AttributeError:
-            pass
-        try:
-            other.persistence_id
-            count += 1
-        except AttributeError:
-            pass
-        if count == 1:
+        if self.chunk_size != other.chunk_size:
+            return False
+        # A pattern with a persistence_id never equals one without, even if
+        # the id is None, in keeping with __hash__.
+        if hasattr(self, 'persistence_id') != hasattr(other, 'persistence_id'):
             return False
-        if count == 2:
-            if self.persistence_id != other.persistence_id:
-                return False
-        return True
+        return getattr(self, 'persistence_id', None) \
+            == getattr(other, 'persistence_id', None)
 
     def display_dag_str(self):
         """
@@ -452,6 +668,7 @@ class Pattern:
 
         if output_name not in self.outputs.keys():
             self.outputs[output_name] = output_location
+            self._hash = None
         else:
             raise Exception('Could not create output %s as already defined'
                             % output_name)
@@ -488,6 +705,7 @@ class Pattern:
         """
         check_input(recipe, str, 'recipe')
         self.recipes.append(recipe)
+        self._hash = None
 
     def add_variable(self, variable_name, variable_value):
         """
@@ -509,6 +727,7 @@ class Pattern:
                      + CHAR_LINES)
         if variable_name not in self.variables.keys():
             self.variables[variable_name] = variable_value
+            self._hash = None
         else:
             raise ValueError(
                 'Could not create variable %s as a variable with this '
@@ -543,6 +762,7 @@ class Pattern:
 
         if name not in self.sweep.keys():
             self.sweep[name] = sweep_dict
+            self._hash = None
         else:
             raise ValueError(
                 'Could not create parameter sweeping variable %s as a '
@@ -550,6 +770,26 @@ class Pattern:
                 'defined. ' % name
             )
 
+    def set_chunk_size(self, chunk_size):
+        """
+        Sets how many parameter sweep values are given to each job. By
+        default each value of a parameter sweep is processed as its own job,
+        so sweeps of many quick values spend most of their time creating and
+        starting jobs. If a chunk size is set, consecutive values are instead
+        given to the recipe together as a list, which it should loop over
+        within a single job, writing results for each value.
+
+        :param chunk_size: (int) Most sweep values given to a single job. If
+        None, each value is given to its own job.
+
+        :return: No return.
+        """
+        check_input(chunk_size, int, 'chunk_size', or_none=True)
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError(
+                'Chunk size must be at least 1, not %s. ' % chunk_size)
+        self.chunk_size = chunk_size
+
     def to_display_dict(self):
         """
         Creates a dictionary of the current pattern state to be displayed as
@@ -632,6 +872,8 @@ def create_recipe_dict(notebook, name, source, environments=None):
         source,
        'recipe source'
     )
+    # Only imported here as it is slow to import, and rarely needed
+    import nbformat
     nbformat.validate(notebook)
 
     recipe = {
@@ -1,4 +1,3 @@
-import requests
 import json
 import traceback
 import os
@@ -38,6 +37,24 @@ def _get_pattern_attributes(pattern):
     }
 
 
+def check_mig_pattern(pattern):
+    """
+    Checks that a pattern can be run on the MiG. Raises a ValueError if it
+    cannot.
+
+    :param pattern: (Pattern) The Pattern object to check.
+
+    :return: No return.
+    """
+    # The MiG gives each job a single sweep value, so would not run the jobs
+    # a chunked pattern describes.
+    if pattern.chunk_size:
+        raise ValueError(
+            "%s '%s' has a chunk_size of %s, which is not supported by the "
+            "MiG. " % (PATTERN_NAME, pattern.name, pattern.chunk_size)
+        )
+
+
 def _get_recipe_attributes(recipe):
     """
     Turns a recipe into a dictionary of attributes to be sent to the MiG.
@@ -81,6 +98,8 @@ def export_pattern_to_vgrid(vgrid, pattern, timeout=DEFAULT_JSON_TIMEOUT):
             'The provided pattern is not a valid Pattern. %s' % msg
         )
 
+    check_mig_pattern(pattern)
+
     attributes = _get_pattern_attributes(pattern)
 
     return vgrid_workflow_json_call(
@@ -436,6 +455,10 @@ def __vgrid_json_call(
         'sending request to  %s with data: %s' % (url, data)
     )
 
+    # Only imported here as it is slow to import, and only needed when
+    # connected to a VGrid
+    import requests
+
     try:
         response = requests.post(
             url,
@@ -549,6 +572,11 @@ def write_vgrid(
     check_input(patterns, dict, 'patterns', or_none=True)
     check_input(recipes, dict, 'recipes', or_none=True)
 
+    # Checked before anything is written, so that the VGrid is not left
+    # partly updated.
+    for pattern in patterns.values():
+        check_mig_pattern(pattern)
+
     updated_patterns = {}
     for pattern in patterns.values():
         new_pattern = write_vgrid_pattern(
@@ -691,6 +719,7 @@ def write_vgrid_pattern(
 
     check_input(vgrid, str, VGRID)
     is_valid_pattern_object(pattern)
+    check_mig_pattern(pattern)
 
     attributes = {
         NAME: pattern.name,
@@ -1,10 +1,29 @@
 
+import importlib
+import sys
 import threading
 
 from .localrunner import WorkflowRunner
-from .workflow_widget import WorkflowWidget
-from .monitor_widget import MonitorWidget, update_monitor
-from .report_widget import ReportWidget
+
+# The widgets are only imported as they are used, as ipywidgets, bqplot and
+# graphviz are slow to import and are not needed to run workflows.
+
+
+def _import_widget(module_name):
+    """
+    Imports one of the widget modules. The first import of a submodule binds
+    it to the package, where it would hide the function here of the same
+    name, so these functions are bound to the package again.
+
+    :param module_name: (str) Name of the module, relative to the package.
+
+    :return: (module) The imported module.
+    """
+    module = importlib.import_module(module_name, __package__)
+    package = sys.modules[__package__]
+    for function in (workflow_widget, monitor_widget, report_widget):
+        setattr(package, function.__name__, function)
+    return module
 
 
 def workflow_widget(**kwargs):
@@ -15,7 +34,7 @@ def workflow_widget(**kwargs):
     :return: (function call to 'WorkflowWidget.display_widget)
     """
 
-    widget = WorkflowWidget(**kwargs)
+    widget = _import_widget('.workflow_widget').WorkflowWidget(**kwargs)
 
     return widget.display_widget()
 
@@ -28,10 +47,11 @@ def monitor_widget(**kwargs):
     :return: (function call to 'MonitorWidget.display_widget)
     """
 
-    widget = MonitorWidget(**kwargs)
+    module = _import_widget('.monitor_widget')
+    widget = module.MonitorWidget(**kwargs)
 
     monitor_thread = threading.Thread(
-        target=update_monitor,
+        target=module.update_monitor,
         args=(widget,),
         daemon=True
     )
@@ -48,7 +68,7 @@ def report_widget(**kwargs):
     :return:
     """
 
-    widget = ReportWidget(**kwargs)
+    widget = _import_widget('.report_widget').ReportWidget(**kwargs)
 
     return widget.display_widget()
 
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from collections import OrderedDict
+
+from .constants import RECIPE
+
+# Directory within a runner's job directory in which notebooks are stored
+NOTEBOOK_STORE_DIR = '.notebooks'
+# Number of notebooks kept in memory by a NotebookStore
+NOTEBOOK_CACHE_SIZE = 64
+NOTEBOOK_EXTENSION = '.ipynb'
+# Seconds a notebook is kept after last being stored, even if unused, as it
+# may have been stored by another process that is yet to refer to it
+NOTEBOOK_SWEEP_AGE = 60
+
+# Key replacing a recipe's notebook with the notebook's hash
+RECIPE_HASH = 'recipe_hash'
+
+
+def serialise_notebook(notebook):
+    """
+    Gets the canonical form of a notebook, so that the same notebook is
+    always stored and hashed the same way.
+
+    :param notebook: (dict) The notebook.
+
+    :return: (bytes) The notebook as JSON, with sorted keys.
+    """
+    return json.dumps(
+        notebook, sort_keys=True, separators=(',', ':')).encode()
+
+
+def notebook_digest(notebook):
+    """
+    Gets the hash of a notebook, as used to store it in a NotebookStore.
+
+    :param notebook: (dict) The notebook.
+
+    :return: (str) A hex digest of the notebook.
+    """
+    return hashlib.sha256(serialise_notebook(notebook)).hexdigest()
+
+
+class NotebookStore:
+    """
+    Content-addressed store of recipe notebooks. Each notebook is written to
+    disk once, named by its hash, so that recipes can refer to it by that
+    hash rather than carrying the notebook itself. The most recently used
+    notebooks are also kept in memory.
+
+    Stored notebooks are never modified, so can be hard linked into job
+    directories rather than copied. They are made read only to guard
+    against them being modified through such a link.
+    """
+    def __init__(self, directory, cache_size=NOTEBOOK_CACHE_SIZE):
+        """
+        Constructor for a NotebookStore. Any notebooks already in directory
+        are part of the store.
+
+        :param directory: (str) Directory the notebooks are stored in. This
+        is created when the first notebook is stored.
+
+        :param cache_size: (int)[optional] Number of notebooks to keep in
+        memory. Default is NOTEBOOK_CACHE_SIZE.
+        """
+        self.directory = directory
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def path(self, digest):
+        """
+        Gets the path a notebook is stored at.
+
+        :param digest: (str) The notebook's hash.
+
+        :return: (str) The path of the stored notebook.
+        """
+        return os.path.join(
+            self.directory, digest[:2], digest + NOTEBOOK_EXTENSION)
+
+    def _remember(self, digest, notebook):
+        # An equal notebook that is already held is kept, so that repeatedly
+        # storing copies of a notebook does not keep replacing it.
+        self._cache.setdefault(digest, notebook)
+        self._cache.move_to_end(digest)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _write(self, digest, contents):
+        path = self.path(digest)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Written under a temporary name first, so that a partly written
+        # notebook is never linked into a job.
+        handle, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                temp_file.write(contents)
+            os.chmod(temp_path, 0o444)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def put(self, notebook):
+        """
+        Adds a notebook to the store, if it is not already present.
+
+        :param notebook: (dict) The notebook.
+
+        :return: (str) The notebook's hash.
+        """
+        contents = serialise_notebook(notebook)
+        digest = hashlib.sha256(contents).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            # Marked as recently stored, so that it is not swept away
+            os.utime(path)
+        else:
+            self._write(digest, contents)
+        self._remember(digest, notebook)
+        return digest
+
+    def get(self, digest):
+        """
+        Gets a notebook from the store. The notebook may be shared with
+        other callers, so should not be modified.
+
+        :param digest: (str) The notebook's hash.
+
+        :return: (dict) The notebook.
+        """
+        if digest in self._cache:
+            self._cache.move_to_end(digest)
+            return self._cache[digest]
+        with open(self.path(digest), 'rb') as notebook_file:
+            notebook = json.loads(notebook_file.read().decode())
+        self._remember(digest, notebook)
+        return notebook
+
+    def link(self, digest, destination):
+        """
+        Places a stored notebook at a given path, as a hard link if possible
+        and otherwise as a copy. A notebook still held in memory is stored
+        again if its file has since been removed.
+
+        :param digest: (str) The notebook's hash.
+
+        :param destination: (str) The path to place the notebook at.
+
+        :return: No return.
+        """
+        path = self.path(digest)
+        if not os.path.exists(path) and digest in self._cache:
+            self._write(digest, serialise_notebook(self._cache[digest]))
+        try:
+            os.link(path, destination)
+        # Links cannot be made across file systems, or past a file system's
+        # limit on links to a single file.
+        except OSError:
+            shutil.copyfile(path, destination)
+
+    def sweep(self, keep, min_age=NOTEBOOK_SWEEP_AGE):
+        """
+        Removes stored notebooks that are no longer needed. Jobs given a
+        link to a notebook keep their copy, as a link is a separate name for
+        the same file.
+
+        :param keep: (set) Hashes of the notebooks still needed.
+
+        :param min_age: (int)[optional] Seconds since a notebook was last
+        stored before it may be removed. Default is NOTEBOOK_SWEEP_AGE.
+
+        :return: (list) Hashes of the removed notebooks.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        cutoff = time.time() - min_age
+        removed = []
+        with os.scandir(self.directory) as prefixes:
+            for prefix in prefixes:
+                if not prefix.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(prefix.path) as entries:
+                    for entry in entries:
+                        digest, extension = os.path.splitext(entry.name)
+                        if extension != NOTEBOOK_EXTENSION or digest in keep:
+                            continue
+                        # May have been removed or stored again meanwhile
+                        try:
+                            if entry.stat().st_mtime > cutoff:
+                                continue
+                            os.remove(entry.path)
+                        except OSError:
+                            continue
+                        self._cache.pop(digest, None)
+                        removed.append(digest)
+        return removed
+
+    def slim_recipe(self, recipe):
+        """
+        Stores a recipe's notebook, and replaces it with its hash.
+
+        :param recipe: (dict) The recipe. If this already refers to its
+        notebook by hash it is returned unchanged.
+
+        :return: (dict) A copy of the recipe, with the notebook replaced.
+        """
+        if RECIPE not in recipe:
+            return recipe
+        slim = {k: v for k, v in recipe.items() if k != RECIPE}
+        slim[RECIPE_HASH] = self.put(recipe[RECIPE])
+        return slim
+
+    def expand_recipe(self, recipe):
+        """
+        Reverses slim_recipe, restoring a recipe's notebook.
+
+        :param recipe: (dict) The recipe. If this already contains its
+        notebook it is returned unchanged.
+
+        :return: (dict) A copy of the recipe, with its notebook.
+        """
+        if RECIPE_HASH not in recipe:
+            return recipe
+        expanded = {k: v for k, v in recipe.items() if k != RECIPE_HASH}
+        expanded[RECIPE] = self.get(recipe[RECIPE_HASH])
+        return expanded
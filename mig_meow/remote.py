@@ -0,0 +1,356 @@
+import io
+import os
+import posixpath
+import shlex
+import tarfile
+import threading
+
+from .constants import SSH_HOSTNAME, SSH_USER, SSH_CERT, SSH_MOUNT, SSH_PORT, \
+    SSH_KNOWN_HOSTS, SSH_AUTO_ADD_HOST_KEYS
+from .inputs import hash_file
+
+DEFAULT_SSH_PORT = 22
+# Host keys trusted by every user of the system
+SYSTEM_KNOWN_HOSTS = '/etc/ssh/ssh_known_hosts'
+# Seconds to wait on the remote host before giving up on a connection
+SSH_TIMEOUT = 30
+# Seconds between keepalive messages, so that a dropped link is noticed
+SSH_KEEPALIVE = 15
+# Directory within a worker's mount in which inputs are kept by their hash
+INPUT_CACHE_DIR = '.inputs'
+# Compression of staged files, trading transfer size against time spent
+STAGING_COMPRESSION = 6
+
+
+def make_archive(files):
+    """
+    Packs files into a compressed tar archive.
+
+    :param files: (list) The files to pack, as tuples of the local path and
+    the name to give the file within the archive.
+
+    :return: (bytes) The archive.
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz',
+                      compresslevel=STAGING_COMPRESSION) as archive:
+        for local_path, name in files:
+            archive.add(local_path, arcname=name, recursive=False)
+    return buffer.getvalue()
+
+
+def read_archive(data):
+    """
+    Reads the regular files from a compressed tar archive. Any file whose
+    name is absolute or leads outside of the archive is skipped.
+
+    :param data: (bytes) The archive.
+
+    :return: (generator) Tuples of each file's name and contents.
+    """
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            name = posixpath.normpath(member.name)
+            if posixpath.isabs(name) or name.split('/')[0] == '..':
+                continue
+            yield name, archive.extractfile(member).read()
+
+
+class SSHConnection:
+    """
+    Persistent SSH connection to a remote worker. A single connection is
+    kept open and shared by every job the worker processes, with each
+    command run over a new channel of it. If the connection drops, a new one
+    is made the next time a command is run.
+
+    paramiko is only imported once a connection is made, as it is slow to
+    import and only needed by remote workers.
+    """
+    def __init__(self, worker_def, timeout=SSH_TIMEOUT):
+        """
+        Constructor for an SSHConnection. No connection is made until one is
+        needed.
+
+        :param worker_def: (dict) The worker definition, as checked by
+        is_valid_ssh_worker.
+
+        :param timeout: (int)[optional] Seconds to wait on the remote host
+        before giving up on connecting. Default is SSH_TIMEOUT.
+        """
+        self.hostname = worker_def[SSH_HOSTNAME]
+        self.user = worker_def[SSH_USER]
+        self.key_filename = worker_def[SSH_CERT]
+        self.mount = worker_def[SSH_MOUNT]
+        self.port = worker_def.get(SSH_PORT, DEFAULT_SSH_PORT)
+        self.known_hosts = worker_def.get(SSH_KNOWN_HOSTS, None)
+        self.auto_add_host_keys = \
+            worker_def.get(SSH_AUTO_ADD_HOST_KEYS, False)
+        self.timeout = timeout
+        self.client = None
+        # Count of connections made, including any reconnections
+        self.connections = 0
+        # Hashes of the inputs known to be in the remote input cache
+        self.remote_inputs = set()
+        # Hashes of local inputs, by path, size and modification time
+        self._input_hashes = {}
+
+    def is_connected(self):
+        """
+        Checks if the connection is open. A connection that has dropped may
+        still be reported as open until the drop has been noticed.
+
+        :return: (bool) True if the connection is open.
+        """
+        if not self.client:
+            return False
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def connect(self):
+        """
+        Opens a new connection to the remote host, closing any existing one,
+        and creates the worker's mount directory.
+
+        :return: No return.
+        """
+        import paramiko
+
+        self.close()
+        client = paramiko.SSHClient()
+        # Hosts are checked against the system and user known hosts, and any
+        # given for the worker. An unknown host is refused unless the worker
+        # explicitly trusts new host keys.
+        if os.path.isfile(SYSTEM_KNOWN_HOSTS):
+            client.load_system_host_keys(SYSTEM_KNOWN_HOSTS)
+        client.load_system_host_keys()
+        if self.known_hosts:
+            client.load_host_keys(os.path.expanduser(self.known_hosts))
+        if self.auto_add_host_keys:
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        else:
+            client.set_missing_host_key_policy(paramiko.RejectPolicy())
+        client.connect(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.user,
+            key_filename=self.key_filename,
+            timeout=self.timeout,
+            allow_agent=False,
+            look_for_keys=False
+        )
+        client.get_transport().set_keepalive(SSH_KEEPALIVE)
+        self.client = client
+        self.connections += 1
+
+        self.execute('mkdir -p %s' % shlex.quote(self.mount))
+
+    def close(self):
+        if self.client:
+            self.client.close()
+            self.client = None
+
+    def open_channel(self):
+        """
+        Opens a new channel on the connection, reconnecting first if the
+        connection has dropped.
+
+        :return: (Channel) The open channel.
+        """
+        import paramiko
+
+        for attempt in range(2):
+            if not self.is_connected():
+                self.connect()
+            try:
+                return self.client.get_transport().open_session(
+                    timeout=self.timeout)
+            # A drop that has not yet been noticed is found here, so the
+            # channel is opened again on a new connection.
+            except (paramiko.SSHException, EOFError, OSError):
+                self.close()
+                if attempt:
+                    raise
+
+    def execute(self, command, stdin=None):
+        """
+        Runs a shell command on the remote host.
+
+        :param command: (str) The command to run.
+
+        :param stdin: (bytes)[optional] Data to write to the command's
+        standard input. Default is None.
+
+        :return: (Tuple(int, bytes, bytes)) The command's exit status,
+        standard output and standard error.
+        """
+        channel = self.open_channel()
+        try:
+            channel.exec_command(command)
+
+            # Standard error is read alongside standard output, so that
+            # neither can fill up and stall the command.
+            stderr = []
+            stderr_reader = threading.Thread(
+                target=lambda: stderr.append(
+                    channel.makefile_stderr('rb').read()),
+                daemon=True
+            )
+            stderr_reader.start()
+
+            if stdin:
+                channel.sendall(stdin)
+            channel.shutdown_write()
+
+            stdout = channel.makefile('rb').read()
+            stderr_reader.join()
+            status = channel.recv_exit_status()
+        finally:
+            channel.close()
+        return status, stdout, b''.join(stderr)
+
+    def remote_path(self, *paths):
+        """
+        Gets a path on the remote host, within the worker's mount directory.
+
+        :param paths: (str) Path components, relative to the mount.
+
+        :return: (str) The remote path.
+        """
+        return posixpath.join(self.mount, *paths)
+
+    def put_file(self, local_path, remote_path):
+        """
+        Copies a local file to the remote host, creating any missing
+        directories.
+
+        :param local_path: (str) The file to copy.
+
+        :param remote_path: (str) Where to copy it to.
+
+        :return: No return.
+        """
+        with open(local_path, 'rb') as input_file:
+            contents = input_file.read()
+        status, _, stderr = self.execute(
+            'mkdir -p %s && cat > %s' % (
+                shlex.quote(posixpath.dirname(remote_path) or '.'),
+                shlex.quote(remote_path)
+            ),
+            stdin=contents
+        )
+        if status:
+            raise OSError(
+                'Could not copy %s to %s. %s'
+                % (local_path, remote_path, stderr.decode(errors='replace'))
+            )
+
+    def get_file(self, remote_path, local_path):
+        """
+        Copies a file from the remote host.
+
+        :param remote_path: (str) The file to copy.
+
+        :param local_path: (str) Where to copy it to.
+
+        :return: No return.
+        """
+        status, stdout, stderr = \
+            self.execute('cat %s' % shlex.quote(remote_path))
+        if status:
+            raise OSError(
+                'Could not copy %s to %s. %s'
+                % (remote_path, local_path, stderr.decode(errors='replace'))
+            )
+        with open(local_path, 'wb') as output_file:
+            output_file.write(stdout)
+
+    def hash_input(self, path):
+        """
+        Gets the hash of a local input, only reading the input again if it
+        has changed since it was last hashed.
+
+        :param path: (str) The input.
+
+        :return: (str) A hex digest of the input's contents.
+        """
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        if key not in self._input_hashes:
+            self._input_hashes[key] = hash_file(path)
+        return self._input_hashes[key]
+
+    def missing_inputs(self, hashes):
+        """
+        Finds which inputs are not yet in the remote input cache. Only those
+        not already known to be there are checked for.
+
+        :param hashes: (list) Hashes of the inputs.
+
+        :return: (set) The hashes of the inputs not in the cache.
+        """
+        unknown = [digest for digest in hashes
+                   if digest not in self.remote_inputs]
+        if unknown:
+            _, stdout, _ = self.execute(
+                'cd %s && for digest in %s; do '
+                '[ -e %s/$digest ] && echo $digest; done; true'
+                % (
+                    shlex.quote(self.mount),
+                    ' '.join(unknown),
+                    INPUT_CACHE_DIR
+                )
+            )
+            self.remote_inputs.update(stdout.decode().split())
+        return {digest for digest in hashes
+                if digest not in self.remote_inputs}
+
+    def upload(self, files, command=None):
+        """
+        Copies files to the worker's mount directory as a single compressed
+        stream, optionally followed by a command run in the same round trip.
+
+        :param files: (list) The files to copy, as tuples of the local path
+        and the path relative to the mount directory.
+
+        :param command: (str)[optional] Command to run in the mount
+        directory once the files are in place. Default is None.
+
+        :return: (Tuple(int, bytes, bytes)) The exit status, standard output
+        and standard error of unpacking the files and running the command.
+        """
+        remote_command = 'mkdir -p %s && cd %s && tar xzf -' \
+                         % (shlex.quote(self.mount), shlex.quote(self.mount))
+        if command:
+            remote_command += ' && %s' % command
+        return self.execute(remote_command, stdin=make_archive(files))
+
+    def download(self, directory, skip=None):
+        """
+        Copies a directory from the worker's mount directory as a single
+        compressed stream, and removes it from the remote host.
+
+        :param directory: (str) The directory, relative to the mount.
+
+        :param skip: (list)[optional] Paths within the directory not to
+        copy. Default is None.
+
+        :return: (bytes) The directory as a compressed tar archive.
+        """
+        remote_dir = shlex.quote(directory)
+        command = 'cd %s' % remote_dir
+        if skip:
+            command += ' && rm -f %s' \
+                       % ' '.join(shlex.quote(path) for path in skip)
+        # Packed in a subshell so the directory is removed even on failure
+        command = 'cd %s && (%s && tar czf - .); status=$?; rm -rf %s; ' \
+                  'exit $status' \
+                  % (shlex.quote(self.mount), command, remote_dir)
+        status, stdout, stderr = self.execute(command)
+        if status:
+            raise OSError(
+                'Could not copy %s. %s'
+                % (directory, stderr.decode(errors='replace'))
+            )
+        return stdout
@@ -0,0 +1,264 @@
+import json
+import os
+import tarfile
+
+from datetime import datetime, timedelta
+
+from .constants import DONE, FAILED, JOB_ID, JOB_PATTERN, JOB_STATUS, \
+    JOB_END_TIME, RETENTION_MAX_AGE, RETENTION_MAX_COUNT, \
+    RETENTION_KEEP_FAILED_ONLY, RETENTION_ARCHIVE, RETENTION_INTERVAL
+from .fileio import make_dir, rmtrees
+
+ARCHIVE_DIR = '.archives'
+ARCHIVE_INDEX = 'index.jsonl'
+ARCHIVE_NAME = 'archive'
+ARCHIVE_EXTENSION = '.tar.gz'
+
+DEFAULT_RETENTION_INTERVAL = 60
+
+
+def get_retention_interval(policy):
+    """
+    Gets how often, in seconds, a retention policy should be applied.
+
+    :param policy: (dict) A valid retention policy.
+
+    :return: (int) The number of seconds between applications of policy.
+    """
+    return policy.get(RETENTION_INTERVAL, DEFAULT_RETENTION_INTERVAL)
+
+
+def select_expired_jobs(records, policy, now=None):
+    """
+    Selects which finished jobs should no longer be retained according to a
+    retention policy. Jobs that are queued or running are never selected.
+
+    :param records: (list) A list of JobRecords, oldest first.
+
+    :param policy: (dict) A valid retention policy. If it contains
+    'keep_failed_only' then all completed jobs are expired. If it contains
+    'max_age' then any job that finished more than that many seconds ago is
+    expired. If it contains 'max_count' then only that many of the remaining
+    finished jobs are kept, newest first.
+
+    :param now: (datetime)[optional] Time to measure job ages against.
+    Defaults to now.
+
+    :return: (list) A list of the expired JobRecords, oldest first.
+    """
+    if now is None:
+        now = datetime.now()
+
+    cutoff = None
+    if RETENTION_MAX_AGE in policy:
+        cutoff = now - timedelta(seconds=policy[RETENTION_MAX_AGE])
+    keep_failed_only = policy.get(RETENTION_KEEP_FAILED_ONLY, False)
+
+    expired = []
+    kept = []
+    for record in records:
+        if record.status not in [DONE, FAILED]:
+            continue
+        if keep_failed_only and record.status == DONE:
+            expired.append(record)
+        elif cutoff and record.end_time and record.end_time < cutoff:
+            expired.append(record)
+        else:
+            kept.append(record)
+
+    if RETENTION_MAX_COUNT in policy \
+            and len(kept) > policy[RETENTION_MAX_COUNT]:
+        excess = len(kept) - policy[RETENTION_MAX_COUNT]
+        expired_ids = set(record.job_id for record in expired)
+        expired_ids.update(record.job_id for record in kept[:excess])
+        expired = [record for record in records
+                   if record.job_id in expired_ids]
+
+    return expired
+
+
+def get_job_dir(job, job_data, output_data):
+    """
+    Gets the directory holding a finished job. Completed jobs are moved into
+    the output directory, but failed jobs remain in the job directory.
+
+    :param job: (dict) A job dict, as produced by JobRecord.to_dict.
+
+    :param job_data: (str) The runner's job directory.
+
+    :param output_data: (str) The runner's output directory.
+
+    :return: (str) Path to the job's directory.
+    """
+    if job[JOB_STATUS] == DONE:
+        return os.path.join(output_data, job[JOB_ID])
+    return os.path.join(job_data, job[JOB_ID])
+
+
+def get_archive_dir(output_data):
+    """
+    Gets the directory in which job archives are stored.
+
+    :param output_data: (str) The runner's output directory.
+
+    :return: (str) Path to the archive directory.
+    """
+    return os.path.join(output_data, ARCHIVE_DIR)
+
+
+def retire_jobs(jobs, job_data, output_data, archive=False):
+    """
+    Removes the directories of jobs that are no longer to be retained. If
+    requested, these are first packed together into a single compressed
+    archive, and recorded in an index so they can be found later.
+
+    :param jobs: (list) A list of job dicts, as produced by
+    JobRecord.to_dict.
+
+    :param job_data: (str) The runner's job directory.
+
+    :param output_data: (str) The runner's output directory.
+
+    :param archive: (bool)[optional] If True, job directories are archived
+    before being removed. Default is False.
+
+    :return: (str) Path to the created archive, or None if no archive was
+    created.
+    """
+    to_retire = []
+    for job in jobs:
+        job_dir = get_job_dir(job, job_data, output_data)
+        if os.path.isdir(job_dir):
+            to_retire.append((job, job_dir))
+
+    archive_path = None
+    if archive and to_retire:
+        archive_dir = get_archive_dir(output_data)
+        make_dir(archive_dir)
+        archive_name = '%s_%s%s' % (
+            ARCHIVE_NAME,
+            datetime.now().strftime('%Y%m%d%H%M%S%f'),
+            ARCHIVE_EXTENSION
+        )
+        archive_path = os.path.join(archive_dir, archive_name)
+        with tarfile.open(archive_path, 'w:gz') as tar:
+            for job, job_dir in to_retire:
+                tar.add(job_dir, arcname=job[JOB_ID])
+
+        # Index is only appended to, so is never rewritten as it grows.
+        with open(os.path.join(archive_dir, ARCHIVE_INDEX), 'a') as index:
+            for job, _ in to_retire:
+                entry = {
+                    JOB_ID: job[JOB_ID],
+                    JOB_PATTERN: job[JOB_PATTERN],
+                    JOB_STATUS: job[JOB_STATUS],
+                    JOB_END_TIME: job[JOB_END_TIME],
+                    ARCHIVE_NAME: archive_name
+                }
+                index.write(json.dumps(entry, default=str) + '\n')
+
+    rmtrees([job_dir for _, job_dir in to_retire])
+
+    return archive_path
+
+
+def find_archived_job(output_data, job_id):
+    """
+    Looks up a job in the archive index.
+
+    :param output_data: (str) The runner's output directory.
+
+    :param job_id: (str) The id of the job to find.
+
+    :return: (dict) The index entry for the job, with the path to its
+    archive under 'archive', or None if the job has not been archived.
+    """
+    archive_dir = get_archive_dir(output_data)
+    index_path = os.path.join(archive_dir, ARCHIVE_INDEX)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r') as index:
+        for line in index:
+            # Cheap check before parsing every line
+            if job_id not in line:
+                continue
+            entry = json.loads(line)
+            if entry[JOB_ID] == job_id:
+                entry[ARCHIVE_NAME] = \
+                    os.path.join(archive_dir, entry[ARCHIVE_NAME])
+                return entry
+    return None
+
+
+def check_archive_member(member, destination):
+    """
+    Checks that an archive member can be safely extracted, as done by the
+    'data' extraction filter of tarfile.
+
+    :param member: (TarInfo) The archive member.
+
+    :param destination: (str) Directory the member is to be extracted into.
+
+    :return: No return. A ValueError is raised if the member is unsafe.
+    """
+    root = os.path.realpath(destination)
+
+    def is_within(path):
+        return os.path.commonpath([root, path]) == root
+
+    target = os.path.realpath(os.path.join(root, member.name))
+    if os.path.isabs(member.name) or not is_within(target):
+        raise ValueError(
+            "Archive member '%s' would be extracted outside of %s. "
+            % (member.name, destination))
+    if not (member.isfile() or member.isdir()
+            or member.issym() or member.islnk()):
+        raise ValueError(
+            "Archive member '%s' is not a regular file, directory or link. "
+            % member.name)
+    if member.issym():
+        link_target = os.path.realpath(os.path.join(
+            os.path.dirname(target), member.linkname))
+    elif member.islnk():
+        link_target = os.path.realpath(os.path.join(root, member.linkname))
+    else:
+        link_target = target
+    if os.path.isabs(member.linkname) or not is_within(link_target):
+        raise ValueError(
+            "Archive member '%s' links outside of %s. "
+            % (member.name, destination))
+    # Special permission bits, and write access for others, are dropped
+    member.mode &= 0o755
+
+
+def extract_archived_job(output_data, job_id, destination):
+    """
+    Extracts a single archived job directory.
+
+    :param output_data: (str) The runner's output directory.
+
+    :param job_id: (str) The id of the job to extract.
+
+    :param destination: (str) Directory to extract into. The job will be
+    extracted to destination/job_id.
+
+    :return: (str) Path to the extracted job directory.
+    """
+    entry = find_archived_job(output_data, job_id)
+    if not entry:
+        raise ValueError("Job '%s' has not been archived. " % job_id)
+
+    with tarfile.open(entry[ARCHIVE_NAME], 'r:gz') as tar:
+        members = [member for member in tar.getmembers()
+                   if member.name == job_id
+                   or member.name.startswith(job_id + '/')]
+        # Extraction filters were added in Python 3.12, and backported to
+        # some earlier releases. Without them, members are checked here.
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(path=destination, members=members, filter='data')
+        else:
+            for member in members:
+                check_archive_member(member, destination)
+            tar.extractall(path=destination, members=members)
+
+    return os.path.join(destination, job_id)
@@ -0,0 +1,485 @@
+import pickle
+import struct
+import threading
+import time
+
+from multiprocessing import Lock, Pipe
+from multiprocessing.connection import wait as connection_wait
+from multiprocessing.shared_memory import SharedMemory
+
+from .constants import JOB_STATES, JOB_TRANSITION
+
+TRANSPORT_PIPE = 'pipe'
+TRANSPORT_SHARED_MEMORY = 'shared_memory'
+
+TRANSPORTS = [
+    TRANSPORT_PIPE,
+    TRANSPORT_SHARED_MEMORY
+]
+
+DEFAULT_RING_CAPACITY = 1024 * 1024
+MINIMUM_RING_CAPACITY = 4096
+
+# Shared header holding the total bytes ever written and read, and whether
+# the reader is waiting to be woken. Data follows from HEADER_SIZE.
+HEADER_SIZE = 64
+HEAD_OFFSET = 0
+TAIL_OFFSET = 8
+SLEEPING_OFFSET = 16
+
+# Each record is a length followed by that many bytes, padded to ALIGNMENT.
+# The top bit of the length marks a fragment of a larger message.
+RECORD_LENGTH = struct.Struct('I')
+ALIGNMENT = 8
+MORE_FRAGMENTS = 0x80000000
+WRAP_MARKER = 0xFFFFFFFF
+
+# Record encodings. The messages most often sent between runner processes
+# have fixed layouts, so are neither pickled nor unpickled.
+RECORD_PICKLE = 0
+RECORD_STR = 1
+RECORD_LOG = 2
+RECORD_TRANSITION = 3
+RECORD_EVENT = 4
+
+LOG_LAYOUT = struct.Struct('BH')
+TRANSITION_LAYOUT = struct.Struct('BBBH')
+EVENT_LAYOUT = struct.Struct('BH')
+
+# Separates the fields of an event record. Cannot appear in a path.
+SEPARATOR = '\0'
+
+MAX_SHORT = 0xFFFF
+
+# Paths that are not valid UTF-8 are decoded by os functions to strings
+# containing lone surrogates. These are passed through as they are, so that
+# any string is decoded exactly as it was sent.
+TEXT_ERRORS = 'surrogatepass'
+
+
+def _encode(text):
+    return text.encode('utf-8', TEXT_ERRORS)
+
+
+def _decode(data):
+    return data.decode('utf-8', TEXT_ERRORS)
+
+
+def encode_message(message):
+    """
+    Encodes a message sent between runner processes. Log records, job state
+    transitions, matched file events and plain strings such as job ids are
+    given compact fixed layouts. Anything else is pickled.
+
+    :param message: (any) The message to encode.
+
+    :return: (bytes) The encoded message.
+    """
+    if isinstance(message, str):
+        return bytes([RECORD_STR]) + _encode(message)
+
+    if isinstance(message, tuple):
+        # (title, message) as sent to the logger
+        if len(message) == 2 and isinstance(message[0], str) \
+                and isinstance(message[1], str):
+            title = _encode(message[0])
+            if len(title) <= MAX_SHORT:
+                return LOG_LAYOUT.pack(RECORD_LOG, len(title)) \
+                    + title + _encode(message[1])
+
+        # (JOB_TRANSITION, job_id, status[, error])
+        if len(message) in [3, 4] and message[0] == JOB_TRANSITION \
+                and message[2] in JOB_STATES \
+                and all(isinstance(value, str) for value in message[1:]):
+            job_id = _encode(message[1])
+            error = _encode(message[3]) if len(message) == 4 else b''
+            if len(job_id) <= MAX_SHORT:
+                return TRANSITION_LAYOUT.pack(
+                    RECORD_TRANSITION,
+                    JOB_STATES.index(message[2]),
+                    len(message) == 4,
+                    len(job_id)
+                ) + job_id + error
+
+        # (event_type, src_path, rule_ids) as sent by the file monitor
+        if len(message) == 3 and isinstance(message[2], list) \
+                and len(message[2]) <= MAX_SHORT:
+            fields = [message[0], message[1]] + message[2]
+            if all(isinstance(field, str) and SEPARATOR not in field
+                   for field in fields):
+                return EVENT_LAYOUT.pack(RECORD_EVENT, len(message[2])) \
+                    + _encode(SEPARATOR.join(fields))
+
+    return bytes([RECORD_PICKLE]) \
+        + pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_message(data):
+    """
+    Decodes a message encoded by encode_message.
+
+    :param data: (bytes) The encoded message.
+
+    :return: (any) The decoded message.
+    """
+    record_type = data[0]
+    if record_type == RECORD_STR:
+        return _decode(data[1:])
+
+    if record_type == RECORD_LOG:
+        _, title_length = LOG_LAYOUT.unpack_from(data)
+        offset = LOG_LAYOUT.size
+        return (
+            _decode(data[offset:offset + title_length]),
+            _decode(data[offset + title_length:])
+        )
+
+    if record_type == RECORD_TRANSITION:
+        _, status, has_error, id_length = TRANSITION_LAYOUT.unpack_from(data)
+        offset = TRANSITION_LAYOUT.size
+        job_id = _decode(data[offset:offset + id_length])
+        if has_error:
+            return (
+                JOB_TRANSITION,
+                job_id,
+                JOB_STATES[status],
+                _decode(data[offset + id_length:])
+            )
+        return JOB_TRANSITION, job_id, JOB_STATES[status]
+
+    if record_type == RECORD_EVENT:
+        fields = _decode(data[EVENT_LAYOUT.size:]).split(SEPARATOR)
+        return fields[0], fields[1], fields[2:]
+
+    return pickle.loads(data[1:])
+
+
+def _aligned(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class RingBuffer:
+    """
+    Single producer, single consumer ring buffer in shared memory. The
+    producer and consumer may be in different processes. Messages are only
+    copied into and out of the buffer, with no system call per message. A
+    pipe is used only to wake a consumer that is waiting on an empty buffer.
+
+    All access to the shared indexes is made while holding a shared lock, so
+    that neither side sees the other's index before the data it covers.
+    """
+    def __init__(self, capacity=DEFAULT_RING_CAPACITY):
+        """
+        Constructor for a RingBuffer. A new block of shared memory is
+        created, which should be released with unlink once no longer used.
+
+        :param capacity: (int)[optional] Bytes available for messages. Larger
+        messages are split across several records. Default is
+        DEFAULT_RING_CAPACITY.
+        """
+        if capacity < MINIMUM_RING_CAPACITY:
+            raise ValueError(
+                'Ring buffer capacity must be at least %d bytes. '
+                % MINIMUM_RING_CAPACITY
+            )
+        self.capacity = _aligned(capacity)
+        self.memory = SharedMemory(
+            create=True,
+            size=HEADER_SIZE + self.capacity
+        )
+        self.lock = Lock()
+        self.doorbell_reader, self.doorbell_writer = Pipe(duplex=False)
+
+    def __getstate__(self):
+        return {
+            'capacity': self.capacity,
+            'name': self.memory.name,
+            'lock': self.lock,
+            'doorbell_reader': self.doorbell_reader,
+            'doorbell_writer': self.doorbell_writer
+        }
+
+    def __setstate__(self, state):
+        self.capacity = state['capacity']
+        self.memory = SharedMemory(name=state['name'])
+        self.lock = state['lock']
+        self.doorbell_reader = state['doorbell_reader']
+        self.doorbell_writer = state['doorbell_writer']
+
+    def get_index(self, offset):
+        return struct.unpack_from('Q', self.memory.buf, offset)[0]
+
+    def set_index(self, offset, value):
+        struct.pack_into('Q', self.memory.buf, offset, value)
+
+    def close(self):
+        """
+        Releases this process's view of the shared memory.
+
+        :return: No return.
+        """
+        self.memory.close()
+
+    def unlink(self):
+        """
+        Destroys the shared memory. Should only be called once, by the
+        process that created the buffer, once it is no longer used.
+
+        :return: No return.
+        """
+        self.memory.unlink()
+
+
+class RingReader:
+    """
+    Reading end of a ring buffer. This has the same recv, poll and fileno
+    methods as a multiprocessing Connection, but must be waited on using
+    this module's wait function rather than that of
+    multiprocessing.connection.
+    """
+    def __init__(self, ring):
+        self.ring = ring
+        self._head = 0
+        self._tail = 0
+
+    def fileno(self):
+        return self.ring.doorbell_reader.fileno()
+
+    def _refresh(self, sleep=False):
+        """
+        Publishes how far the buffer has been read, and checks how far it
+        has been written.
+
+        :param sleep: (bool)[optional] If True and nothing is available, the
+        writer is asked to ring the doorbell on its next write.
+
+        :return: (bool) True if there is data to read.
+        """
+        with self.ring.lock:
+            self.ring.set_index(TAIL_OFFSET, self._tail)
+            self._head = self.ring.get_index(HEAD_OFFSET)
+            available = self._head != self._tail
+            self.ring.memory.buf[SLEEPING_OFFSET] = \
+                1 if sleep and not available else 0
+        return available
+
+    def _drain_doorbell(self):
+        doorbell = self.ring.doorbell_reader
+        while doorbell.poll():
+            doorbell.recv_bytes()
+
+    def poll(self, timeout=0.0):
+        """
+        Checks if there is a message to receive.
+
+        :param timeout: (float)[optional] Seconds to wait for a message. If
+        None, waits indefinitely. Default is 0.
+
+        :return: (bool) True if there is a message to receive.
+        """
+        if self._head != self._tail or self._refresh():
+            return True
+        if timeout is not None and timeout <= 0:
+            return False
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if self._refresh(sleep=True):
+                return True
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.time())
+            rung = self.ring.doorbell_reader.poll(remaining)
+            if rung:
+                self._drain_doorbell()
+            elif deadline is not None:
+                return self._refresh()
+
+    def _read_record(self):
+        buf = self.ring.memory.buf
+        capacity = self.ring.capacity
+        position = self._tail % capacity
+        length = RECORD_LENGTH.unpack_from(buf, HEADER_SIZE + position)[0]
+        if length == WRAP_MARKER:
+            self._tail += capacity - position
+            position = 0
+            length = RECORD_LENGTH.unpack_from(buf, HEADER_SIZE)[0]
+        more = bool(length & MORE_FRAGMENTS)
+        length &= ~MORE_FRAGMENTS
+        start = HEADER_SIZE + position + RECORD_LENGTH.size
+        data = bytes(buf[start:start + length])
+        self._tail += _aligned(RECORD_LENGTH.size + length)
+        return data, more
+
+    def recv_bytes(self):
+        """
+        Receives the encoded bytes of a message, waiting until one is
+        available.
+
+        :return: (bytes) The encoded message.
+        """
+        fragments = []
+        while True:
+            if self._head == self._tail:
+                self.poll(None)
+            data, more = self._read_record()
+            fragments.append(data)
+            if not more:
+                break
+        if len(fragments) == 1:
+            return fragments[0]
+        return b''.join(fragments)
+
+    def recv(self):
+        """
+        Receives a message, waiting until one is available.
+
+        :return: (any) The message.
+        """
+        return decode_message(self.recv_bytes())
+
+    def close(self):
+        self.ring.close()
+
+
+class RingWriter:
+    """
+    Writing end of a ring buffer. This has the same send method as a
+    multiprocessing Connection. It may be shared between threads, but not
+    between processes.
+    """
+    def __init__(self, ring):
+        self.ring = ring
+        self._head = 0
+        self._tail = 0
+        self._write_lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'ring': self.ring, 'head': self._head, 'tail': self._tail}
+
+    def __setstate__(self, state):
+        self.ring = state['ring']
+        self._head = state['head']
+        self._tail = state['tail']
+        self._write_lock = threading.Lock()
+
+    def _wait_for_space(self, size):
+        delay = 0.0001
+        while self.ring.capacity - (self._head - self._tail) < size:
+            with self.ring.lock:
+                self._tail = self.ring.get_index(TAIL_OFFSET)
+            if self.ring.capacity - (self._head - self._tail) >= size:
+                return
+            # Only reached if the reader has fallen a whole buffer behind
+            time.sleep(delay)
+            delay = min(delay * 2, 0.01)
+
+    def _write_record(self, data, more):
+        buf = self.ring.memory.buf
+        capacity = self.ring.capacity
+        size = _aligned(RECORD_LENGTH.size + len(data))
+        position = self._head % capacity
+        padding = 0
+        if capacity - position < size:
+            padding = capacity - position
+        self._wait_for_space(padding + size)
+        if padding:
+            RECORD_LENGTH.pack_into(buf, HEADER_SIZE + position, WRAP_MARKER)
+            self._head += padding
+            position = 0
+        length = len(data) | (MORE_FRAGMENTS if more else 0)
+        RECORD_LENGTH.pack_into(buf, HEADER_SIZE + position, length)
+        start = HEADER_SIZE + position + RECORD_LENGTH.size
+        buf[start:start + len(data)] = data
+        self._head += size
+
+    def send_bytes(self, data):
+        """
+        Sends already encoded bytes.
+
+        :param data: (bytes) The encoded message.
+
+        :return: No return.
+        """
+        # Fragments leave room for a wrap, so always fit in the buffer
+        fragment_size = \
+            self.ring.capacity // 2 - RECORD_LENGTH.size - ALIGNMENT
+        with self._write_lock:
+            for start in range(0, max(len(data), 1), fragment_size):
+                fragment = data[start:start + fragment_size]
+                self._write_record(
+                    fragment, start + fragment_size < len(data))
+                # Each fragment is published as it is written, as later ones
+                # may need the space it occupies.
+                with self.ring.lock:
+                    self.ring.set_index(HEAD_OFFSET, self._head)
+                    sleeping = self.ring.memory.buf[SLEEPING_OFFSET]
+                    self.ring.memory.buf[SLEEPING_OFFSET] = 0
+                if sleeping:
+                    self.ring.doorbell_writer.send_bytes(b'\0')
+
+    def send(self, message):
+        """
+        Sends a message.
+
+        :param message: (any) The message to send.
+
+        :return: No return.
+        """
+        self.send_bytes(encode_message(message))
+
+    def close(self):
+        self.ring.close()
+
+
+def RingPipe(capacity=DEFAULT_RING_CAPACITY):
+    """
+    Creates a one way channel through a new shared memory ring buffer, in the
+    same manner as multiprocessing.Pipe(duplex=False).
+
+    :param capacity: (int)[optional] Bytes available in the buffer. Default
+    is DEFAULT_RING_CAPACITY.
+
+    :return: (Tuple(RingReader, RingWriter)) The reading and writing ends of
+    the channel.
+    """
+    ring = RingBuffer(capacity=capacity)
+    return RingReader(ring), RingWriter(ring)
+
+
+def wait(object_list, timeout=None):
+    """
+    Waits until one or more objects are ready, in the same manner as
+    multiprocessing.connection.wait. RingReaders may be waited on alongside
+    Connections and any other objects that function accepts.
+
+    :param object_list: (list) The objects to wait on.
+
+    :param timeout: (float)[optional] Seconds to wait. If None, waits
+    indefinitely. Default is None.
+
+    :return: (list) The objects that are ready.
+    """
+    rings = [item for item in object_list if isinstance(item, RingReader)]
+    if not rings:
+        return connection_wait(object_list, timeout)
+    others = [item for item in object_list
+              if not isinstance(item, RingReader)]
+
+    ready = [ring for ring in rings if ring.poll()]
+    if not ready:
+        # Checked again while asking to be woken, so no write is missed
+        ready = [ring for ring in rings if ring._refresh(sleep=True)]
+        if not ready:
+            woken = connection_wait(others + rings, timeout)
+            others_ready = [item for item in woken if item in others]
+            for ring in rings:
+                if ring in woken:
+                    ring._drain_doorbell()
+                if ring._refresh():
+                    ready.append(ring)
+            return ready + others_ready
+        for ring in rings:
+            ring._refresh()
+    if others:
+        ready.extend(connection_wait(others, 0))
+    return ready
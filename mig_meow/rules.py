@@ -0,0 +1,284 @@
+import fnmatch
+import os
+import re
+
+from .constants import RULE_ID, RULE_PATH
+
+SCAN_MATCHES = 'matches'
+SCAN_DONE = 'done'
+
+DEFAULT_SCAN_CHUNK = 100
+
+
+def _is_literal(component):
+    """
+    Checks if a path component contains no glob special characters.
+
+    :param component: (str) A single component of a path.
+
+    :return: (bool) True if the component can only match itself.
+    """
+    return not any(char in component for char in '*?[')
+
+
+def get_literal_prefix(path):
+    """
+    Gets the directory that every path matching a rule path must be within.
+    This is made up of the leading components of the rule path that contain
+    no wildcards, excluding the final component which names the file itself.
+
+    :param path: (str) A rule trigger path.
+
+    :return: (Tuple(str, bool)) First value is the directory, relative to
+    the vgrid. Second is True if matching paths may be anywhere below that
+    directory, or False if they can only be directly within it. Wildcards in
+    event matching can match across directories, so any rule path containing
+    one may match at any depth.
+    """
+    components = [component for component in path.split(os.path.sep)
+                  if component]
+    prefix = []
+    for component in components[:-1]:
+        if not _is_literal(component):
+            break
+        prefix.append(component)
+    recursive = not all(_is_literal(component) for component in components)
+    return os.path.sep.join(prefix), recursive
+
+
+class RuleIndex:
+    """
+    Index of runner rules by their trigger paths. Each rule path is compiled
+    once when added, rather than every time a path is tested against it.
+    Paths may be matched either as they would be for a file event, or as
+    they would be by glob, which is what a retroactive scan of existing
+    files needs.
+    """
+    def __init__(self, rules=None):
+        """
+        Constructor for a RuleIndex.
+
+        :param rules: (list)[optional] Rule dicts to initially index. Each
+        must have at least an 'id' and a 'path'.
+        """
+        self._rules = {}
+        self._event_regexps = {}
+        self._components = {}
+        if rules:
+            for rule in rules:
+                self.add(rule)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __contains__(self, rule_id):
+        return rule_id in self._rules
+
+    def add(self, rule):
+        """
+        Adds a rule to the index.
+
+        :param rule: (dict) The rule to add. Must have at least an 'id' and a
+        'path'.
+
+        :return: No return.
+        """
+        path = rule[RULE_PATH]
+        recursive_regexp = fnmatch.translate(path)
+        direct_regexp = recursive_regexp.replace('.*', '[^/]*')
+        self._rules[rule[RULE_ID]] = rule
+        self._event_regexps[rule[RULE_ID]] = (
+            re.compile(recursive_regexp),
+            re.compile(direct_regexp)
+        )
+        components = []
+        for component in path.split(os.path.sep):
+            if not component:
+                continue
+            if _is_literal(component):
+                components.append((component, None))
+            else:
+                components.append((
+                    component,
+                    re.compile(fnmatch.translate(component))
+                ))
+        self._components[rule[RULE_ID]] = components
+
+    def remove(self, rule_id):
+        """
+        Removes a rule from the index.
+
+        :param rule_id: (str) The id of the rule to remove.
+
+        :return: (bool) True if the rule was removed, False if it was not
+        present.
+        """
+        if rule_id not in self._rules:
+            return False
+        self._rules.pop(rule_id)
+        self._event_regexps.pop(rule_id)
+        self._components.pop(rule_id)
+        return True
+
+    def get(self, rule_id):
+        """
+        Gets a rule from the index.
+
+        :param rule_id: (str) The id of the rule.
+
+        :return: (dict) The rule, or None if it is not present.
+        """
+        return self._rules.get(rule_id, None)
+
+    def rules(self):
+        """
+        Gets all indexed rules, in the order they were added.
+
+        :return: (list) A list of rule dicts.
+        """
+        return list(self._rules.values())
+
+    def match(self, path):
+        """
+        Gets the rules matching a path as reported by a file event. A rule
+        matches either if its path matches directly, or if a wildcard in it
+        matches across directories.
+
+        :param path: (str) The path, relative to the vgrid.
+
+        :return: (list) The matching rules, in the order they were added.
+        """
+        matched = []
+        for rule_id, (recursive, direct) in self._event_regexps.items():
+            if direct.match(path) or recursive.match(path):
+                matched.append(self._rules[rule_id])
+        return matched
+
+    def _component_matches(self, pattern, name):
+        component, regexp = pattern
+        if regexp is None:
+            return component == name
+        # As with glob, hidden names must be matched explicitly
+        if name.startswith('.') and not component.startswith('.'):
+            return False
+        return regexp.match(name) is not None
+
+    def _literal_names(self, rule_ids, depth):
+        """
+        Gets the names that can match at a given depth, if every candidate
+        rule only matches a literal name there.
+
+        :param rule_ids: (list) Ids of rules matching all parent components.
+
+        :param depth: (int) The depth within the scanned tree.
+
+        :return: (list) The sorted literal names, or None if any rule has a
+        wildcard at this depth.
+        """
+        names = set()
+        for rule_id in rule_ids:
+            component, regexp = self._components[rule_id][depth]
+            if regexp is not None:
+                return None
+            names.add(component)
+        return sorted(names)
+
+    def _walk_state(self, rule_ids, depth, name):
+        """
+        Narrows a set of candidate rules by the name of the path component at
+        a given depth.
+
+        :param rule_ids: (list) Ids of rules matching all parent components.
+
+        :param depth: (int) The depth of name within the scanned tree.
+
+        :param name: (str) The name of the path component.
+
+        :return: (Tuple(list, list)) First value is the rules that match the
+        path exactly, second is those that may match paths below it.
+        """
+        matched = []
+        descend = []
+        for rule_id in rule_ids:
+            components = self._components[rule_id]
+            if depth >= len(components) \
+                    or not self._component_matches(components[depth], name):
+                continue
+            if depth == len(components) - 1:
+                matched.append(rule_id)
+            else:
+                descend.append(rule_id)
+        return matched, descend
+
+    def scan(self, root, to_admin, chunk_size=DEFAULT_SCAN_CHUNK):
+        """
+        Walks a directory tree once, finding every path matching any indexed
+        rule as glob would. Directories are only entered if some rule could
+        match within them. Matches are sent in chunks as they are found, so
+        that a receiver can act on them before the scan completes. Once the
+        scan is complete a final (SCAN_DONE, None) message is sent.
+
+        :param root: (str) The directory to scan.
+
+        :param to_admin: (Connection) Pipe connection to send matches to.
+        Matches are sent as (SCAN_MATCHES, [(rule_id, path), ...]), where
+        path is relative to root.
+
+        :param chunk_size: (int)[optional] Maximum number of matches to send
+        in each message. Default is DEFAULT_SCAN_CHUNK.
+
+        :return: (int) The total number of matches found.
+        """
+        found = 0
+        chunk = []
+        # Stack of (directory, relative path, depth, candidate rule ids)
+        to_scan = [(
+            root,
+            '',
+            0,
+            [rule_id for rule_id, components in self._components.items()
+             if components]
+        )]
+        while to_scan:
+            directory, relative, depth, rule_ids = to_scan.pop()
+            literals = self._literal_names(rule_ids, depth)
+            if literals is not None:
+                # Only specific names can match, so there is no need to list
+                # what may be a very large directory.
+                names = [name for name in literals
+                         if os.path.lexists(os.path.join(directory, name))]
+                entries = {}
+            else:
+                try:
+                    with os.scandir(directory) as scanned:
+                        entries = {entry.name: entry for entry in scanned}
+                except OSError:
+                    # Directory may have been removed since being found
+                    continue
+                names = sorted(entries)
+            for name in names:
+                matched, descend = self._walk_state(rule_ids, depth, name)
+                if not matched and not descend:
+                    continue
+                entry_path = os.path.join(relative, name)
+                for rule_id in matched:
+                    chunk.append((rule_id, entry_path))
+                    if len(chunk) >= chunk_size:
+                        to_admin.send((SCAN_MATCHES, chunk))
+                        found += len(chunk)
+                        chunk = []
+                if not descend:
+                    continue
+                full_path = os.path.join(directory, name)
+                if name in entries:
+                    is_dir = entries[name].is_dir()
+                else:
+                    is_dir = os.path.isdir(full_path)
+                if is_dir:
+                    to_scan.append(
+                        (full_path, entry_path, depth + 1, descend))
+        if chunk:
+            to_admin.send((SCAN_MATCHES, chunk))
+            found += len(chunk)
+        to_admin.send((SCAN_DONE, None))
+        return found
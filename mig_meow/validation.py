@@ -3,6 +3,8 @@ import os
 import re
 import unicodedata
 
+from functools import lru_cache
+
 from .constants import CHAR_LOWERCASE, CHAR_NUMERIC, CHAR_UPPERCASE, \
     VALID_PATTERN_MIN, RECIPE_NAME, VALID_RECIPE_MIN, PATTERN_NAME, \
     WORKFLOW_NAME, STEP_NAME, VARIABLES_NAME, MEOW_MODE, CWL_MODE, \
@@ -22,7 +24,42 @@ from .constants import CHAR_LOWERCASE, CHAR_NUMERIC, CHAR_UPPERCASE, \
     ENVIRONMENTS_MIG_WALL_TIME, ENVIRONMENTS_MIG_CPU_CORES, \
     VALID_ENVIRONMENTS_MIG_FILLS, COMPARITORS, VALID_NOTIFICATION_TYPES, \
     NOTIFICATION_EMAIL, VALID_SSH_WORKER_MIN, VALID_SSH_WORKER_OPTIONAL, \
-    SSH_MOUNT, SSH_CERT, SSH_USER, SSH_HOSTNAME
+    SSH_MOUNT, SSH_CERT, SSH_USER, SSH_HOSTNAME, SSH_PORT, \
+    VALID_RETENTION_MIN, VALID_RETENTION_OPTIONAL, RETENTION_NAME, \
+    RETENTION_MAX_AGE, RETENTION_MAX_COUNT, RETENTION_INTERVAL
+
+PATH_CHARS = \
+    CHAR_NUMERIC + CHAR_UPPERCASE + CHAR_LOWERCASE + '-_.' + os.path.sep
+# Most strings to remember the result of checking for invalid characters.
+# Names and paths are checked again and again, so are remembered by content.
+VALIDATION_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=None)
+def _char_set(valid_chars):
+    return frozenset(valid_chars)
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def find_invalid_char(string, valid_chars):
+    """
+    Finds the first character in a string that is not in a collection of
+    valid characters. Results are cached, so checking the same string again
+    is a single lookup.
+
+    :param string: (str) The string to check.
+
+    :param valid_chars: (str) Collection of valid characters.
+
+    :return: (str) The first invalid character, or None if all characters
+    are valid.
+    """
+    valid_set = _char_set(valid_chars)
+    if valid_set.issuperset(string):
+        return None
+    for char in string:
+        if char not in valid_set:
+            return char
 
 
 def is_a_number(string):
@@ -154,12 +191,12 @@ def valid_string(variable, name, valid_chars):
     check_input(variable, str, name)
     check_input(valid_chars, str, 'valid_chars')
 
-    for char in variable:
-        if char not in valid_chars:
-            raise ValueError(
-                "Invalid character '%s' in %s '%s'. Only valid characters are: "
-                "%s" % (char, name, variable, valid_chars)
-            )
+    char = find_invalid_char(variable, valid_chars)
+    if char is not None:
+        raise ValueError(
+            "Invalid character '%s' in %s '%s'. Only valid characters are: "
+            "%s" % (char, name, variable, valid_chars)
+        )
 
 
 def valid_numeric_string(
@@ -228,15 +265,12 @@ def valid_dir_path(path, name):
     """
     check_input(path, str, name)
 
-    valid_chars = \
-        CHAR_NUMERIC + CHAR_UPPERCASE + CHAR_LOWERCASE + '-_.' + os.path.sep
-
-    for char in path:
-        if char not in valid_chars:
-            raise ValueError(
-                'Invalid character %s in string %s for variable %s. Only '
-                'valid characters are %s' % (char, path, name, valid_chars)
-            )
+    char = find_invalid_char(path, PATH_CHARS)
+    if char is not None:
+        raise ValueError(
+            'Invalid character %s in string %s for variable %s. Only '
+            'valid characters are %s' % (char, path, name, PATH_CHARS)
+        )
 
 
 def dir_exists(path, create=False):
@@ -278,9 +312,6 @@ def valid_file_path(path, name, extensions=None):
     check_input(path, str, name)
     check_input(extensions, list, 'extensions', or_none=True)
 
-    valid_chars = \
-        CHAR_NUMERIC + CHAR_UPPERCASE + CHAR_LOWERCASE + '-_.' + os.path.sep
-
     if extensions:
         extension = path[path.index('.'):]
         if extension not in extensions:
@@ -290,12 +321,12 @@ def valid_file_path(path, name, extensions=None):
                 % (extension, name, extensions)
             )
 
-    for char in path:
-        if char not in valid_chars:
-            raise ValueError(
-                'Invalid character %s in string %s for variable %s. Only '
-                'valid characters are %s' % (char, path, name, valid_chars)
-            )
+    char = find_invalid_char(path, PATH_CHARS)
+    if char is not None:
+        raise ValueError(
+            'Invalid character %s in string %s for variable %s. Only '
+            'valid characters are %s' % (char, path, name, PATH_CHARS)
+        )
 
 
 def valid_param_sweep(to_test, name):
@@ -437,35 +468,38 @@ def valid_runner_workers(workers_input):
 
 
 def is_valid_ssh_worker(worker_def):
-    #valid, msg = is_valid_dict(
-    #    worker_def,
-    #    VALID_SSH_WORKER_MIN,
-    #    VALID_SSH_WORKER_OPTIONAL,
-    #    "SSH worker",
-    #    "LocalRunner",
-    #    strict=False
-    #)
-    return False, "Not yet implemented"
-
-    if not valid:
-        return False, msg
-
-    valid, msg = is_valid_hostname(worker_def[SSH_HOSTNAME])
+    """
+    Validates that the passed dictionary defines a remote worker, reached
+    over SSH.
 
-    if not valid:
-        return False, msg
+    :param worker_def: (dict) The worker definition. Must contain a
+    'hostname', 'user', 'rsa' private key file and 'mount' directory on the
+    remote host in which to process jobs. May contain a 'port', a
+    'known_hosts' file of trusted host keys and 'auto_add_host_keys', which
+    if True trusts the host key of a host not already known.
 
-    valid, msg = is_valid_username(worker_def[SSH_USER])
+    :return: (Tuple(bool, str)) First value is boolean. True = worker_def
+    is valid, False = worker_def is not valid. Second value is feedback
+    string and will be empty if first value is True.
+    """
+    valid, msg = is_valid_dict(
+        worker_def,
+        VALID_SSH_WORKER_MIN,
+        VALID_SSH_WORKER_OPTIONAL,
+        "SSH worker",
+        "LocalRunner",
+        strict=False
+    )
 
     if not valid:
         return False, msg
 
-    valid, msg = is_valid_certificate(worker_def[SSH_CERT])
+    valid, msg = is_valid_hostname(worker_def[SSH_HOSTNAME])
 
     if not valid:
         return False, msg
 
-    valid, msg = is_valid_mountpoint(worker_def[SSH_MOUNT])
+    valid, msg = is_valid_username(worker_def[SSH_USER])
 
     if not valid:
         return False, msg
@@ -478,6 +512,11 @@ def is_valid_ssh_worker(worker_def):
         return False, f"Invalid {SSH_CERT}: {worker_def[SSH_CERT]}. " \
                       f"Must be defined"
 
+    if SSH_PORT in worker_def \
+            and not 0 < worker_def[SSH_PORT] < 65536:
+        return False, f"Invalid {SSH_PORT}: {worker_def[SSH_PORT]}. " \
+                      f"Must be between 1 and 65535"
+
     return True, ""
 
 
@@ -488,9 +527,10 @@ def is_valid_hostname(to_test):
         valid_string(
             to_test,
             SSH_HOSTNAME,
-            + CHAR_LOWERCASE
+            CHAR_LOWERCASE
+            + CHAR_UPPERCASE
             + CHAR_NUMERIC
-            + '-'
+            + '-.'
         )
     except ValueError as e:
         return False, str(e)
@@ -500,6 +540,7 @@ def is_valid_hostname(to_test):
     if len(to_test) > 253:
         return False, f"{SSH_HOSTNAME} '{to_test}' is longer than the " \
                       f"permitted 253 chars. "
+    return True, ""
 
 
 def is_valid_username(to_test):
@@ -520,12 +561,13 @@ def is_valid_username(to_test):
         valid_string(
             to_test,
             SSH_USER,
-            + CHAR_LOWERCASE
+            CHAR_LOWERCASE
             + CHAR_NUMERIC
             + '-_'
         )
     except ValueError as e:
         return False, str(e)
+    return True, ""
 
 
 def is_valid_dict(to_test, required_args, optional_args, name, paradigm,
@@ -565,49 +607,46 @@ def is_valid_dict(to_test, required_args, optional_args, name, paradigm,
                '%s is a %s' \
                % (paradigm, name, to_test, prep_html(type(to_test)))
 
-    message = 'The %s %s %s had an incorrect structure, ' \
-              % (paradigm, name, to_test)
+    # Only formatted if a problem is found, as to_test may be large
+    def structure_error(detail):
+        return False, 'The %s %s %s had an incorrect structure, ' \
+                      % (paradigm, name, to_test) + detail
+
     for key, value in required_args.items():
         if key not in to_test:
-            message += 'it is missing key %s. ' % key
-            return False, message
+            return structure_error('it is missing key %s. ' % key)
         if isinstance(value, list):
             if type(to_test[key]) not in value:
-                message += \
-                    ' %s is expected to have types %s but actually has %s. ' \
-                    % (key, prep_html(value), prep_html(type(to_test[key])))
-                return False, message
+                return structure_error(
+                    ' %s is expected to have types %s but actually has %s. '
+                    % (key, prep_html(value), prep_html(type(to_test[key]))))
         else:
             if not isinstance(to_test[key], value):
-                message += \
-                    ' %s is expected to have type %s but actually has %s. ' \
-                    % (key, prep_html(value), prep_html(type(to_test[key])))
-                return False, message
+                return structure_error(
+                    ' %s is expected to have type %s but actually has %s. '
+                    % (key, prep_html(value), prep_html(type(to_test[key]))))
 
     for key, value in optional_args.items():
         if key in to_test:
             if isinstance(value, list):
                 if type(to_test[key] not in value):
-                    message += \
-                        ' %s is expected to have types %s but actually has ' \
-                        '%s. ' \
+                    return structure_error(
+                        ' %s is expected to have types %s but actually has '
+                        '%s. '
                         % (to_test[key], prep_html(value),
-                           prep_html(type(to_test[key])))
-                    return False, message
+                           prep_html(type(to_test[key]))))
             else:
                 if not isinstance(to_test[key], value):
-                    message += \
-                        ' %s is expected to have type %s but actually has ' \
-                        '%s. ' \
+                    return structure_error(
+                        ' %s is expected to have type %s but actually has '
+                        '%s. '
                         % (to_test[key], prep_html(value),
-                           prep_html(type(to_test[key])))
-                    return False, message
+                           prep_html(type(to_test[key]))))
 
     if strict:
         for key in to_test.keys():
             if key not in required_args and key not in optional_args:
-                message += ' contains extra key %s' % key
-                return False, message
+                return structure_error(' contains extra key %s' % key)
     return True, ''
 
 
@@ -902,7 +941,7 @@ def is_valid_local_environment(to_test, strict=False):
                 dependency,
                 'dependency',
                 CHAR_UPPERCASE + CHAR_LOWERCASE + CHAR_NUMERIC + CHAR_LINES
-                + '.>='
+                + '.<>='
             )
 
             matches = [x for x in COMPARITORS if x in dependency]
@@ -930,6 +969,49 @@ def is_valid_local_environment(to_test, strict=False):
     return True, ''
 
 
+def is_valid_retention_dict(to_test, strict=False):
+    """
+    Validates that the passed dictionary expresses a job retention policy for
+    a workflow runner. An empty dict is valid, and retains all jobs.
+
+    :param to_test: (dict) A dictionary expressing a retention policy.
+
+    :param strict: (bool)[optional] Option to be strict about arguments. If
+    True then any extra arguments that have been provided will fail. Default
+    is False.
+
+    :return: (Tuple(bool, str)) First value is boolean. True = to_test
+    is valid, False = to_test is not valid. Second value is feedback
+    string and will be empty if first value is True.
+    """
+    if isinstance(to_test, dict) and not to_test:
+        return True, ''
+
+    status, feedback = is_valid_dict(
+        to_test,
+        VALID_RETENTION_MIN,
+        VALID_RETENTION_OPTIONAL,
+        RETENTION_NAME,
+        MEOW_MODE,
+        strict=strict
+    )
+
+    if not status:
+        return status, feedback
+
+    for key in [RETENTION_MAX_AGE, RETENTION_MAX_COUNT, RETENTION_INTERVAL]:
+        if key in to_test:
+            if isinstance(to_test[key], bool) or to_test[key] < 0:
+                return False, "Invalid %s '%s'. Must be a positive integer. " \
+                       % (key, to_test[key])
+
+    if RETENTION_INTERVAL in to_test and to_test[RETENTION_INTERVAL] == 0:
+        return False, "Invalid %s '%s'. Must be greater than zero. " \
+               % (RETENTION_INTERVAL, to_test[RETENTION_INTERVAL])
+
+    return True, ''
+
+
 def is_valid_workflow_dict(to_test, strict=False):
     """
     Validates that the passed dictionary expresses a cwl workflow.
@@ -1,31 +1,68 @@
+import copy
+import glob
+import json
 import string
+import tarfile
 import unittest
 import os
+import posixpath
 import shutil
 import time
 import numpy as np
+import paramiko
 import pytest
-import pkg_resources
+import socket
+import subprocess
+import threading
 
+from datetime import datetime, timedelta
+from unittest import mock
 from multiprocessing import Process, Pipe
-from watchdog.events import FileCreatedEvent, FileModifiedEvent
+from watchdog.events import FileCreatedEvent, FileModifiedEvent, \
+    FileDeletedEvent
 from watchdog.observers import Observer
 
 from mig_meow.constants import PATTERNS, RECIPES, KEYWORD_DIR, KEYWORD_JOB, \
     KEYWORD_VGRID, KEYWORD_EXTENSION, KEYWORD_PREFIX, KEYWORD_FILENAME, \
     KEYWORD_REL_DIR, KEYWORD_REL_PATH, KEYWORD_PATH, SOURCE, NAME, RECIPE, \
-    SSH_MOUNT, SSH_CERT, SSH_USER, SSH_HOSTNAME
+    SSH_MOUNT, SSH_CERT, SSH_USER, SSH_HOSTNAME, RETENTION_MAX_AGE, \
+    RETENTION_MAX_COUNT, RETENTION_KEEP_FAILED_ONLY, RETENTION_ARCHIVE, \
+    RETENTION_INTERVAL, SSH_PORT, SSH_KNOWN_HOSTS, SSH_AUTO_ADD_HOST_KEYS, SWEEP_START, SWEEP_STOP, SWEEP_JUMP, \
+    CHUNK_SIZE
 from mig_meow.fileio import read_dir, read_dir_pattern, read_dir_recipe, \
     make_dir, write_yaml, write_dir_pattern, write_dir_recipe, \
     patten_to_yaml_dict, recipe_to_yaml_dict, read_yaml, write_notebook, \
-    rmtree
+    rmtree, rmtrees, rmtrees_detached, pattern_from_yaml_dict, \
+    TRASH_PREFIX
 from mig_meow.localrunner import WorkflowRunner, RUNNER_DATA, RULE_PATH, \
     RULE_PATTERN, RULE_RECIPE, replace_keywords, worker_timer, job_processor, \
     JOB_DIR, OUTPUT_DATA, job_queue, LocalWorkflowFileMonitor, \
-    LocalWorkflowStateMonitor, administrator, OP_CREATE, OP_DELETED, \
-    META_FILE, BASE_FILE, PARAMS_FILE, local_processing, ssh_processing
+    LocalWorkflowStateMonitor, administrator, OP_CREATE, OP_DELETED, RULE_ID, \
+    META_FILE, BASE_FILE, PARAMS_FILE, RESULT_FILE, local_processing, \
+    ssh_processing, JOB_TRANSITION, RUNNING, DONE, QUEUED, FAILED, \
+    TRIGGER_CLOSED, TRIGGER_QUIET, STOP_TIMEOUT, administrator_roles
+from mig_meow.asyncrunner import AsyncWorkflowRunner
+from mig_meow.environment import get_environment_fingerprint, \
+    scan_environment, get_cache_key, is_requirement_met, RequirementMatcher, \
+    is_trusted_file
+from mig_meow.events import InotifyObserver, get_watch_roots, \
+    is_inotify_available, IN_CREATE, IN_Q_OVERFLOW, EVENT_HEADER
+from mig_meow.inputs import InputIndex, get_rule_key, hash_file, \
+    INPUT_INDEX_FILE
+from mig_meow.jobs import JobTable, JOB_TABLE_FILE
+from mig_meow.notebooks import NotebookStore, NOTEBOOK_STORE_DIR, \
+    RECIPE_HASH, notebook_digest
+from mig_meow.rules import RuleIndex, SCAN_DONE
+from mig_meow.ringbuffer import RingPipe, encode_message, decode_message, \
+    wait, MINIMUM_RING_CAPACITY, RECORD_PICKLE, RECORD_STR
+from mig_meow.retention import select_expired_jobs, retire_jobs, \
+    find_archived_job, extract_archived_job, check_archive_member, \
+    get_archive_dir, ARCHIVE_INDEX
 from mig_meow.meow import Pattern
-from mig_meow.validation import valid_runner_workers
+from mig_meow.mig import write_vgrid_pattern
+from mig_meow.remote import SSHConnection, INPUT_CACHE_DIR
+from mig_meow.validation import valid_runner_workers, \
+    is_valid_retention_dict, is_valid_ssh_worker
 
 TESTING_VGRID = 'testing_directory'
 
@@ -63,6 +100,96 @@ def check_logger_input(tester, logger_input, title, message):
         tester.assertIn(logger_input[1], message)
 
 
+def ring_producer(writer, messages, count):
+    for _ in range(count):
+        for message in messages:
+            writer.send(message)
+
+
+class SSHStandIn(paramiko.ServerInterface):
+    """
+    Minimal SSH server standing in for a remote worker. Any key is accepted,
+    and commands are run as local shell commands.
+    """
+    def __init__(self):
+        self.host_key = paramiko.RSAKey.generate(1024)
+        self.transports = []
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen()
+        self.port = self.socket.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                client, _ = self.socket.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=self)
+            self.transports.append(transport)
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(
+            target=self.run_command,
+            args=(channel, command.decode()),
+            daemon=True
+        ).start()
+        return True
+
+    def run_command(self, channel, command):
+        process = subprocess.Popen(
+            command,
+            shell=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+
+        def pump_stdin():
+            for block in iter(lambda: channel.recv(65536), b''):
+                process.stdin.write(block)
+            process.stdin.close()
+
+        def pump_stderr():
+            for block in iter(lambda: process.stderr.read1(65536), b''):
+                channel.sendall_stderr(block)
+
+        pumps = [
+            threading.Thread(target=pump_stdin, daemon=True),
+            threading.Thread(target=pump_stderr, daemon=True)
+        ]
+        for pump in pumps:
+            pump.start()
+        for block in iter(lambda: process.stdout.read1(65536), b''):
+            channel.sendall(block)
+        for pump in pumps:
+            pump.join()
+        channel.send_exit_status(process.wait())
+        channel.close()
+
+    def drop_connections(self):
+        for transport in self.transports:
+            transport.close()
+
+    def close(self):
+        self.socket.close()
+        self.drop_connections()
+
+
 class WorkflowTest(unittest.TestCase):
     def setUp(self):
         if os.path.exists(TESTING_VGRID):
@@ -80,6 +207,12 @@ class WorkflowTest(unittest.TestCase):
             rmtree(JOB_DIR)
         if os.path.exists(OUTPUT_DATA):
             rmtree(OUTPUT_DATA)
+        # Stopped runners remove their data in a detached process, which
+        # should be done before the next test starts
+        for _ in range(100):
+            if not glob.glob(TRASH_PREFIX + '*'):
+                break
+            time.sleep(0.1)
 
     # TODO
     @pytest.mark.timeout(5)
@@ -277,6 +410,112 @@ class WorkflowTest(unittest.TestCase):
         file_monitor_process.join()
         self.assertFalse(file_monitor_process.is_alive())
 
+    @pytest.mark.timeout(30)
+    def testFileMonitorTriggerModes(self):
+        def write_in_chunks(path, chunks, pause):
+            with open(path, 'w') as f:
+                for _ in range(chunks):
+                    f.write('data' * 1000)
+                    f.flush()
+                    time.sleep(pause)
+
+        make_dir(TESTING_VGRID)
+        file_to_admin_reader, file_to_admin_writer = Pipe(duplex=False)
+        file_to_logger_reader, file_to_logger_writer = Pipe(duplex=False)
+
+        for trigger_mode in [TRIGGER_CLOSED, TRIGGER_QUIET]:
+            file_monitor = LocalWorkflowFileMonitor(
+                file_to_admin_writer,
+                file_to_logger_writer,
+                trigger_mode=trigger_mode,
+                quiet_period=1
+            )
+            file_monitor_process = Observer()
+            file_monitor_process.schedule(
+                file_monitor,
+                TESTING_VGRID,
+                recursive=True
+            )
+            file_monitor_process.start()
+
+            # Written for longer than the one second debounce, so that in
+            # the default mode several jobs would be triggered.
+            file_path = os.path.join(TESTING_VGRID, trigger_mode)
+            write_in_chunks(file_path, 6, 0.3)
+            written = time.time()
+
+            msg = file_to_admin_reader.recv()
+            self.assertEqual(msg.src_path, file_path)
+            if trigger_mode == TRIGGER_CLOSED:
+                self.assertEqual(msg.event_type, 'closed')
+            else:
+                self.assertGreaterEqual(time.time() - written, 0.9)
+            self.assertFalse(file_to_admin_reader.poll(2))
+
+            # Moving a file into place completes it
+            moved_path = os.path.join(TESTING_VGRID, 'moved_' + trigger_mode)
+            os.rename(file_path, moved_path)
+            msg = file_to_admin_reader.recv()
+            self.assertEqual(msg.src_path, moved_path)
+            self.assertFalse(file_to_admin_reader.poll(2))
+
+            file_monitor_process.stop()
+            file_monitor_process.join()
+
+        with self.assertRaises(ValueError):
+            WorkflowRunner(
+                TESTING_VGRID,
+                0,
+                daemon=True,
+                print_logging=False,
+                trigger_mode='unknown'
+            )
+
+    @pytest.mark.timeout(10)
+    def testFileMonitorRuleReplica(self):
+        make_dir(TESTING_VGRID)
+        file_to_admin_reader, file_to_admin_writer = Pipe(duplex=False)
+        file_to_logger_reader, file_to_logger_writer = Pipe(duplex=False)
+        admin_to_monitor_reader, admin_to_monitor_writer = Pipe(duplex=False)
+
+        file_monitor = LocalWorkflowFileMonitor(
+            file_to_admin_writer,
+            file_to_logger_writer,
+            from_admin=admin_to_monitor_reader,
+            vgrid=TESTING_VGRID
+        )
+        rule_paths = []
+        file_monitor.add_rule_listener(rule_paths.append)
+        self.assertEqual(rule_paths, [[]])
+
+        admin_to_monitor_writer.send([
+            {RULE_ID: 'rule_1', RULE_PATH: 'start/*'},
+            {RULE_ID: 'rule_2', RULE_PATH: 'start/*.txt'}
+        ])
+        while len(rule_paths) < 2:
+            time.sleep(0.1)
+        self.assertEqual(rule_paths[1], ['start/*', 'start/*.txt'])
+        self.assertEqual(len(file_monitor.rule_index), 2)
+
+        # Events matching no rule never reach the administrator
+        file_monitor.handle_event(
+            FileCreatedEvent(os.path.join(TESTING_VGRID, 'other', 'a.txt')))
+        self.assertFalse(file_to_admin_reader.poll(1))
+
+        file_path = os.path.join(TESTING_VGRID, 'start', 'a.txt')
+        file_monitor.handle_event(FileCreatedEvent(file_path))
+        self.assertEqual(
+            file_to_admin_reader.recv(),
+            ('created', file_path, ['rule_1', 'rule_2'])
+        )
+
+        admin_to_monitor_writer.send([])
+        while len(rule_paths) < 3:
+            time.sleep(0.1)
+        file_monitor.handle_event(
+            FileCreatedEvent(os.path.join(TESTING_VGRID, 'start', 'b.txt')))
+        self.assertFalse(file_to_admin_reader.poll(1))
+
     @pytest.mark.timeout(5)
     def testStateMonitorProcess(self):
         make_dir(RUNNER_DATA)
@@ -352,6 +591,65 @@ class WorkflowTest(unittest.TestCase):
         state_monitor_process.join()
         self.assertFalse(state_monitor_process.is_alive())
 
+    def testStateMonitorChangeDetection(self):
+        make_dir(RUNNER_DATA)
+        make_dir(os.path.join(RUNNER_DATA, PATTERNS))
+        make_dir(os.path.join(RUNNER_DATA, RECIPES))
+
+        state_to_admin_reader, state_to_admin_writer = Pipe(duplex=False)
+        state_to_logger_reader, state_to_logger_writer = Pipe(duplex=False)
+
+        data = read_dir(directory='examples/meow_directory')
+        pattern = data['patterns']['adder']
+        write_dir_pattern(pattern, directory=RUNNER_DATA)
+        pattern_path = os.path.join(RUNNER_DATA, PATTERNS, 'adder')
+
+        state_monitor = LocalWorkflowStateMonitor(
+            state_to_admin_writer,
+            state_to_logger_writer,
+            RUNNER_DATA,
+            debounce_period=0
+        )
+        self.assertEqual(state_to_admin_reader.recv()['pattern'], pattern)
+
+        # Files that are touched or rewritten unchanged are not read again
+        os.utime(pattern_path, ns=(0, 0))
+        state_monitor.on_modified(FileModifiedEvent(pattern_path))
+        write_dir_pattern(pattern, directory=RUNNER_DATA)
+        state_monitor.on_modified(FileModifiedEvent(pattern_path))
+        self.assertFalse(state_to_admin_reader.poll(0.1))
+
+        changed = copy.deepcopy(pattern)
+        changed.add_variable('extra_variable', 1)
+        write_dir_pattern(changed, directory=RUNNER_DATA)
+        state_monitor.on_modified(FileModifiedEvent(pattern_path))
+        msg = state_to_admin_reader.recv()
+        self.assertEqual(msg['operation'], OP_CREATE)
+        self.assertEqual(msg['pattern'], changed)
+
+        # Bursts of events for a file are only handled once they end
+        handled = []
+        update_rules = state_monitor.update_rules
+
+        def count_updates(event):
+            handled.append(event)
+            update_rules(event)
+        state_monitor.update_rules = count_updates
+        state_monitor.debounce_period = 0.2
+
+        write_dir_pattern(pattern, directory=RUNNER_DATA)
+        for _ in range(5):
+            state_monitor.on_modified(FileModifiedEvent(pattern_path))
+        self.assertEqual(handled, [])
+        self.assertEqual(state_to_admin_reader.recv()['pattern'], pattern)
+        self.assertEqual(len(handled), 1)
+
+        state_monitor.debounce_period = 0
+        os.remove(pattern_path)
+        state_monitor.on_deleted(FileDeletedEvent(pattern_path))
+        self.assertEqual(state_to_admin_reader.recv()['pattern'], 'adder')
+        self.assertNotIn((PATTERNS, 'adder'), state_monitor.file_states)
+
     @pytest.mark.timeout(5)
     def testAdminProcessUserInteractions(self):
         data = read_dir(directory='examples/meow_directory')
@@ -445,12 +743,23 @@ class WorkflowTest(unittest.TestCase):
         self.assertEqual(msg, [])
 
         user_to_admin_writer.send(('check_status', None))
-        msg = admin_to_queue_reader.recv()
-        self.assertEqual(msg, 'get_queue')
-        queue_to_admin_writer.send([])
         msg = admin_to_user_reader.recv()
         self.assertEqual(msg, '[0/0] []')
 
+        user_to_admin_writer.send(('get_stats', None))
+        msg = admin_to_user_reader.recv()
+        self.assertEqual(
+            msg,
+            {
+                'total': 0,
+                'queued': 0,
+                'running': 0,
+                'done': 0,
+                'failed': 0,
+                'patterns': {}
+            }
+        )
+
         user_to_admin_writer.send(('add_pattern', pattern))
         msg = admin_to_user_reader.recv()
         self.assertTrue(msg)
@@ -505,6 +814,68 @@ class WorkflowTest(unittest.TestCase):
         administrator_process.join()
         self.assertFalse(administrator_process.is_alive())
 
+    @pytest.mark.timeout(5)
+    def testAdminProcessBatchedRequests(self):
+        user_to_admin_reader, user_to_admin_writer = Pipe(duplex=False)
+        admin_to_user_reader, admin_to_user_writer = Pipe(duplex=False)
+        state_to_admin_reader, state_to_admin_writer = Pipe(duplex=False)
+        file_to_admin_reader, file_to_admin_writer = Pipe(duplex=False)
+        admin_to_queue_reader, admin_to_queue_writer = Pipe(duplex=False)
+        queue_to_admin_reader, queue_to_admin_writer = Pipe(duplex=False)
+        admin_to_logger_reader, admin_to_logger_writer = Pipe(duplex=False)
+
+        administrator_process = Process(
+            target=administrator,
+            args=(
+                user_to_admin_reader,
+                admin_to_user_writer,
+                state_to_admin_reader,
+                file_to_admin_reader,
+                admin_to_queue_writer,
+                queue_to_admin_reader,
+                [],
+                [],
+                admin_to_logger_writer,
+                TESTING_VGRID,
+                JOB_DIR,
+                RUNNER_DATA,
+                True,
+                False
+            )
+        )
+
+        administrator_process.start()
+        self.assertTrue(administrator_process.is_alive())
+
+        user_to_admin_writer.send(
+            (
+                'batch',
+                [
+                    ('check_patterns', None),
+                    ('check_recipes', None),
+                    ('check_rules', None),
+                    ('check_queue', None),
+                    ('get_all_jobs', None)
+                ]
+            )
+        )
+        msg = admin_to_queue_reader.recv()
+        self.assertEqual(msg, 'get_queue')
+        queue_to_admin_writer.send(['1234567890'])
+        msg = admin_to_user_reader.recv()
+        self.assertEqual(msg, [{}, {}, [], ['1234567890'], []])
+
+        user_to_admin_writer.send(('batch', []))
+        msg = admin_to_user_reader.recv()
+        self.assertEqual(msg, [])
+
+        user_to_admin_writer.send(('kill', None))
+        msg = admin_to_user_reader.recv()
+        self.assertEqual(msg, 'dead')
+
+        administrator_process.join()
+        self.assertFalse(administrator_process.is_alive())
+
     @pytest.mark.timeout(5)
     def testAdminMonitorInteractions(self):
         make_dir(TESTING_VGRID)
@@ -729,11 +1100,52 @@ class WorkflowTest(unittest.TestCase):
         self.assertEqual(msg, [job_id])
 
         user_to_admin_writer.send(('check_status', None))
-        msg = admin_to_queue_reader.recv()
-        self.assertEqual(msg, 'get_queue')
-        queue_to_admin_writer.send([])
         msg = admin_to_user_reader.recv()
-        self.assertEqual(msg, "[0/1] ['%s']" % pattern.trigger_paths[0])
+        self.assertEqual(msg, "[1/1] ['%s']" % pattern.trigger_paths[0])
+
+        user_to_admin_writer.send(('get_stats', None))
+        msg = admin_to_user_reader.recv()
+        self.assertEqual(msg['total'], 1)
+        self.assertEqual(msg['queued'], 1)
+        self.assertEqual(msg['running'], 0)
+        self.assertEqual(
+            msg['patterns'],
+            {
+                pattern.name: {
+                    'queued': 1,
+                    'running': 0,
+                    'done': 0,
+                    'failed': 0
+                }
+            }
+        )
+
+        queue_to_admin_writer.send((JOB_TRANSITION, job_id, RUNNING))
+        user_to_admin_writer.send(('get_stats', None))
+        msg = admin_to_user_reader.recv()
+        self.assertEqual(msg['queued'], 0)
+        self.assertEqual(msg['running'], 1)
+
+        queue_to_admin_writer.send((JOB_TRANSITION, job_id, DONE))
+        user_to_admin_writer.send(('get_stats', None))
+        msg = admin_to_user_reader.recv()
+        self.assertEqual(msg['total'], 1)
+        self.assertEqual(msg['running'], 0)
+        self.assertEqual(msg['done'], 1)
+        self.assertEqual(msg['patterns'][pattern.name]['done'], 1)
+
+        user_to_admin_writer.send(('get_jobs', {'status': DONE}))
+        msg = admin_to_user_reader.recv()
+        self.assertEqual(len(msg), 1)
+        self.assertEqual(msg[0]['id'], job_id)
+        self.assertEqual(msg[0]['pattern'], pattern.name)
+        self.assertEqual(msg[0]['status'], DONE)
+        self.assertIsNotNone(msg[0]['start'])
+        self.assertIsNotNone(msg[0]['end'])
+
+        user_to_admin_writer.send(('get_jobs', {'status': RUNNING}))
+        msg = admin_to_user_reader.recv()
+        self.assertEqual(msg, [])
 
         file_monitor_process.stop()
         file_monitor_process.join()
@@ -750,6 +1162,627 @@ class WorkflowTest(unittest.TestCase):
         administrator_process.join()
         self.assertFalse(administrator_process.is_alive())
 
+    def testJobTable(self):
+        table = JobTable()
+
+        table.add('job_1', 'pattern_a', 'recipe', 'rule', 'path/1')
+        table.add('job_2', 'pattern_a', 'recipe', 'rule', 'path/2')
+        table.add('job_3', 'pattern_b', 'recipe', 'rule', 'path/3')
+
+        self.assertEqual(len(table), 3)
+        self.assertIn('job_2', table)
+        self.assertEqual(table.ids(), ['job_1', 'job_2', 'job_3'])
+        self.assertEqual(table.ids(status=QUEUED), ['job_1', 'job_2', 'job_3'])
+        self.assertEqual(table.ids(pattern='pattern_b'), ['job_3'])
+
+        self.assertTrue(table.update('job_1', RUNNING))
+        self.assertTrue(table.update('job_2', RUNNING))
+        self.assertTrue(table.update('job_2', FAILED, error='broken'))
+        self.assertFalse(table.update('job_4', RUNNING))
+        self.assertFalse(table.update('job_3', 'unknown'))
+
+        self.assertEqual(table.ids(status=QUEUED), ['job_3'])
+        self.assertEqual(
+            table.ids(status=RUNNING, pattern='pattern_a'), ['job_1'])
+        self.assertEqual(
+            table.counts(),
+            {QUEUED: 1, RUNNING: 1, DONE: 0, FAILED: 1}
+        )
+        self.assertEqual(
+            table.pattern_counts()['pattern_a'],
+            {QUEUED: 0, RUNNING: 1, DONE: 0, FAILED: 1}
+        )
+        self.assertEqual(table.get('job_2').error, 'broken')
+        self.assertIsNotNone(table.get('job_2').end_time)
+        self.assertIsNone(table.get('job_4'))
+
+        with self.assertRaises(AttributeError):
+            table.get('job_1').unexpected = True
+
+        self.assertTrue(table.remove('job_3'))
+        self.assertEqual(table.ids(), ['job_1', 'job_2'])
+        self.assertNotIn('pattern_b', table.pattern_counts())
+        table.pattern_counts()['pattern_a'][QUEUED] = 10
+        self.assertEqual(table.pattern_counts()['pattern_a'][QUEUED], 0)
+
+        make_dir(JOB_DIR)
+        table_path = os.path.join(JOB_DIR, JOB_TABLE_FILE)
+        # A failed write is tried again on the next flush
+        table.flush_path = os.path.join(JOB_DIR, 'blocked', JOB_TABLE_FILE)
+        os.makedirs(table.flush_path)
+        with self.assertRaises(OSError):
+            table.flush()
+        os.rmdir(table.flush_path)
+        table.flush_path = table_path
+        self.assertTrue(table.flush())
+        self.assertFalse(table.flush())
+
+        with open(table_path, 'r') as table_file:
+            records = json.load(table_file)
+        self.assertEqual([r['id'] for r in records], ['job_1', 'job_2'])
+        self.assertEqual(records[1]['status'], FAILED)
+
+        table.stop_flushing(remove=True)
+        self.assertFalse(os.path.exists(table_path))
+
+    def testRuleIndex(self):
+        make_dir(TESTING_VGRID)
+        for directory in ['initial_data', 'data_1', 'data_1/nested',
+                          'data_2', '.hidden']:
+            make_dir(os.path.join(TESTING_VGRID, directory))
+        for path in ['initial_data/a.npy', 'initial_data/.b.npy',
+                     'data_1/data_1.npy', 'data_1/data_2.txt',
+                     'data_1/nested/data_3.npy', 'data_2/c.npy',
+                     '.hidden/d.npy', 'top.npy']:
+            with open(os.path.join(TESTING_VGRID, path), 'w') as f:
+                f.write('data')
+
+        rules = [
+            {RULE_ID: 'rule_%s' % i, RULE_PATH: path}
+            for i, path in enumerate([
+                'initial_data/*',
+                'data_1/data_*.npy',
+                'data_*/*',
+                '*.npy',
+                '.hidden/*',
+                'data_1/nested/data_3.npy',
+                'missing/*'
+            ])
+        ]
+        index = RuleIndex(rules)
+        self.assertEqual(len(index), 7)
+
+        scan_reader, scan_writer = Pipe(duplex=False)
+        found = index.scan(TESTING_VGRID, scan_writer, chunk_size=2)
+
+        scanned = []
+        while True:
+            status, matches = scan_reader.recv()
+            if status == SCAN_DONE:
+                break
+            self.assertLessEqual(len(matches), 2)
+            scanned.extend(matches)
+        self.assertEqual(found, len(scanned))
+
+        # Scanning should find exactly what glob would for each rule
+        for rule in rules:
+            globbed = sorted(
+                os.path.relpath(path, TESTING_VGRID) for path in
+                glob.glob(os.path.join(TESTING_VGRID, rule[RULE_PATH]))
+            )
+            self.assertEqual(
+                sorted(path for rule_id, path in scanned
+                       if rule_id == rule[RULE_ID]),
+                globbed
+            )
+
+        self.assertEqual(
+            [rule[RULE_ID] for rule in index.match('data_1/data_1.npy')],
+            ['rule_1', 'rule_2', 'rule_3']
+        )
+        self.assertTrue(index.remove('rule_1'))
+        self.assertFalse(index.remove('rule_1'))
+        self.assertIsNone(index.get('rule_1'))
+        self.assertEqual(
+            [rule[RULE_ID] for rule in index.match('data_1/data_1.npy')],
+            ['rule_2', 'rule_3']
+        )
+
+    def testInputIndex(self):
+        make_dir(TESTING_VGRID)
+        input_path = os.path.join(TESTING_VGRID, 'input.txt')
+        with open(input_path, 'w') as f:
+            f.write('original')
+        index_path = os.path.join(TESTING_VGRID, 'index.jsonl')
+
+        data = read_dir(directory='examples/meow_directory')
+        pattern = data[PATTERNS]['pAppend']
+        recipe = data[RECIPES]['rAppend']
+        rule_key = get_rule_key(pattern, recipe, 'start/*')
+        self.assertEqual(rule_key, get_rule_key(pattern, recipe, 'start/*'))
+        self.assertNotEqual(rule_key, get_rule_key(pattern, recipe, 'end/*'))
+        modified = Pattern(pattern.name)
+        modified.add_single_input(pattern.trigger_file, 'start/*')
+        modified.add_recipe(recipe[NAME])
+        self.assertNotEqual(
+            rule_key, get_rule_key(modified, recipe, 'start/*'))
+
+        index = InputIndex(path=index_path)
+        self.assertFalse(
+            index.is_unchanged(rule_key, 'input.txt', input_path))
+        state = index.get_state(input_path)
+        self.assertEqual(state[0], len('original'))
+        self.assertIsNone(state[2])
+        index.record(rule_key, 'input.txt', state)
+        self.assertTrue(index.is_unchanged(rule_key, 'input.txt', input_path))
+        self.assertFalse(index.is_unchanged('other', 'input.txt', input_path))
+        self.assertIsNone(
+            index.get_state(os.path.join(TESTING_VGRID, 'missing.txt')))
+
+        # Records persist across restarts
+        reloaded = InputIndex(path=index_path)
+        self.assertEqual(len(reloaded), 1)
+        self.assertTrue(
+            reloaded.is_unchanged(rule_key, 'input.txt', input_path))
+
+        # Touching the input means it is processed again, unless hashed
+        os.utime(input_path, ns=(0, 0))
+        self.assertFalse(
+            reloaded.is_unchanged(rule_key, 'input.txt', input_path))
+
+        hashed = InputIndex(path=index_path, hash_inputs=True)
+        hashed.record(rule_key, 'input.txt', hashed.get_state(input_path))
+        os.utime(input_path, ns=(1000, 1000))
+        self.assertTrue(hashed.is_unchanged(rule_key, 'input.txt', input_path))
+        # The new modification time is recorded, so the input need not be
+        # hashed again
+        self.assertTrue(
+            InputIndex(path=index_path).is_unchanged(
+                rule_key, 'input.txt', input_path))
+        with open(input_path, 'w') as f:
+            f.write('modified')
+        os.utime(input_path, ns=(2000, 2000))
+        self.assertFalse(
+            hashed.is_unchanged(rule_key, 'input.txt', input_path))
+
+        # Superseded records are dropped from the file when loading
+        for _ in range(3):
+            hashed.record(rule_key, 'input.txt', hashed.get_state(input_path))
+        with open(index_path, 'r') as f:
+            self.assertEqual(len(f.readlines()), 4)
+        reloaded = InputIndex(path=index_path, hash_inputs=True)
+        with open(index_path, 'r') as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.assertTrue(
+            reloaded.is_unchanged(rule_key, 'input.txt', input_path))
+
+    def testNotebookStore(self):
+        make_dir(TESTING_VGRID)
+        store_dir = os.path.join(TESTING_VGRID, NOTEBOOK_STORE_DIR)
+        data = read_dir(directory='examples/meow_directory')
+        recipe = data[RECIPES]['rAppend']
+
+        store = NotebookStore(store_dir, cache_size=1)
+        digest = store.put(recipe[RECIPE])
+        self.assertEqual(digest, notebook_digest(recipe[RECIPE]))
+        self.assertEqual(store.put(copy.deepcopy(recipe[RECIPE])), digest)
+        self.assertTrue(os.path.exists(store.path(digest)))
+        self.assertIs(store.get(digest), recipe[RECIPE])
+
+        # Evicted notebooks, and those stored by another store, are read
+        store.put({'cells': []})
+        other = NotebookStore(store_dir)
+        self.assertEqual(store.get(digest), recipe[RECIPE])
+        self.assertEqual(other.get(digest), recipe[RECIPE])
+
+        slim = store.slim_recipe(recipe)
+        self.assertNotIn(RECIPE, slim)
+        self.assertEqual(slim[RECIPE_HASH], digest)
+        self.assertIs(store.slim_recipe(slim), slim)
+        self.assertEqual(
+            get_rule_key(data[PATTERNS]['pAppend'], slim, 'start/*'),
+            get_rule_key(data[PATTERNS]['pAppend'], recipe, 'start/*'))
+        self.assertEqual(other.expand_recipe(slim), recipe)
+        self.assertIs(other.expand_recipe(recipe), recipe)
+
+        # Jobs are given a link to the stored notebook, not a copy
+        base_path = os.path.join(TESTING_VGRID, BASE_FILE)
+        store.link(digest, base_path)
+        self.assertTrue(os.path.samefile(base_path, store.path(digest)))
+        with open(base_path, 'r') as f:
+            self.assertEqual(json.load(f), recipe[RECIPE])
+
+        # Notebooks no longer needed are removed, once old enough, without
+        # affecting jobs linked to them
+        self.assertEqual(store.sweep(set()), [])
+        other_digest = notebook_digest({'cells': []})
+        self.assertEqual(store.sweep({other_digest}, min_age=0), [digest])
+        self.assertFalse(os.path.exists(store.path(digest)))
+        self.assertTrue(os.path.exists(store.path(other_digest)))
+        with open(base_path, 'r') as f:
+            self.assertEqual(json.load(f), recipe[RECIPE])
+
+    def testRetentionSelection(self):
+        table = JobTable()
+        for i in range(6):
+            table.add('job_%s' % i, 'pattern', 'recipe', 'rule', 'path')
+        for i in range(5):
+            table.update('job_%s' % i, RUNNING)
+        for i in [0, 1, 3]:
+            table.update('job_%s' % i, DONE)
+        for i in [2, 4]:
+            table.update('job_%s' % i, FAILED)
+        records = [table.get(job_id) for job_id in table.ids()]
+
+        def expired_ids(policy, now=None):
+            return [r.job_id for r in
+                    select_expired_jobs(records, policy, now=now)]
+
+        self.assertEqual(expired_ids({}), [])
+        self.assertEqual(
+            expired_ids({RETENTION_KEEP_FAILED_ONLY: True}),
+            ['job_0', 'job_1', 'job_3']
+        )
+        self.assertEqual(
+            expired_ids({RETENTION_MAX_COUNT: 2}),
+            ['job_0', 'job_1', 'job_2']
+        )
+        self.assertEqual(
+            expired_ids({
+                RETENTION_KEEP_FAILED_ONLY: True,
+                RETENTION_MAX_COUNT: 1
+            }),
+            ['job_0', 'job_1', 'job_2', 'job_3']
+        )
+        self.assertEqual(expired_ids({RETENTION_MAX_AGE: 60}), [])
+        self.assertEqual(
+            expired_ids(
+                {RETENTION_MAX_AGE: 60},
+                now=datetime.now() + timedelta(seconds=120)
+            ),
+            ['job_0', 'job_1', 'job_2', 'job_3', 'job_4']
+        )
+
+        self.assertEqual(is_valid_retention_dict({}), (True, ''))
+        self.assertTrue(is_valid_retention_dict({
+            RETENTION_MAX_AGE: 10,
+            RETENTION_ARCHIVE: True
+        })[0])
+        self.assertFalse(is_valid_retention_dict({RETENTION_MAX_AGE: -1})[0])
+        self.assertFalse(is_valid_retention_dict({RETENTION_INTERVAL: 0})[0])
+        self.assertFalse(
+            is_valid_retention_dict({RETENTION_MAX_COUNT: '1'})[0])
+        self.assertFalse(
+            is_valid_retention_dict({'unknown': 1}, strict=True)[0])
+
+    def testRetentionArchiving(self):
+        make_dir(JOB_DIR)
+        make_dir(OUTPUT_DATA)
+
+        jobs = []
+        for job_id, status in [('job_0', DONE), ('job_1', FAILED)]:
+            if status == DONE:
+                job_dir = os.path.join(OUTPUT_DATA, job_id)
+            else:
+                job_dir = os.path.join(JOB_DIR, job_id)
+            make_dir(job_dir)
+            with open(os.path.join(job_dir, 'result.txt'), 'w') as f:
+                f.write(job_id)
+            jobs.append({
+                'id': job_id,
+                'pattern': 'pattern',
+                'status': status,
+                'end': datetime.now()
+            })
+
+        archive = retire_jobs(jobs, JOB_DIR, OUTPUT_DATA, archive=True)
+        self.assertTrue(os.path.exists(archive))
+        self.assertFalse(os.path.exists(os.path.join(OUTPUT_DATA, 'job_0')))
+        self.assertFalse(os.path.exists(os.path.join(JOB_DIR, 'job_1')))
+
+        entry = find_archived_job(OUTPUT_DATA, 'job_1')
+        self.assertEqual(entry['id'], 'job_1')
+        self.assertEqual(entry['status'], FAILED)
+        self.assertEqual(entry['archive'], archive)
+        self.assertIsNone(find_archived_job(OUTPUT_DATA, 'job_2'))
+
+        extracted = extract_archived_job(OUTPUT_DATA, 'job_0', TESTING_VGRID)
+        with open(os.path.join(extracted, 'result.txt'), 'r') as f:
+            self.assertEqual(f.read(), 'job_0')
+        self.assertFalse(os.path.exists(os.path.join(TESTING_VGRID, 'job_1')))
+
+        with self.assertRaises(ValueError):
+            extract_archived_job(OUTPUT_DATA, 'job_2', TESTING_VGRID)
+
+        # Members that would be written outside of the destination are
+        # refused, even without extraction filters
+        for name, member_type, linkname in [
+                ('job_0/../../escaped.txt', tarfile.REGTYPE, ''),
+                ('job_0/link', tarfile.SYMTYPE, '../../escaped.txt'),
+                ('job_0/link', tarfile.SYMTYPE, '/etc/passwd'),
+                ('job_0/device', tarfile.CHRTYPE, '')]:
+            member = tarfile.TarInfo(name)
+            member.type = member_type
+            member.linkname = linkname
+            with self.assertRaises(ValueError):
+                check_archive_member(member, TESTING_VGRID)
+        member = tarfile.TarInfo('job_0/result.txt')
+        member.mode = 0o4777
+        check_archive_member(member, TESTING_VGRID)
+        self.assertEqual(member.mode, 0o755)
+
+        self.assertIsNone(retire_jobs(jobs, JOB_DIR, OUTPUT_DATA))
+
+        with self.assertRaises(ValueError):
+            WorkflowRunner(
+                TESTING_VGRID,
+                0,
+                daemon=True,
+                retention={RETENTION_MAX_COUNT: -1}
+            )
+
+    def testWorkflowRunnerRetention(self):
+        data = read_dir(directory='examples/meow_directory')
+
+        runner = WorkflowRunner(
+            TESTING_VGRID,
+            2,
+            patterns={'adder': data[PATTERNS]['adder']},
+            recipes={'add': data[RECIPES]['add']},
+            daemon=True,
+            reuse_vgrid=True,
+            print_logging=False,
+            retention={
+                RETENTION_MAX_COUNT: 1,
+                RETENTION_ARCHIVE: True,
+                RETENTION_INTERVAL: 1
+            }
+        )
+        try:
+            data_directory = os.path.join(TESTING_VGRID, 'initial_data')
+            make_dir(data_directory)
+            np.save(
+                os.path.join(data_directory, 'datafile.npy'),
+                np.random.randint(100, size=(5, 5))
+            )
+
+            # One job for each value in the pattern's parameter sweep, all
+            # but the newest of which are retired once finished
+            stats = {}
+            for _ in range(60):
+                time.sleep(1)
+                stats = runner.get_stats()
+                if stats['total'] == 1 and stats[DONE] == 1:
+                    break
+            self.assertEqual(stats['total'], 1)
+            self.assertEqual(stats[DONE], 1)
+            self.assertEqual(stats['patterns']['adder'][DONE], 1)
+            kept = [job['id'] for job in runner.get_jobs()]
+            self.assertEqual(len(kept), 1)
+
+            with open(os.path.join(
+                    get_archive_dir(OUTPUT_DATA), ARCHIVE_INDEX), 'r') as f:
+                retired = [json.loads(line)['id'] for line in f]
+            self.assertEqual(len(retired), 2)
+            self.assertNotIn(kept[0], retired)
+
+            table_path = os.path.join(JOB_DIR, JOB_TABLE_FILE)
+            for _ in range(50):
+                remaining = [job_id for job_id in retired
+                             if os.path.exists(
+                                 os.path.join(OUTPUT_DATA, job_id))]
+                with open(table_path, 'r') as table_file:
+                    table = [r['id'] for r in json.load(table_file)]
+                if not remaining and table == kept:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(remaining, [])
+            self.assertEqual(table, kept)
+            self.assertTrue(
+                os.path.isdir(os.path.join(OUTPUT_DATA, kept[0])))
+            for job_id in retired:
+                self.assertIsNotNone(find_archived_job(OUTPUT_DATA, job_id))
+
+            # Nothing more is expired
+            self.assertEqual(runner.apply_retention(), [])
+        finally:
+            self.assertTrue(runner.stop_runner(clear_jobs=True))
+
+    def testRmtree(self):
+        def make_tree(root):
+            make_dir(root)
+            for i in range(3):
+                branch = os.path.join(root, 'branch_%s' % i)
+                make_dir(branch)
+                make_dir(os.path.join(branch, 'leaf'))
+                for directory in [branch, os.path.join(branch, 'leaf')]:
+                    with open(os.path.join(directory, 'file.txt'), 'w') as f:
+                        f.write('data')
+            with open(os.path.join(root, 'top.txt'), 'w') as f:
+                f.write('data')
+            os.symlink(
+                os.path.abspath(os.path.join(root, 'branch_0')),
+                os.path.join(root, 'link')
+            )
+
+        make_dir(TESTING_VGRID)
+        outside = os.path.join(TESTING_VGRID, 'outside')
+        make_dir(outside)
+
+        tree = os.path.join(TESTING_VGRID, 'tree')
+        make_tree(tree)
+        os.symlink(
+            os.path.abspath(outside), os.path.join(tree, 'outside_link'))
+        self.assertIsNone(rmtree(tree))
+        self.assertFalse(os.path.exists(tree))
+        self.assertTrue(os.path.exists(outside))
+
+        make_tree(tree)
+        self.assertIsNone(rmtree(tree, workers=1))
+        self.assertFalse(os.path.exists(tree))
+
+        make_tree(tree)
+        remover = rmtree(tree, background=True)
+        self.assertFalse(os.path.exists(tree))
+        remover.join()
+        self.assertEqual(os.listdir(TESTING_VGRID), ['outside'])
+
+        parent = os.path.join(TESTING_VGRID, 'parent')
+        make_dir(parent)
+        trees = [os.path.join(parent, 'tree_%s' % i) for i in range(4)]
+        for tree in trees:
+            make_tree(tree)
+        self.assertIsNone(rmtrees(trees[:2]))
+        self.assertEqual(sorted(os.listdir(parent)), ['tree_2', 'tree_3'])
+
+        remover = rmtrees(trees, background=True)
+        self.assertEqual(
+            [name for name in os.listdir(parent)
+             if not name.startswith(TRASH_PREFIX)], [])
+        remover.join()
+        self.assertEqual(os.listdir(parent), [])
+        self.assertEqual(
+            sorted(os.listdir(TESTING_VGRID)), ['outside', 'parent'])
+
+        for tree in trees:
+            make_tree(tree)
+        remover = rmtrees_detached(trees)
+        self.assertEqual(remover.wait(timeout=30), 0)
+        self.assertEqual(os.listdir(parent), [])
+
+    @unittest.skipUnless(is_inotify_available(), 'inotify not available')
+    @pytest.mark.timeout(30)
+    def testInotifyObserver(self):
+        def write_file(path):
+            with open(os.path.join(TESTING_VGRID, path), 'w') as f:
+                f.write('data')
+
+        def get_events():
+            paths = set()
+            while file_to_admin_reader.poll(2):
+                event = file_to_admin_reader.recv()
+                paths.add(os.path.relpath(event.src_path, TESTING_VGRID))
+            return paths
+
+        make_dir(TESTING_VGRID)
+        for directory in ['initial_data', 'unrelated']:
+            make_dir(os.path.join(TESTING_VGRID, directory))
+
+        self.assertEqual(
+            get_watch_roots(
+                ['initial_data/*', 'data_1/data_*.npy', 'other/file.txt']),
+            {'initial_data': True, 'data_1': True, 'other': False}
+        )
+
+        file_to_admin_reader, file_to_admin_writer = Pipe(duplex=False)
+        file_to_logger_reader, file_to_logger_writer = Pipe(duplex=False)
+
+        file_monitor = LocalWorkflowFileMonitor(
+            file_to_admin_writer, file_to_logger_writer)
+        file_monitor_process = InotifyObserver(
+            rule_paths=[
+                'initial_data/*', 'data_1/data_*.npy', 'other/file.txt']
+        )
+        file_monitor_process.schedule(file_monitor, TESTING_VGRID)
+        # Directories without any rule path leading to them are not watched
+        self.assertEqual(
+            sorted(file_monitor_process.watched()), ['', 'initial_data'])
+
+        file_monitor_process.start()
+        self.assertTrue(file_monitor_process.is_alive())
+
+        write_file('unrelated/ignored.txt')
+        write_file('initial_data/a.txt')
+        make_dir(os.path.join(TESTING_VGRID, 'initial_data', 'nested'))
+        time.sleep(0.5)
+        write_file('initial_data/nested/b.txt')
+        make_dir(os.path.join(TESTING_VGRID, 'data_1'))
+        time.sleep(0.5)
+        write_file('data_1/data_1.npy')
+        make_dir(os.path.join(TESTING_VGRID, 'other'))
+        time.sleep(0.5)
+        write_file('other/file.txt')
+        write_file('other/not_file.txt')
+        os.rename(
+            os.path.join(TESTING_VGRID, 'unrelated', 'ignored.txt'),
+            os.path.join(TESTING_VGRID, 'initial_data', 'moved.txt')
+        )
+
+        self.assertEqual(
+            get_events(),
+            {'initial_data/a.txt', 'initial_data/nested/b.txt',
+             'data_1/data_1.npy', 'other/file.txt', 'other/not_file.txt',
+             'initial_data/moved.txt'}
+        )
+        watched = file_monitor_process.watched()
+        self.assertEqual(
+            sorted(watched),
+            ['', 'data_1', 'initial_data', 'initial_data/nested', 'other']
+        )
+        # Only directories that may contain others need new directories
+        self.assertFalse(watched['other'] & IN_CREATE)
+        self.assertTrue(watched['initial_data'] & IN_CREATE)
+
+        file_monitor_process.update_rules(['unrelated/*'])
+        time.sleep(0.5)
+        self.assertEqual(
+            sorted(file_monitor_process.watched()), ['', 'unrelated'])
+
+        write_file('initial_data/c.txt')
+        write_file('unrelated/d.txt')
+        self.assertEqual(get_events(), {'unrelated/d.txt'})
+
+        file_monitor_process.stop()
+        file_monitor_process.join()
+        self.assertFalse(file_monitor_process.is_alive())
+
+    @unittest.skipUnless(is_inotify_available(), 'inotify not available')
+    @pytest.mark.timeout(30)
+    def testInotifyObserverOverflow(self):
+        make_dir(TESTING_VGRID)
+        for directory in ['initial_data', 'initial_data/nested', 'unrelated']:
+            make_dir(os.path.join(TESTING_VGRID, directory))
+        for path in ['initial_data/a.txt', 'initial_data/nested/b.txt',
+                     'unrelated/c.txt']:
+            with open(os.path.join(TESTING_VGRID, path), 'w') as f:
+                f.write('data')
+
+        file_to_admin_reader, file_to_admin_writer = Pipe(duplex=False)
+        file_to_logger_reader, file_to_logger_writer = Pipe(duplex=False)
+
+        file_monitor = LocalWorkflowFileMonitor(
+            file_to_admin_writer, file_to_logger_writer)
+        file_monitor_process = InotifyObserver(rule_paths=['initial_data/*'])
+        file_monitor_process.schedule(file_monitor, TESTING_VGRID)
+
+        real_read = os.read
+
+        def read_overflow(fd, size):
+            if fd == file_monitor_process._fd:
+                return EVENT_HEADER.pack(-1, IN_Q_OVERFLOW, 0, 0)
+            return real_read(fd, size)
+
+        with mock.patch('os.read', read_overflow):
+            file_monitor_process._read_events()
+
+        # Files whose events may have been lost are sent on again
+        paths = set()
+        while file_to_admin_reader.poll(2):
+            event = file_to_admin_reader.recv()
+            paths.add(os.path.relpath(event.src_path, TESTING_VGRID))
+        self.assertEqual(
+            paths, {'initial_data/a.txt', 'initial_data/nested/b.txt'})
+
+        messages = []
+        while file_to_logger_reader.poll(0):
+            messages.append(file_to_logger_reader.recv()[1])
+        self.assertTrue(
+            any('Event queue overflowed' in message for message in messages))
+
+        os.close(file_monitor_process._fd)
+        os.close(file_monitor_process._wake_reader)
+        os.close(file_monitor_process._wake_writer)
+
     @pytest.mark.timeout(30)
     def testLocalJobProcessing(self):
         make_dir(JOB_DIR)
@@ -818,9 +1851,8 @@ class WorkflowTest(unittest.TestCase):
         self.assertEqual(msg, 'sleep')
 
         msg = worker_to_queue_reader.recv()
-        self.assertTrue(isinstance(msg, list))
-        module_list = [p.project_name for p in pkg_resources.working_set]
-        self.assertEqual(msg, module_list)
+        self.assertTrue(isinstance(msg, dict))
+        self.assertEqual(msg, get_environment_fingerprint())
 
         timer_to_worker_writer.send('done')
         msg = worker_to_timer_reader.recv()
@@ -862,6 +1894,11 @@ class WorkflowTest(unittest.TestCase):
             "Completed job %s" % job_id
         )
 
+        msg = worker_to_queue_reader.recv()
+        self.assertEqual(msg, (JOB_TRANSITION, job_id, RUNNING))
+        msg = worker_to_queue_reader.recv()
+        self.assertEqual(msg, (JOB_TRANSITION, job_id, DONE))
+
         admin_to_worker_writer.send('kill')
         msg = worker_to_admin_reader.recv()
         self.assertEqual(msg, 'dead')
@@ -869,137 +1906,320 @@ class WorkflowTest(unittest.TestCase):
         worker.join()
         self.assertFalse(worker.is_alive())
 
-#    @pytest.mark.timeout(30)
-#    def testSSHJobProcessing(self):
-#        make_dir(JOB_DIR)
-#        make_dir(OUTPUT_DATA)
-#        job_id = '1234567890'
-#        job_dir = os.path.join(JOB_DIR, job_id)
-#        make_dir(job_dir)
-#
-#        params = {
-#            'extra': 'Appended by pAppend',
-#            'infile': 'testing_directory/start/data.txt',
-#            'outfile': 'testing_directory/end/data.txt'
-#        }
-#        params_path = os.path.join(job_dir, 'params.yml')
-#        write_yaml(params, params_path)
-#
-#        job = {
-#            'create': '2021-05-21 09:14: 10.740050',
-#            'id': job_id,
-#            'path': 'start/data.txt',
-#            'pattern': 'pAppend',
-#            'recipe': 'rAppend',
-#            'rule': 'alJ7vPFkYp9hSK2A',
-#            'status': 'queed'
-#        }
-#        job_path = os.path.join(job_dir, 'job.yml')
-#        write_yaml(job, job_path)
-#
-#        recipe = read_dir_recipe(
-#            'rAppend',
-#            directory='examples/meow_directory'
-#        )
-#        base_path = os.path.join(job_dir, 'base.ipynb')
-#        write_notebook(recipe[RECIPE], base_path)
-#
-#        worker_to_timer_reader, worker_to_timer_writer = Pipe(duplex=False)
-#        timer_to_worker_reader, timer_to_worker_writer = Pipe(duplex=False)
-#        admin_to_worker_reader, admin_to_worker_writer = Pipe(duplex=False)
-#        worker_to_admin_reader, worker_to_admin_writer = Pipe(duplex=False)
-#        worker_to_queue_reader, worker_to_queue_writer = Pipe(duplex=False)
-#        queue_to_worker_reader, queue_to_worker_writer = Pipe(duplex=False)
-#        worker_to_logger_reader, worker_to_logger_writer = Pipe(duplex=False)
-#
-#        worker = Process(
-#            target=job_processor,
-#            args=(
-#                ssh_processing,
-#                {},
-#                timer_to_worker_reader,
-#                worker_to_timer_writer,
-#                admin_to_worker_reader,
-#                worker_to_admin_writer,
-#                worker_to_queue_writer,
-#                queue_to_worker_reader,
-#                worker_to_logger_writer,
-#                0,
-#                JOB_DIR,
-#                OUTPUT_DATA
-#            )
-#        )
-#
-#        worker.start()
-#        self.assertTrue(worker.is_alive())
-#
-#        msg = worker_to_timer_reader.recv()
-#        self.assertEqual(msg, 'sleep')
-#
-#        msg = worker_to_queue_reader.recv()
-#        self.assertTrue(isinstance(msg, list))
-#        module_list = [p.project_name for p in pkg_resources.working_set]
-#        self.assertEqual(msg, module_list)
-#
-#        timer_to_worker_writer.send('done')
-#        msg = worker_to_timer_reader.recv()
-#        self.assertEqual(msg, 'sleep')
-#
-#        admin_to_worker_writer.send('start')
-#        admin_to_worker_writer.send('check')
-#        msg = worker_to_admin_reader.recv()
-#        self.assertEqual(msg, 'running')
-#
-#        timer_to_worker_writer.send('done')
-#        msg = worker_to_queue_reader.recv()
-#        self.assertEqual(msg, 'request')
-#        queue_to_worker_writer.send(None)
-#        msg = worker_to_logger_reader.recv()
-#        check_logger_input(
-#            self,
-#            msg,
-#            'job_processor.worker 0',
-#            "Worker 0 found no job in queue"
-#        )
-#
-#        timer_to_worker_writer.send('done')
-#        msg = worker_to_queue_reader.recv()
-#        self.assertEqual(msg, 'request')
-#        queue_to_worker_writer.send(job_id)
-#        msg = worker_to_logger_reader.recv()
-#        check_logger_input(
-#            self,
-#            msg,
-#            'job_processor.worker 0',
-#            "Found job %s" % job_id
-#        )
-#        msg = worker_to_logger_reader.recv()
-#        check_logger_input(
-#            self,
-#            msg,
-#            'job_processor.worker 0',
-#            "Completed job %s" % job_id
-#        )
-#
-#        admin_to_worker_writer.send('kill')
-#        msg = worker_to_admin_reader.recv()
-#        self.assertEqual(msg, 'dead')
-#
-#        worker.join()
-#        self.assertFalse(worker.is_alive())
+    def testSSHWorkerValidation(self):
+        worker = {
+            SSH_HOSTNAME: 'worker-1.example.com',
+            SSH_USER: 'meow',
+            SSH_CERT: '~/.ssh/id_rsa',
+            SSH_MOUNT: 'meow_jobs'
+        }
+        self.assertEqual(is_valid_ssh_worker(worker), (True, ''))
+
+        # Local workers are empty dicts
+        self.assertFalse(is_valid_ssh_worker({})[0])
+
+        for key, value in [
+                (SSH_HOSTNAME, 'worker 1'),
+                (SSH_HOSTNAME, '-worker'),
+                (SSH_USER, 'Meow'),
+                (SSH_MOUNT, ''),
+                (SSH_CERT, ''),
+                (SSH_PORT, 0),
+                (SSH_PORT, '22'),
+                (SSH_KNOWN_HOSTS, 1),
+                (SSH_AUTO_ADD_HOST_KEYS, 'yes')]:
+            invalid = dict(worker)
+            invalid[key] = value
+            self.assertFalse(is_valid_ssh_worker(invalid)[0])
+
+        missing = dict(worker)
+        missing.pop(SSH_MOUNT)
+        self.assertFalse(is_valid_ssh_worker(missing)[0])
 
     @pytest.mark.timeout(30)
-    def testJobAssignment(self):
-        admin_to_queue_reader, admin_to_queue_writer = Pipe(duplex=False)
-        queue_to_admin_reader, queue_to_admin_writer = Pipe(duplex=False)
-        queue_to_logger_reader, queue_to_logger_writer = Pipe(duplex=False)
-
+    def testSSHConnection(self):
+        make_dir(TESTING_VGRID)
+        key_path = os.path.join(TESTING_VGRID, 'id_rsa')
+        paramiko.RSAKey.generate(1024).write_private_key_file(key_path)
+
+        server = SSHStandIn()
+        worker = {
+            SSH_HOSTNAME: '127.0.0.1',
+            SSH_USER: 'meow',
+            SSH_CERT: key_path,
+            SSH_MOUNT: os.path.join(TESTING_VGRID, 'remote'),
+            SSH_PORT: server.port
+        }
+        known_hosts_path = os.path.join(TESTING_VGRID, 'known_hosts')
+        connection = SSHConnection(worker)
+        try:
+            # Unknown hosts are refused
+            with self.assertRaises(paramiko.SSHException):
+                connection.connect()
+
+            host_keys = paramiko.HostKeys()
+            host_keys.add(
+                '[127.0.0.1]:%d' % server.port,
+                server.host_key.get_name(),
+                server.host_key
+            )
+            host_keys.save(known_hosts_path)
+            worker[SSH_KNOWN_HOSTS] = known_hosts_path
+            connection = SSHConnection(worker)
+            server.transports.clear()
+
+            # No connection is made until one is needed
+            self.assertFalse(connection.is_connected())
+            self.assertEqual(
+                connection.execute('echo hello'), (0, b'hello\n', b''))
+            self.assertTrue(connection.is_connected())
+            self.assertTrue(
+                os.path.isdir(os.path.join(TESTING_VGRID, 'remote')))
+
+            self.assertEqual(
+                connection.execute('cat', stdin=b'data'), (0, b'data', b''))
+            status, _, stderr = connection.execute('echo oops >&2; exit 3')
+            self.assertEqual((status, stderr), (3, b'oops\n'))
+
+            local_path = os.path.join(TESTING_VGRID, 'local.txt')
+            with open(local_path, 'w') as local_file:
+                local_file.write('Some data')
+            remote_path = connection.remote_path('job', 'nested', 'data.txt')
+            connection.put_file(local_path, remote_path)
+            copy_path = os.path.join(TESTING_VGRID, 'copy.txt')
+            connection.get_file(remote_path, copy_path)
+            with open(copy_path, 'r') as copy_file:
+                self.assertEqual(copy_file.read(), 'Some data')
+
+            with self.assertRaises(OSError):
+                connection.get_file(
+                    connection.remote_path('missing.txt'), copy_path)
+
+            # Every command shares the one connection
+            self.assertEqual(connection.connections, 1)
+            self.assertEqual(len(server.transports), 1)
+
+            # A dropped connection is remade when next needed
+            server.drop_connections()
+            time.sleep(0.5)
+            self.assertEqual(
+                connection.execute('echo again'), (0, b'again\n', b''))
+            self.assertEqual(connection.connections, 2)
+            self.assertEqual(len(server.transports), 2)
+        finally:
+            connection.close()
+            server.close()
+
+    @pytest.mark.timeout(60)
+    def testSSHJobProcessing(self):
         make_dir(JOB_DIR)
         make_dir(OUTPUT_DATA)
-        job_id = '1234567890'
-        job_dir = os.path.join(JOB_DIR, job_id)
-        make_dir(job_dir)
-
+        make_dir(TESTING_VGRID)
+        make_dir(os.path.join(TESTING_VGRID, 'start'))
+        key_path = os.path.join(TESTING_VGRID, 'id_rsa')
+        paramiko.RSAKey.generate(1024).write_private_key_file(key_path)
+        input_path = os.path.join(TESTING_VGRID, 'start', 'data.txt')
+        with open(input_path, 'w') as input_file:
+            input_file.write('Some data')
+
+        recipe = read_dir_recipe(
+            'rAppend',
+            directory='examples/meow_directory'
+        )
+
+        job_ids = ['1234567890', '1234567891']
+        for job_id in job_ids:
+            job_dir = os.path.join(JOB_DIR, job_id)
+            make_dir(job_dir)
+            params = {
+                'extra': 'Appended by pAppend',
+                'infile': input_path,
+                'outfile': 'testing_directory/end/data.txt'
+            }
+            write_yaml(params, os.path.join(job_dir, PARAMS_FILE))
+            job = {
+                'create': '2021-05-21 09:14: 10.740050',
+                'id': job_id,
+                'path': input_path,
+                'pattern': 'pAppend',
+                'recipe': 'rAppend',
+                'rule': 'alJ7vPFkYp9hSK2A',
+                'status': 'queued',
+                'outputs': ['testing_directory/end/data.txt']
+            }
+            write_yaml(job, os.path.join(job_dir, META_FILE))
+            write_notebook(recipe[RECIPE], os.path.join(job_dir, BASE_FILE))
+
+        server = SSHStandIn()
+        remote_dir = os.path.join(TESTING_VGRID, 'remote')
+        processing_method_args = {
+            'worker': {
+                SSH_HOSTNAME: '127.0.0.1',
+                SSH_USER: 'meow',
+                SSH_CERT: key_path,
+                SSH_MOUNT: remote_dir,
+                SSH_PORT: server.port,
+                SSH_AUTO_ADD_HOST_KEYS: True
+            }
+        }
+        connection = SSHConnection(processing_method_args['worker'])
+        processing_method_args['connection'] = connection
+        uploads = []
+        upload = connection.upload
+        connection.upload = lambda files, command=None: \
+            uploads.append([name for _, name in files]) \
+            or upload(files, command=command)
+        output_path = os.path.join(TESTING_VGRID, 'end', 'data.txt')
+        try:
+            for job_id in job_ids:
+                processing_method_args['job_id'] = job_id
+                processing_method_args['job_home'] = JOB_DIR
+                processing_method_args['output_data'] = OUTPUT_DATA
+                status, msg = ssh_processing(processing_method_args)
+                self.assertEqual((status, msg), (True, ''))
+
+                # Files written by the notebook are copied back
+                with open(output_path, 'r') as output_file:
+                    self.assertEqual(
+                        output_file.read(), 'Some data\nAppended by pAppend')
+                os.remove(output_path)
+
+                output_dir = os.path.join(OUTPUT_DATA, job_id)
+                self.assertTrue(
+                    os.path.exists(os.path.join(output_dir, RESULT_FILE)))
+                self.assertFalse(
+                    os.path.exists(os.path.join(JOB_DIR, job_id)))
+                self.assertEqual(
+                    read_yaml(os.path.join(output_dir, META_FILE))['status'],
+                    DONE
+                )
+
+                # Only the cached inputs are left on the remote worker
+                self.assertEqual(os.listdir(remote_dir), [INPUT_CACHE_DIR])
+
+            # Both jobs were processed over the same connection
+            self.assertEqual(len(server.transports), 1)
+
+            # The input was only sent once
+            cached_input = \
+                posixpath.join(INPUT_CACHE_DIR, hash_file(input_path))
+            self.assertIn(cached_input, uploads[0])
+            self.assertNotIn(cached_input, uploads[1])
+            self.assertEqual(
+                os.listdir(os.path.join(remote_dir, INPUT_CACHE_DIR)),
+                [hash_file(input_path)]
+            )
+
+            # Files that are not declared outputs are kept with the job
+            job_dir = os.path.join(JOB_DIR, '1234567892')
+            make_dir(job_dir)
+            write_yaml(params, os.path.join(job_dir, PARAMS_FILE))
+            write_notebook(recipe[RECIPE], os.path.join(job_dir, BASE_FILE))
+            write_yaml(
+                dict(job, id='1234567892', outputs=[]),
+                os.path.join(job_dir, META_FILE)
+            )
+            processing_method_args['job_id'] = '1234567892'
+            status, msg = ssh_processing(processing_method_args)
+            self.assertEqual((status, msg), (True, ''))
+            self.assertFalse(os.path.exists(output_path))
+            kept_path = os.path.join(
+                OUTPUT_DATA, '1234567892', 'testing_directory', 'end',
+                'data.txt')
+            with open(kept_path, 'r') as output_file:
+                self.assertEqual(
+                    output_file.read(), 'Some data\nAppended by pAppend')
+
+            # Jobs writing to their input do not change the cached input
+            job_dir = os.path.join(JOB_DIR, '1234567893')
+            make_dir(job_dir)
+            write_yaml(
+                dict(params, outfile=input_path),
+                os.path.join(job_dir, PARAMS_FILE)
+            )
+            write_notebook(recipe[RECIPE], os.path.join(job_dir, BASE_FILE))
+            write_yaml(
+                dict(job, id='1234567893', outputs=[]),
+                os.path.join(job_dir, META_FILE)
+            )
+            processing_method_args['job_id'] = '1234567893'
+            status, msg = ssh_processing(processing_method_args)
+            self.assertEqual((status, msg), (True, ''))
+            with open(os.path.join(remote_dir, cached_input), 'r') as f:
+                self.assertEqual(f.read(), 'Some data')
+            with open(input_path, 'r') as f:
+                self.assertEqual(f.read(), 'Some data')
+
+            # Failures on the remote worker are reported
+            job_dir = os.path.join(JOB_DIR, 'abcdefghij')
+            make_dir(job_dir)
+            write_yaml(job, os.path.join(job_dir, META_FILE))
+            write_yaml({}, os.path.join(job_dir, PARAMS_FILE))
+            with open(os.path.join(job_dir, BASE_FILE), 'w') as base_file:
+                base_file.write('Not a notebook')
+            processing_method_args['job_id'] = 'abcdefghij'
+            status, msg = ssh_processing(processing_method_args)
+            self.assertFalse(status)
+            self.assertIn('could not be processed on 127.0.0.1', msg)
+            self.assertEqual(
+                read_yaml(os.path.join(job_dir, META_FILE))['status'], FAILED)
+        finally:
+            processing_method_args['connection'].close()
+            server.close()
+
+    def testSSHJobSilentFailure(self):
+        class SilentConnection:
+            hostname = 'worker-1.example.com'
+
+            def __init__(self):
+                self.remote_inputs = set()
+                self.commands = []
+
+            def remote_path(self, *paths):
+                return posixpath.join('meow_jobs', *paths)
+
+            def upload(self, files, command=None):
+                return 1, b'', b''
+
+            def execute(self, command, stdin=None):
+                self.commands.append(command)
+                return 0, b'', b''
+
+        job_id = '1234567890'
+        job_dir = os.path.join(JOB_DIR, job_id)
+        make_dir(JOB_DIR)
+        make_dir(OUTPUT_DATA)
+        make_dir(job_dir)
+        write_yaml({'id': job_id, 'status': 'queued'},
+                   os.path.join(job_dir, META_FILE))
+
+        # A remote command failing without any output is still a failure
+        connection = SilentConnection()
+        status, msg = ssh_processing({
+            'job_id': job_id,
+            'job_home': JOB_DIR,
+            'output_data': OUTPUT_DATA,
+            'connection': connection
+        })
+        self.assertFalse(status)
+        self.assertIn('Exit status 1', msg)
+        self.assertEqual(
+            read_yaml(os.path.join(job_dir, META_FILE))['status'], FAILED)
+        self.assertFalse(os.path.exists(os.path.join(OUTPUT_DATA, job_id)))
+        self.assertEqual(connection.commands, ['rm -rf meow_jobs/%s' % job_id])
+
+    @pytest.mark.timeout(30)
+    def testJobAssignment(self):
+        admin_to_queue_reader, admin_to_queue_writer = Pipe(duplex=False)
+        queue_to_admin_reader, queue_to_admin_writer = Pipe(duplex=False)
+        queue_to_logger_reader, queue_to_logger_writer = Pipe(duplex=False)
+
+        make_dir(JOB_DIR)
+        make_dir(OUTPUT_DATA)
+        job_id = '1234567890'
+        job_dir = os.path.join(JOB_DIR, job_id)
+        make_dir(job_dir)
+
         params = {
             'extra': 'Appended by pAppend',
             'infile': 'testing_directory/start/data.txt',
@@ -1056,8 +2276,7 @@ class WorkflowTest(unittest.TestCase):
         job_queue_process.start()
         self.assertTrue(job_queue_process.is_alive())
 
-        module_list = [p.project_name for p in pkg_resources.working_set]
-        worker_to_queue_writer.send(module_list)
+        worker_to_queue_writer.send(get_environment_fingerprint())
 
         admin_to_queue_writer.send('get_queue')
         msg = queue_to_admin_reader.recv()
@@ -1103,6 +2322,41 @@ class WorkflowTest(unittest.TestCase):
             "requirement from %s." % (job_id, job['requirements'])
         )
 
+        # Versions are checked against those installed
+        for versioned_id, dependencies in [
+                ('1234567891', ['watchdog>=0.1', 'PyYAML']),
+                ('1234567892', ['watchdog<=0.1'])]:
+            versioned_dir = os.path.join(JOB_DIR, versioned_id)
+            make_dir(versioned_dir)
+            versioned_job = copy.deepcopy(job)
+            versioned_job['id'] = versioned_id
+            versioned_job['requirements']['dependencies'] = dependencies
+            write_yaml(versioned_job, os.path.join(versioned_dir, 'job.yml'))
+            admin_to_queue_writer.send(versioned_id)
+
+        worker_to_queue_writer.send('request')
+        msg = queue_to_worker_reader.recv()
+        self.assertEqual(msg, '1234567891')
+        msg = queue_to_logger_reader.recv()
+        check_logger_input(
+            self,
+            msg,
+            'job_queue.queue request',
+            "Could not assign job %s to worker 0 as missing one or more "
+            "requirement from %s." % (job_id, job['requirements'])
+        )
+        msg = queue_to_logger_reader.recv()
+        check_logger_input(
+            self,
+            msg,
+            'job_queue.queue request',
+            'Assigning job 1234567891'
+        )
+
+        worker_to_queue_writer.send('request')
+        msg = queue_to_worker_reader.recv()
+        self.assertEqual(msg, None)
+
         admin_to_queue_writer.send('kill')
         msg = queue_to_admin_reader.recv()
         self.assertEqual(msg, 'dead')
@@ -1110,6 +2364,59 @@ class WorkflowTest(unittest.TestCase):
         job_queue_process.join()
         self.assertFalse(job_queue_process.is_alive())
 
+    def testEnvironmentFingerprint(self):
+        cache_file = os.path.join(TESTING_VGRID, 'environment.json')
+        make_dir(TESTING_VGRID)
+
+        packages = scan_environment()
+        self.assertIn('watchdog', packages)
+        self.assertIn('pyyaml', packages)
+
+        fingerprint = get_environment_fingerprint(cache_file=cache_file)
+        self.assertEqual(fingerprint, packages)
+
+        # Found only once per process
+        self.assertIs(
+            get_environment_fingerprint(cache_file=cache_file), fingerprint)
+
+        # Other processes read the cache, unless the environment has changed
+        with open(cache_file, 'r') as input_file:
+            cached = json.load(input_file)
+        self.assertEqual(cached['packages'], packages)
+        self.assertEqual(cached['key'], get_cache_key())
+        with open(cache_file, 'r') as input_file:
+            self.assertTrue(is_trusted_file(input_file.fileno()))
+
+        # A cache that other users could have written is not trusted
+        os.chmod(cache_file, 0o666)
+        with open(cache_file, 'r') as input_file:
+            self.assertFalse(is_trusted_file(input_file.fileno()))
+
+        fingerprint = {
+            'numpy': '1.21.0',
+            'pyyaml': '6.0',
+            'mig-meow': '0.37'
+        }
+        self.assertTrue(is_requirement_met('numpy', fingerprint))
+        self.assertTrue(is_requirement_met('NumPy', fingerprint))
+        self.assertTrue(is_requirement_met('mig_meow', fingerprint))
+        self.assertTrue(is_requirement_met('numpy==1.21', fingerprint))
+        self.assertTrue(is_requirement_met('numpy>=1.18', fingerprint))
+        self.assertTrue(is_requirement_met('numpy<=1.21.0', fingerprint))
+        self.assertFalse(is_requirement_met('numpy==1.2', fingerprint))
+        self.assertFalse(is_requirement_met('numpy>=1.22', fingerprint))
+        self.assertFalse(is_requirement_met('numpy<=1.9', fingerprint))
+        self.assertFalse(is_requirement_met('scipy', fingerprint))
+
+        matcher = RequirementMatcher(fingerprint)
+        self.assertEqual(matcher.missing(['numpy', 'pyyaml>=5']), set())
+        self.assertEqual(
+            matcher.missing(['numpy', 'scipy', 'pyyaml<=5']),
+            {'scipy', 'pyyaml<=5'}
+        )
+        self.assertEqual(matcher.met, {'numpy', 'pyyaml>=5'})
+        self.assertEqual(matcher.unmet, {'scipy', 'pyyaml<=5'})
+
     @pytest.mark.timeout(30)
     def testJobLifetime(self):
         make_dir(TESTING_VGRID)
@@ -1290,13 +2597,6 @@ Appended by pAppend"""
         timer.join()
         self.assertFalse(timer.is_alive())
 
-        admin_to_queue_writer.send('kill')
-        msg = queue_to_admin_reader.recv()
-        self.assertEqual(msg, 'dead')
-
-        job_queue_process.join()
-        self.assertFalse(job_queue_process.is_alive())
-
         file_monitor_process.stop()
         file_monitor_process.join()
         self.assertFalse(file_monitor_process.is_alive())
@@ -1305,6 +2605,7 @@ Appended by pAppend"""
         state_monitor_process.join()
         self.assertFalse(state_monitor_process.is_alive())
 
+        # The administrator also reads from the queue, so is stopped first
         user_to_admin_writer.send(('kill', None))
         msg = admin_to_user_reader.recv()
         self.assertEqual(msg, 'dead')
@@ -1312,6 +2613,13 @@ Appended by pAppend"""
         administrator_process.join()
         self.assertFalse(administrator_process.is_alive())
 
+        admin_to_queue_writer.send('kill')
+        msg = queue_to_admin_reader.recv()
+        self.assertEqual(msg, 'dead')
+
+        job_queue_process.join()
+        self.assertFalse(job_queue_process.is_alive())
+
     ###############################################################################
 
     def testWorkflowRunnerCreation(self):
@@ -1337,6 +2645,47 @@ Appended by pAppend"""
         self.assertTrue(os.path.exists(TESTING_VGRID))
         self.assertTrue(os.path.isdir(TESTING_VGRID))
 
+    def testWorkflowRunnerBatchedRequests(self):
+        runner = WorkflowRunner(
+            TESTING_VGRID,
+            0,
+            daemon=True,
+            retro_active_jobs=False,
+            print_logging=False
+        )
+
+        results = runner.batch([
+            'check_patterns',
+            'check_recipes',
+            ('check_running_status', None)
+        ])
+        self.assertEqual(
+            results,
+            [{}, {}, (True, 'All workers are running. ')]
+        )
+
+        stats = runner.get_stats()
+        self.assertEqual(stats['total'], 0)
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['patterns'], {})
+
+        self.assertEqual(runner.get_jobs(), [])
+        self.assertEqual(runner.get_jobs(status='done', pattern='any'), [])
+
+        with self.assertRaises(ValueError):
+            runner.get_jobs(status='not_a_status')
+
+        with self.assertRaises(ValueError):
+            runner.batch(['not_an_operation'])
+
+        with self.assertRaises(ValueError):
+            runner.batch(['stop_runner'])
+
+        with self.assertRaises(TypeError):
+            runner.batch([1])
+
+        self.assertTrue(runner.stop_runner(clear_jobs=True))
+
     def testWorkflowRunnerPatternImports(self):
         data = read_dir(directory='examples/meow_directory')
         patterns = data[PATTERNS]
@@ -1781,6 +3130,401 @@ Appended by pAppend"""
 
         self.assertTrue(runner.stop_runner(clear_jobs=True))
 
+    def testSweepChunking(self):
+        data = read_dir(directory='examples/meow_directory')
+
+        pattern = copy.deepcopy(data[PATTERNS]['adder'])
+        pattern.sweep = {}
+        pattern.add_param_sweep(
+            'sweep', {SWEEP_START: 0, SWEEP_STOP: 9, SWEEP_JUMP: 1})
+        pattern.set_chunk_size(4)
+        with self.assertRaises(ValueError):
+            pattern.set_chunk_size(0)
+
+        # Test that the chunk size is kept when exported
+        exported = patten_to_yaml_dict(pattern)
+        self.assertEqual(exported[CHUNK_SIZE], 4)
+        self.assertEqual(pattern_from_yaml_dict(exported, 'adder'), pattern)
+
+        # Chunked patterns are refused by the MiG, before anything is sent
+        with self.assertRaises(ValueError):
+            write_vgrid_pattern(pattern, 'test_vgrid')
+
+        data_directory = os.path.join(TESTING_VGRID, 'initial_data')
+        make_dir(TESTING_VGRID)
+        make_dir(data_directory)
+        np.save(
+            os.path.join(data_directory, 'datafile.npy'),
+            np.random.randint(100, size=(5, 5))
+        )
+
+        runner = WorkflowRunner(
+            TESTING_VGRID,
+            0,
+            patterns={pattern.name: pattern},
+            recipes={'add': data[RECIPES]['add']},
+            daemon=True,
+            reuse_vgrid=True,
+            retro_active_jobs=True,
+            print_logging=False
+        )
+
+        try:
+            # Test that the sweep is split into three jobs, not ten
+            jobs = []
+            for _ in range(20):
+                time.sleep(0.5)
+                jobs = runner.check_jobs()
+                if len(jobs) == 3:
+                    break
+            self.assertEqual(len(jobs), 3)
+
+            chunks = sorted(
+                read_yaml(os.path.join(JOB_DIR, job_id, PARAMS_FILE))['sweep']
+                for job_id in jobs
+            )
+            self.assertEqual(chunks, [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        finally:
+            self.assertTrue(runner.stop_runner(clear_jobs=True))
+
+    @unittest.skipUnless(is_inotify_available(), 'inotify not available')
+    def testInotifyEventSource(self):
+        data = read_dir(directory='examples/meow_directory')
+
+        patterns = {
+            data[PATTERNS]['adder'].name: data[PATTERNS]['adder'],
+            data[PATTERNS]['first_mult'].name: data[PATTERNS]['first_mult'],
+            data[PATTERNS]['second_mult'].name: data[PATTERNS]['second_mult'],
+            data[PATTERNS]['third_choo'].name: data[PATTERNS]['third_choo']
+        }
+        recipes = {
+            data[RECIPES]['add'][NAME]: data[RECIPES]['add'],
+            data[RECIPES]['mult'][NAME]: data[RECIPES]['mult'],
+            data[RECIPES]['choo'][NAME]: data[RECIPES]['choo']
+        }
+
+        with self.assertRaises(ValueError):
+            WorkflowRunner(
+                TESTING_VGRID,
+                0,
+                daemon=True,
+                print_logging=False,
+                event_source='unknown'
+            )
+
+        runner = WorkflowRunner(
+            TESTING_VGRID,
+            0,
+            patterns=patterns,
+            recipes=recipes,
+            daemon=True,
+            reuse_vgrid=True,
+            retro_active_jobs=False,
+            print_logging=False,
+            event_source='inotify'
+        )
+
+        # Small pause here as we need to allow daemon processes to work
+        time.sleep(3)
+
+        self.assertEqual(len(runner.check_rules()), 4)
+        self.assertEqual(len(runner.check_jobs()), 0)
+
+        data_directory = os.path.join(TESTING_VGRID, 'initial_data')
+        make_dir(data_directory)
+        time.sleep(1)
+        data = np.random.randint(100, size=(5, 5))
+        np.save(os.path.join(data_directory, 'datafile.npy'), data)
+
+        # Small pause here as we need to allow daemon processes to work
+        time.sleep(3)
+
+        self.assertEqual(len(runner.check_jobs()), 4)
+
+        self.assertTrue(runner.stop_runner(clear_jobs=True))
+
+    def testRingBuffer(self):
+        messages = [
+            'AbCdEfGhIjKlMnOpQrSt',
+            ('run_handler', 'Starting new job'),
+            (JOB_TRANSITION, 'AbCdEfGhIjKlMnOpQrSt', RUNNING),
+            (JOB_TRANSITION, 'AbCdEfGhIjKlMnOpQrSt', FAILED, 'error'),
+            ('modified', 'initial_data/datafile.npy', ['rule_1', 'rule_2']),
+            ('created', 'initial_data/datafile.npy', []),
+            # Paths that are not valid UTF-8, as decoded by os functions
+            'bad\udcff.txt',
+            ('run_handler', "Event at 'bad\udcff.txt' sent to admin."),
+            (JOB_TRANSITION, 'AbCdEfGhIjKlMnOpQrSt', FAILED, 'bad\udcff.txt'),
+            ('created', 'initial_data/bad\udcff.txt', ['rule_1']),
+            ('created', 'initial_data/\udcc3\udca9.txt', ['rule_1']),
+            {'not': 'a hot message'},
+            None
+        ]
+        for message in messages:
+            self.assertEqual(decode_message(encode_message(message)), message)
+        self.assertEqual(encode_message('bad\udcff.txt')[0], RECORD_STR)
+        self.assertEqual(
+            encode_message({'not': 'a hot message'})[0], RECORD_PICKLE)
+
+        reader, writer = RingPipe(MINIMUM_RING_CAPACITY)
+        pipe_reader, pipe_writer = Pipe(duplex=False)
+        try:
+            self.assertFalse(reader.poll())
+            self.assertEqual(wait([reader, pipe_reader], timeout=0.1), [])
+
+            pipe_writer.send('pipe')
+            self.assertEqual(wait([reader, pipe_reader]), [pipe_reader])
+            self.assertEqual(pipe_reader.recv(), 'pipe')
+
+            # Larger than the ring, so must be sent in fragments while the
+            # reader is receiving
+            long_message = 'x' * (MINIMUM_RING_CAPACITY * 5)
+            count = 1000
+            producer = Process(
+                target=ring_producer,
+                args=(writer, messages + [long_message], count)
+            )
+            producer.start()
+            received = []
+            while len(received) < count * (len(messages) + 1):
+                ready = wait([reader, pipe_reader], timeout=10)
+                self.assertEqual(ready, [reader])
+                received.append(reader.recv())
+            producer.join()
+            self.assertEqual(received, (messages + [long_message]) * count)
+            self.assertFalse(reader.poll())
+        finally:
+            reader.ring.close()
+            reader.ring.unlink()
+
+    def testSharedMemoryTransport(self):
+        data = read_dir(directory='examples/meow_directory')
+
+        patterns = {
+            data[PATTERNS]['adder'].name: data[PATTERNS]['adder'],
+            data[PATTERNS]['first_mult'].name: data[PATTERNS]['first_mult'],
+            data[PATTERNS]['second_mult'].name: data[PATTERNS]['second_mult'],
+            data[PATTERNS]['third_choo'].name: data[PATTERNS]['third_choo']
+        }
+        recipes = {
+            data[RECIPES]['add'][NAME]: data[RECIPES]['add'],
+            data[RECIPES]['mult'][NAME]: data[RECIPES]['mult'],
+            data[RECIPES]['choo'][NAME]: data[RECIPES]['choo']
+        }
+
+        with self.assertRaises(ValueError):
+            WorkflowRunner(
+                TESTING_VGRID,
+                0,
+                daemon=True,
+                print_logging=False,
+                transport='unknown'
+            )
+
+        runner = WorkflowRunner(
+            TESTING_VGRID,
+            0,
+            patterns=patterns,
+            recipes=recipes,
+            daemon=True,
+            reuse_vgrid=True,
+            retro_active_jobs=False,
+            print_logging=False,
+            transport='shared_memory'
+        )
+
+        # Small pause here as we need to allow daemon processes to work
+        time.sleep(3)
+
+        self.assertEqual(len(runner.check_rules()), 4)
+        self.assertEqual(len(runner.check_jobs()), 0)
+
+        data_directory = os.path.join(TESTING_VGRID, 'initial_data')
+        make_dir(data_directory)
+        time.sleep(1)
+        data = np.random.randint(100, size=(5, 5))
+        np.save(os.path.join(data_directory, 'datafile.npy'), data)
+
+        # Small pause here as we need to allow daemon processes to work
+        time.sleep(3)
+
+        self.assertEqual(len(runner.check_jobs()), 4)
+
+        self.assertTrue(runner.stop_runner(clear_jobs=True))
+        self.assertEqual(runner.rings, [])
+
+    def testAsyncWorkflowRunner(self):
+        data = read_dir(directory='examples/meow_directory')
+
+        patterns = {
+            data[PATTERNS]['adder'].name: data[PATTERNS]['adder'],
+            data[PATTERNS]['first_mult'].name: data[PATTERNS]['first_mult'],
+            data[PATTERNS]['second_mult'].name: data[PATTERNS]['second_mult'],
+            data[PATTERNS]['third_choo'].name: data[PATTERNS]['third_choo']
+        }
+        recipes = {
+            data[RECIPES]['add'][NAME]: data[RECIPES]['add'],
+            data[RECIPES]['mult'][NAME]: data[RECIPES]['mult'],
+            data[RECIPES]['choo'][NAME]: data[RECIPES]['choo']
+        }
+
+        with self.assertRaises(ValueError):
+            AsyncWorkflowRunner(
+                TESTING_VGRID,
+                0,
+                daemon=True,
+                print_logging=False,
+                trigger_mode='unknown'
+            )
+
+        start = time.time()
+        runner = AsyncWorkflowRunner(
+            TESTING_VGRID,
+            0,
+            patterns=patterns,
+            recipes=recipes,
+            daemon=True,
+            reuse_vgrid=True,
+            retro_active_jobs=False,
+            print_logging=False
+        )
+        self.assertLess(time.time() - start, 1)
+
+        # Initial patterns and recipes are in place without waiting on the
+        # state monitor
+        self.assertEqual(len(runner.check_patterns()), 4)
+        self.assertEqual(len(runner.check_recipes()), 3)
+        self.assertEqual(len(runner.check_rules()), 4)
+        self.assertEqual(runner.get_running_status(), (0, 0))
+
+        # Results are copies, as they would be from a WorkflowRunner
+        runner.check_rules().pop()
+        self.assertEqual(len(runner.check_rules()), 4)
+
+        self.assertTrue(runner.remove_pattern('third_choo'))
+        time.sleep(1)
+        self.assertEqual(len(runner.check_rules()), 3)
+
+        data_directory = os.path.join(TESTING_VGRID, 'initial_data')
+        make_dir(data_directory)
+        data = np.random.randint(100, size=(5, 5))
+        np.save(os.path.join(data_directory, 'datafile.npy'), data)
+        time.sleep(1)
+
+        # Without workers, every job stays queued
+        jobs = runner.check_jobs()
+        self.assertGreater(len(jobs), 0)
+        self.assertEqual(runner.check_queue(), jobs)
+        stats, running_status = \
+            runner.batch(['get_stats', 'check_running_status'])
+        self.assertEqual(stats['total'], len(jobs))
+        self.assertEqual(stats[QUEUED], len(jobs))
+        self.assertEqual(running_status, (True, 'All workers are running. '))
+
+        self.assertTrue(runner.stop_runner(clear_jobs=True))
+        self.assertFalse(runner.loop_thread.is_alive())
+
+    def testAsyncWorkflowRunnerJobs(self):
+        data = read_dir(directory='examples/meow_directory')
+
+        runner = AsyncWorkflowRunner(
+            TESTING_VGRID,
+            2,
+            patterns={'adder': data[PATTERNS]['adder']},
+            recipes={'add': data[RECIPES]['add']},
+            daemon=True,
+            reuse_vgrid=True,
+            print_logging=False
+        )
+
+        data_directory = os.path.join(TESTING_VGRID, 'initial_data')
+        make_dir(data_directory)
+        data = np.random.randint(100, size=(5, 5))
+        np.save(os.path.join(data_directory, 'datafile.npy'), data)
+
+        # Workers are woken as soon as jobs are queued, so there is no
+        # wait_time to wait through
+        stats = {}
+        for _ in range(60):
+            time.sleep(1)
+            stats = runner.get_stats()
+            if stats['total'] and stats[DONE] == stats['total']:
+                break
+        self.assertGreater(stats['total'], 0)
+        self.assertEqual(stats[DONE], stats['total'])
+        self.assertEqual(runner.check_queue(), [])
+        self.assertEqual(runner.get_running_status(), (2, 2))
+
+        self.assertTrue(runner.stop_runner(clear_jobs=True))
+
+    def testWorkflowRunnerFastStart(self):
+        data = read_dir(directory='examples/meow_directory')
+
+        patterns = {
+            data[PATTERNS]['adder'].name: data[PATTERNS]['adder'],
+            data[PATTERNS]['first_mult'].name: data[PATTERNS]['first_mult'],
+            data[PATTERNS]['second_mult'].name: data[PATTERNS]['second_mult'],
+            data[PATTERNS]['third_choo'].name: data[PATTERNS]['third_choo']
+        }
+        recipes = {
+            data[RECIPES]['add'][NAME]: data[RECIPES]['add'],
+            data[RECIPES]['mult'][NAME]: data[RECIPES]['mult'],
+            data[RECIPES]['choo'][NAME]: data[RECIPES]['choo']
+        }
+
+        with self.assertRaises(TypeError):
+            WorkflowRunner(
+                TESTING_VGRID,
+                1,
+                daemon=True,
+                print_logging=False,
+                fast_start='yes'
+            )
+
+        runner = WorkflowRunner(
+            TESTING_VGRID,
+            2,
+            patterns=patterns,
+            recipes=recipes,
+            daemon=True,
+            reuse_vgrid=True,
+            print_logging=False,
+            wait_time=1,
+            fast_start=True
+        )
+
+        # The administrator is given the initial state directly, so it is
+        # available without waiting on the state monitor
+        self.assertEqual(len(runner.check_patterns()), 4)
+        self.assertEqual(len(runner.check_recipes()), 3)
+        self.assertEqual(len(runner.check_rules()), 4)
+
+        # Workers keep their own time, so no timers are needed
+        self.assertEqual(runner.timer_processes, [])
+        self.assertEqual(len(runner.process_list), 4)
+
+        data_directory = os.path.join(TESTING_VGRID, 'initial_data')
+        make_dir(data_directory)
+        data = np.random.randint(100, size=(5, 5))
+        np.save(os.path.join(data_directory, 'datafile.npy'), data)
+
+        stats = {}
+        for _ in range(60):
+            time.sleep(1)
+            stats = runner.get_stats()
+            if stats['total'] and stats[DONE] == stats['total']:
+                break
+        self.assertGreater(stats['total'], 0)
+        self.assertEqual(stats[DONE], stats['total'])
+
+        # All processes are asked to stop together, and do so gracefully
+        start = time.time()
+        self.assertTrue(runner.stop_runner(clear_jobs=True))
+        self.assertLess(time.time() - start, STOP_TIMEOUT)
+        for process in runner.process_list:
+            self.assertFalse(process.is_alive())
+            self.assertEqual(process.exitcode, 0)
+
     def testAddPatternFunction(self):
         runner = WorkflowRunner(
             TESTING_VGRID,
@@ -1854,6 +3598,216 @@ Appended by pAppend"""
 
         self.assertTrue(runner.stop_runner(clear_jobs=True))
 
+    def testModifyPatternRules(self):
+        data = read_dir(directory='examples/meow_directory')
+        pattern = data[PATTERNS]['adder']
+        make_dir(TESTING_VGRID)
+        for directory in ['initial_data', 'other_data']:
+            make_dir(os.path.join(TESTING_VGRID, directory))
+            np.save(
+                os.path.join(TESTING_VGRID, directory, 'datafile.npy'),
+                np.random.randint(100, size=(5, 5))
+            )
+
+        runner = WorkflowRunner(
+            TESTING_VGRID,
+            0,
+            patterns={'adder': pattern},
+            recipes={'add': data[RECIPES]['add']},
+            daemon=True,
+            reuse_vgrid=True,
+            print_logging=False,
+            fast_start=True
+        )
+
+        def modify_and_wait(modified):
+            runner.modify_pattern(modified)
+            for _ in range(50):
+                if runner.check_patterns()['adder'] == modified:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(runner.check_patterns()['adder'], modified)
+            # Allow time for any retroactive scan
+            time.sleep(1)
+            return {rule[RULE_PATH]: rule[RULE_ID]
+                    for rule in runner.check_rules()}
+
+        try:
+            for _ in range(50):
+                if runner.check_jobs():
+                    break
+                time.sleep(0.1)
+            time.sleep(1)
+            rules = {rule[RULE_PATH]: rule[RULE_ID]
+                     for rule in runner.check_rules()}
+            jobs = len(runner.check_jobs())
+            self.assertEqual(list(rules), ['initial_data/*'])
+            self.assertGreater(jobs, 0)
+
+            # Rules are kept, and not scanned for again, if the trigger
+            # paths are unchanged
+            modified = copy.deepcopy(pattern)
+            modified.add_variable('extra_variable', 1)
+            self.assertEqual(modify_and_wait(modified), rules)
+            self.assertEqual(len(runner.check_jobs()), jobs)
+
+            # Only new trigger paths are scanned for
+            modified.trigger_paths = ['initial_data/*', 'other_data/*']
+            updated = modify_and_wait(modified)
+            self.assertEqual(
+                updated['initial_data/*'], rules['initial_data/*'])
+            self.assertIn('other_data/*', updated)
+            self.assertEqual(len(runner.check_jobs()), 2 * jobs)
+
+            modified.trigger_paths = ['other_data/*']
+            self.assertEqual(
+                modify_and_wait(modified),
+                {'other_data/*': updated['other_data/*']}
+            )
+            self.assertEqual(len(runner.check_jobs()), 2 * jobs)
+        finally:
+            self.assertTrue(runner.stop_runner(clear_jobs=True))
+
+    def testAdministratorMonitorUpdates(self):
+        data = read_dir(directory='examples/meow_directory')
+        recipe = data[RECIPES]['add']
+        make_dir(TESTING_VGRID)
+        make_dir(JOB_DIR)
+
+        to_queue_reader, to_queue_writer = Pipe(duplex=False)
+        from_queue_reader, from_queue_writer = Pipe(duplex=False)
+        to_logger_reader, to_logger_writer = Pipe(duplex=False)
+        scan_reader, scan_writer = Pipe(duplex=False)
+        to_monitor_reader, to_monitor_writer = Pipe(duplex=False)
+
+        roles = administrator_roles(
+            to_queue_writer, from_queue_reader, [], [], to_logger_writer,
+            scan_writer, TESTING_VGRID, JOB_DIR, RUNNER_DATA, False, False,
+            to_monitor=to_monitor_writer
+        )
+        try:
+            for i in range(5):
+                pattern = Pattern('pattern_%s' % i)
+                pattern.add_single_input('input', 'data_%s/*' % i)
+                pattern.add_recipe(recipe[NAME])
+                roles.handle_state_message(
+                    {'operation': OP_CREATE, 'pattern': pattern})
+            # Without the recipe, no rules are made
+            self.assertFalse(to_monitor_reader.poll(0))
+
+            # The monitor is sent the rules once, however many are made
+            roles.handle_state_message(
+                {'operation': OP_CREATE, 'recipe': recipe})
+            self.assertEqual(len(to_monitor_reader.recv()), 5)
+            self.assertFalse(to_monitor_reader.poll(0))
+
+            roles.handle_state_message(
+                {'operation': OP_DELETED, 'recipe': recipe[NAME]})
+            self.assertEqual(to_monitor_reader.recv(), [])
+            self.assertFalse(to_monitor_reader.poll(0))
+        finally:
+            self.assertEqual(roles.handle_user_message(('kill', None)), 'dead')
+
+    def testSkipUnchangedInputs(self):
+        data = read_dir(directory='examples/meow_directory')
+        pattern = data[PATTERNS]['adder']
+        recipe = data[RECIPES]['add']
+        make_dir(TESTING_VGRID)
+        make_dir(os.path.join(TESTING_VGRID, 'initial_data'))
+        make_dir(OUTPUT_DATA)
+
+        # The input was processed before, and has not changed since
+        rule_key = get_rule_key(pattern, recipe, 'initial_data/*')
+        index = InputIndex(path=os.path.join(OUTPUT_DATA, INPUT_INDEX_FILE))
+        input_path = os.path.join(TESTING_VGRID, 'initial_data', 'input.npy')
+        np.save(input_path, np.random.randint(100, size=(5, 5)))
+        index.record(
+            rule_key,
+            os.path.join('initial_data', 'input.npy'),
+            index.get_state(input_path)
+        )
+
+        runner = WorkflowRunner(
+            TESTING_VGRID,
+            0,
+            patterns={'adder': pattern},
+            recipes={'add': recipe},
+            daemon=True,
+            reuse_vgrid=True,
+            print_logging=False,
+            skip_unchanged_inputs=True
+        )
+        try:
+            time.sleep(3)
+            self.assertEqual(runner.check_jobs(), [])
+
+            # Once modified it is processed again, with one job for each
+            # value in the pattern's parameter sweep
+            np.save(input_path, np.random.randint(100, size=(5, 5)))
+            for _ in range(50):
+                if len(runner.check_jobs()) == 3:
+                    break
+                time.sleep(0.1)
+            time.sleep(1)
+            self.assertEqual(len(runner.check_jobs()), 3)
+        finally:
+            self.assertTrue(runner.stop_runner(clear_jobs=True))
+
+    def testSkipUnchangedHashedInputs(self):
+        data = read_dir(directory='examples/meow_directory')
+        pattern = data[PATTERNS]['adder']
+        recipe = data[RECIPES]['add']
+        make_dir(TESTING_VGRID)
+        make_dir(os.path.join(TESTING_VGRID, 'initial_data'))
+        make_dir(OUTPUT_DATA)
+
+        # Both inputs were processed before, but have since been touched.
+        # Only the one whose contents have also changed is processed again.
+        rule_key = get_rule_key(pattern, recipe, 'initial_data/*')
+        index = InputIndex(
+            path=os.path.join(OUTPUT_DATA, INPUT_INDEX_FILE),
+            hash_inputs=True
+        )
+        for name in ['unchanged.npy', 'changed.npy']:
+            input_path = os.path.join(TESTING_VGRID, 'initial_data', name)
+            np.save(input_path, np.random.randint(100, size=(5, 5)))
+            size, _, content_hash = index.get_state(input_path)
+            if name == 'changed.npy':
+                content_hash = 'not the contents'
+            index.record(
+                rule_key, os.path.join('initial_data', name),
+                (size, 0, content_hash)
+            )
+
+        runner = WorkflowRunner(
+            TESTING_VGRID,
+            0,
+            patterns={'adder': pattern},
+            recipes={'add': recipe},
+            daemon=True,
+            reuse_vgrid=True,
+            print_logging=False,
+            skip_unchanged_inputs=True,
+            hash_inputs=True
+        )
+        try:
+            for _ in range(50):
+                if runner.check_jobs():
+                    break
+                time.sleep(0.1)
+            time.sleep(1)
+            # One job for each value in the pattern's parameter sweep
+            jobs = runner.check_jobs()
+            self.assertEqual(len(jobs), 3)
+            for job_id in jobs:
+                self.assertEqual(
+                    read_yaml(
+                        os.path.join(JOB_DIR, job_id, META_FILE))['path'],
+                    os.path.join('initial_data', 'changed.npy')
+                )
+        finally:
+            self.assertTrue(runner.stop_runner(clear_jobs=True))
+
     def testRemovePatternFunction(self):
         data = read_dir(directory='examples/meow_directory')
         patterns = data[PATTERNS]
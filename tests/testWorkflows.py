@@ -2,6 +2,8 @@ import unittest
 import copy
 import nbformat
 import os
+import subprocess
+import sys
 
 from mig_meow.constants import NO_OUTPUT_SET_WARNING, MEOW_MODE, CWL_MODE, \
     DEFAULT_WORKFLOW_TITLE, DEFAULT_CWL_IMPORT_EXPORT_DIR, PATTERNS, RECIPES, \
@@ -21,13 +23,16 @@ from mig_meow.constants import NO_OUTPUT_SET_WARNING, MEOW_MODE, CWL_MODE, \
 from mig_meow.cwl import check_workflows_dict, check_steps_dict, \
     check_settings_dict
 from mig_meow.fileio import write_dir_pattern, write_dir_recipe, \
-    read_dir_pattern, read_dir_recipe, rmtree
+    read_dir_pattern, read_dir_recipe, rmtree, read_dir, load_dir, \
+    LoadCache, LOAD_ERRORS, PARALLEL_LOAD_THRESHOLD
 from mig_meow.validation import is_valid_recipe_dict, is_valid_pattern_dict, \
     is_valid_workflow_dict, is_valid_step_dict, is_valid_setting_dict, \
-    is_valid_environments_dict
+    is_valid_environments_dict, find_invalid_char, valid_pattern_name, \
+    PATH_CHARS
 from mig_meow.meow import Pattern, check_patterns_dict, \
     build_workflow_object, create_recipe_dict, check_recipes_dict, \
-    parameter_sweep_entry, get_parameter_sweep_values, register_recipe
+    parameter_sweep_entry, get_parameter_sweep_values, register_recipe, \
+    ParameterSweep
 from mig_meow.workflow_widget import WorkflowWidget, NAME_KEY, VALUE_KEY, \
     SWEEP_START_KEY, SWEEP_STOP_KEY, SWEEP_JUMP_KEY
 
@@ -1003,6 +1008,111 @@ class WorkflowTest(unittest.TestCase):
         # Test that second and third patterns are not equal
         self.assertFalse(test_pattern_2 == test_pattern_3)
 
+    def testPatternHashing(self):
+        test_pattern_1 = Pattern('hashed_pattern')
+        test_pattern_1.add_single_input('trigger_file_name', 'dir/regex.path')
+        test_pattern_1.add_recipe('recipe')
+        test_pattern_1.add_variable('dict', {1: [1, 2], 2: {3}})
+
+        test_pattern_2 = copy.deepcopy(test_pattern_1)
+
+        # Test that patterns have fixed attributes
+        with self.assertRaises(AttributeError):
+            test_pattern_1.not_an_attribute = 1
+
+        # Test that equal patterns have equal hashes
+        self.assertEqual(test_pattern_1, test_pattern_2)
+        self.assertEqual(hash(test_pattern_1), hash(test_pattern_2))
+        self.assertEqual({test_pattern_1, test_pattern_2}, {test_pattern_1})
+
+        # Test that each add method changes the hash
+        hashes = {hash(test_pattern_1)}
+        test_pattern_1.add_output('outfile', 'dir/outpath.txt')
+        hashes.add(hash(test_pattern_1))
+        test_pattern_1.add_recipe('other_recipe')
+        hashes.add(hash(test_pattern_1))
+        test_pattern_1.add_variable('int', 0)
+        hashes.add(hash(test_pattern_1))
+        test_pattern_1.add_param_sweep(
+            'sweep', {'start': 0, 'stop': 1, 'increment': 1})
+        hashes.add(hash(test_pattern_1))
+        test_pattern_1.persistence_id = '12345678910'
+        hashes.add(hash(test_pattern_1))
+        self.assertEqual(len(hashes), 6)
+        self.assertNotEqual(test_pattern_1, test_pattern_2)
+
+        # Test that patterns made equal again have equal hashes
+        del test_pattern_1.persistence_id
+        test_pattern_2.add_output('outfile', 'dir/outpath.txt')
+        test_pattern_2.add_recipe('other_recipe')
+        test_pattern_2.add_variable('int', 0)
+        test_pattern_2.add_param_sweep(
+            'sweep', {'start': 0, 'stop': 1, 'increment': 1})
+        self.assertEqual(test_pattern_1, test_pattern_2)
+        self.assertEqual(hash(test_pattern_1), hash(test_pattern_2))
+
+        # Test that a persistence_id of None is not the same as none at all
+        test_pattern_1.persistence_id = None
+        self.assertNotEqual(test_pattern_1, test_pattern_2)
+        self.assertEqual(len({test_pattern_1, test_pattern_2}), 2)
+        del test_pattern_1.persistence_id
+
+        # Test that changes made in place are still seen by comparisons
+        test_pattern_1.variables['in_place'] = 1
+        self.assertNotEqual(test_pattern_1, test_pattern_2)
+        self.assertEqual(test_pattern_1, copy.deepcopy(test_pattern_1))
+        test_pattern_2.variables['in_place'] = 1
+        self.assertEqual(test_pattern_1, test_pattern_2)
+
+        # Test that equal unhashable values give equal hashes, even where
+        # their reprs differ
+        class Unhashable:
+            def __eq__(self, other):
+                return isinstance(other, Unhashable)
+        test_pattern_1.variables['unhashable'] = Unhashable()
+        test_pattern_2.variables['unhashable'] = Unhashable()
+        test_pattern_1.variables = test_pattern_1.variables
+        test_pattern_2.variables = test_pattern_2.variables
+        self.assertEqual(test_pattern_1, test_pattern_2)
+        self.assertEqual(hash(test_pattern_1), hash(test_pattern_2))
+
+    def testValidationCaches(self):
+        # Test that invalid characters are found, including when cached
+        for _ in range(2):
+            self.assertIsNone(find_invalid_char('dir/file.txt', PATH_CHARS))
+            self.assertEqual(find_invalid_char('dir/fi*le?', PATH_CHARS), '*')
+            with self.assertRaises(ValueError):
+                valid_pattern_name('invalid name')
+            valid_pattern_name('valid_name')
+
+        # Test that integrity checks see any change to a pattern
+        test_pattern = Pattern('cached_pattern')
+        test_pattern.add_single_input('trigger_file_name', 'dir/regex.path')
+        valid, msg = test_pattern.integrity_check()
+        self.assertFalse(valid)
+        self.assertEqual(msg, NO_RECIPES_SET_ERROR)
+
+        test_pattern.add_recipe('recipe')
+        valid, msg = test_pattern.integrity_check()
+        self.assertTrue(valid)
+
+        test_pattern.recipes.clear()
+        valid, msg = test_pattern.integrity_check()
+        self.assertFalse(valid)
+        self.assertEqual(msg, NO_RECIPES_SET_ERROR)
+        test_pattern.add_recipe('recipe')
+
+        test_pattern.trigger_paths = []
+        valid, msg = test_pattern.integrity_check()
+        self.assertFalse(valid)
+        self.assertEqual(msg, NO_INPUT_PATH_SET_ERROR)
+
+        # Test that trusted patterns are written unchecked
+        write_dir_pattern(test_pattern, directory=IMPORT_EXPORT_DIR,
+                          trusted=True)
+        with self.assertRaises(ValueError):
+            write_dir_pattern(test_pattern, directory=IMPORT_EXPORT_DIR)
+
     def testPatternsDictCheck(self):
         # Test that check on patterns dict is acceptable
         pattern_one = Pattern(VALID_PATTERN_DICT)
@@ -3330,6 +3440,57 @@ class WorkflowTest(unittest.TestCase):
 
         self.assertEqual(expected_values, values)
 
+    def testParamSweepValues(self):
+        # Test that float sweeps end exactly on their stop
+        sweep = ParameterSweep(parameter_sweep_entry('test', 0.1, 1.0, 0.1))
+        self.assertEqual(len(sweep), 10)
+        self.assertEqual(sweep[-1], 1.0)
+        self.assertEqual(sweep[0], 0.1)
+
+        sweep = ParameterSweep(parameter_sweep_entry('test', 0.0, 0.3, 0.1))
+        self.assertEqual(len(sweep), 4)
+        self.assertEqual(list(sweep)[-1], 0.3)
+
+        # Test that negative increments count down
+        sweep = ParameterSweep(parameter_sweep_entry('test', 10, 1, -3))
+        self.assertEqual(list(sweep), [10, 7, 4, 1])
+        self.assertEqual(get_parameter_sweep_values(
+            parameter_sweep_entry('test', 10, 1, -3)), [10, 7, 4, 1])
+
+        # Test that values are not made until needed
+        sweep = ParameterSweep(
+            parameter_sweep_entry('test', 0, 10 ** 12, 1))
+        self.assertEqual(len(sweep), 10 ** 12 + 1)
+        self.assertEqual(sweep[123456789], 123456789)
+        self.assertEqual(sweep[-1], 10 ** 12)
+        self.assertEqual(sweep[5:8], [5, 6, 7])
+        with self.assertRaises(IndexError):
+            sweep[10 ** 12 + 1]
+
+        # Test that sweeps can be split into parts
+        sweep = ParameterSweep(parameter_sweep_entry('test', 1, 10, 1))
+        self.assertEqual(
+            list(sweep.ranges(4)),
+            [range(0, 4), range(4, 8), range(8, 10)]
+        )
+        self.assertEqual(
+            list(sweep.chunks(4)),
+            [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10]]
+        )
+        with self.assertRaises(ValueError):
+            list(sweep.ranges(0))
+
+        # Test that the numpy backend gives the same values
+        sweep = ParameterSweep(parameter_sweep_entry('test', 0.0, 1.0, 0.1))
+        self.assertEqual(
+            sweep.values(backend='numpy').tolist(), sweep.values())
+        self.assertEqual(
+            [chunk.tolist() for chunk in sweep.chunks(3, backend='numpy')],
+            list(sweep.chunks(3))
+        )
+        with self.assertRaises(ValueError):
+            sweep.values(backend='unknown')
+
     def testEnvironmentsLocal(self):
         valid_a = {
             'local': {
@@ -3378,6 +3539,20 @@ class WorkflowTest(unittest.TestCase):
 
         self.assertRaises(TypeError, is_valid_environments_dict, invalid_b)
 
+        valid_b = {
+            'local': {
+                'dependencies': [
+                    'watchdog>=0.10',
+                    'numpy==1.21.0',
+                    'pyyaml<=6.0'
+                ]
+            }
+        }
+
+        status, feedback = is_valid_environments_dict(valid_b, strict=True)
+        self.assertTrue(status)
+        self.assertEqual(feedback, '')
+
     def testEnvironmentsMiG(self):
         valid_a = {
             'mig': {
@@ -4228,6 +4403,59 @@ class WorkflowTest(unittest.TestCase):
         self.assertTrue(isinstance(pattern_two_copy, Pattern))
         self.assertEqual(pattern_two, pattern_two_copy)
 
+    def testLoadDir(self):
+        data = read_dir(directory='examples/meow_directory')
+        recipe = data[RECIPES]['add']
+
+        for index in range(PARALLEL_LOAD_THRESHOLD):
+            pattern = Pattern('pattern_%d' % index)
+            pattern.add_single_input('infile', 'path/*')
+            pattern.add_recipe('add')
+            write_dir_pattern(pattern, directory=IMPORT_EXPORT_DIR)
+            if not index:
+                first_pattern = pattern
+        write_dir_recipe(recipe, directory=IMPORT_EXPORT_DIR)
+        broken_path = os.path.join(IMPORT_EXPORT_DIR, PATTERNS, 'broken')
+        with open(broken_path, 'w') as broken_file:
+            broken_file.write('input_paths: not a list')
+
+        # Test that parallel and serial reads give the same result, with
+        # unreadable files reported
+        for workers in [1, 2]:
+            result = load_dir(directory=IMPORT_EXPORT_DIR, workers=workers)
+            self.assertEqual(
+                len(result[PATTERNS]), PARALLEL_LOAD_THRESHOLD)
+            self.assertEqual(result[PATTERNS]['pattern_0'], first_pattern)
+            self.assertEqual(result[RECIPES], {'add': recipe})
+            self.assertEqual(list(result[LOAD_ERRORS]), [broken_path])
+
+        # Test that read_dir still raises on unreadable files
+        for workers in [1, 2]:
+            with self.assertRaises(Exception):
+                read_dir(directory=IMPORT_EXPORT_DIR, workers=workers)
+
+        # Test that unchanged files are taken from the cache
+        cache = LoadCache()
+        load_dir(directory=IMPORT_EXPORT_DIR, cache=cache)
+        self.assertEqual(
+            len(cache.entries), PARALLEL_LOAD_THRESHOLD + 1)
+
+        result = load_dir(directory=IMPORT_EXPORT_DIR, cache=cache)
+        result[RECIPES]['add'][NAME] = 'changed'
+        result = load_dir(directory=IMPORT_EXPORT_DIR, cache=cache)
+        self.assertEqual(result[RECIPES], {'add': recipe})
+
+        # Test that changed and deleted files are read again
+        changed = Pattern('pattern_0')
+        changed.add_single_input('infile', 'other_path/*')
+        changed.add_recipe('add')
+        write_dir_pattern(changed, directory=IMPORT_EXPORT_DIR)
+        os.remove(os.path.join(IMPORT_EXPORT_DIR, PATTERNS, 'pattern_1'))
+        result = load_dir(directory=IMPORT_EXPORT_DIR, cache=cache)
+        self.assertEqual(result[PATTERNS]['pattern_0'], changed)
+        self.assertNotIn('pattern_1', result[PATTERNS])
+        self.assertEqual(len(cache.entries), PARALLEL_LOAD_THRESHOLD)
+
     def testReadWriteLocalRecipe(self):
         self.assertFalse(os.path.exists(IMPORT_EXPORT_DIR))
 
@@ -4471,3 +4699,43 @@ class WorkflowTest(unittest.TestCase):
         self.assertIsInstance(registered_recipe_environments, dict)
         self.assertEqual(registered_recipe_environments, env_recipe_dict)
 
+    def testLazyImports(self):
+        # Importing the package in a fresh interpreter should not import any
+        # of the dependencies only needed by widgets, SSH or MiG connections
+        heavy_modules = [
+            'bqplot',
+            'ipywidgets',
+            'graphviz',
+            'paramiko',
+            'cryptography',
+            'pkg_resources',
+            'requests'
+        ]
+        script = \
+            "import sys\n" \
+            "import mig_meow\n" \
+            "print([m for m in %r if m in sys.modules])\n" \
+            "print(mig_meow.WorkflowWidget.__name__)\n" \
+            "print(mig_meow.workflow_widget.__name__)\n" \
+            "print('ipywidgets' in sys.modules)\n" \
+            "from mig_meow import *\n" \
+            "print(MonitorWidget.__name__, workflow_widget.__name__)\n" \
+            "print(mig_meow.monitor_widget.__name__)\n" % heavy_modules
+
+        result = subprocess.run(
+            [sys.executable, '-c', script],
+            capture_output=True,
+            text=True
+        )
+        self.assertEqual(result.returncode, 0, msg=result.stderr)
+        self.assertEqual(
+            result.stdout.split('\n')[:6],
+            [
+                '[]',
+                'WorkflowWidget',
+                'workflow_widget',
+                'True',
+                'MonitorWidget workflow_widget',
+                'monitor_widget'
+            ]
+        )